@@ -1,5 +1,7 @@
 from django.contrib import admin
 from models import *
+from django.utils.html import escape
+from elections.analytics import unpack_visitors
 
 
 def admin_thumbnail(self):
@@ -106,3 +108,61 @@ class VisitorAdmin(admin.ModelAdmin):
     inlines = [VisitorScoreInLine]
 admin.site.register(Visitor,VisitorAdmin)
 admin.site.register(VisitorScore,VisitorScoreAdmin)
+
+class PackedVisitorAdmin(admin.ModelAdmin):
+    model = PackedVisitor
+    list_display = ('election', 'election_url', 'datestamp')
+    exclude = ('answers', 'scores')
+    readonly_fields = ('visitor_answers', 'visitor_scores')
+
+    def visitor_answers(self, obj):
+        answers = unpack_visitors([obj])[0]['answers']
+        return u'<br/>'.join([escape(u'%s: %s (%s) - %s' % (category, question, importance, answer))
+                              for answer, question, category, importance in answers])
+    visitor_answers.allow_tags = True
+
+    def visitor_scores(self, obj):
+        scores = unpack_visitors([obj])[0]['scores']
+        return u'<br/>'.join([escape(u'%s: %s%% (%s)' % (candidate, score, u', '.join([u'%s %s%%' % category_score
+                                                                                      for category_score in category_scores])))
+                              for candidate, score, category_scores in scores])
+    visitor_scores.allow_tags = True
+admin.site.register(PackedVisitor,PackedVisitorAdmin)
+
+# Rollups may live on the analytics database (see elections.routers), so
+# their admins don't join them with elections.
+class ElectionDayRollupAdmin(admin.ModelAdmin):
+    model = ElectionDayRollup
+    list_display = ('election', 'date', 'visitors')
+    list_filter = ('date',)
+admin.site.register(ElectionDayRollup,ElectionDayRollupAdmin)
+
+class AnswerDayRollupAdmin(admin.ModelAdmin):
+    model = AnswerDayRollup
+    list_display = ('election', 'date', 'question', 'answer', 'visitors', 'importance_sum')
+    list_filter = ('date',)
+admin.site.register(AnswerDayRollup,AnswerDayRollupAdmin)
+
+class WinnerDayRollupAdmin(admin.ModelAdmin):
+    model = WinnerDayRollup
+    list_display = ('election', 'date', 'candidate', 'visitors')
+    list_filter = ('date',)
+admin.site.register(WinnerDayRollup,WinnerDayRollupAdmin)
+
+class AnalyticsRetentionAdmin(admin.ModelAdmin):
+    model = AnalyticsRetention
+    list_display = ('election', 'days', 'closed')
+    list_filter = ('closed',)
+    search_fields = ('election__name',)
+admin.site.register(AnalyticsRetention,AnalyticsRetentionAdmin)
+
+class AnalyticsSamplingAdmin(admin.ModelAdmin):
+    model = AnalyticsSampling
+    list_display = ('election', 'rate', 'rollup_rate')
+    search_fields = ('election__name',)
+admin.site.register(AnalyticsSampling,AnalyticsSamplingAdmin)
+
+class ScoreHistogramAdmin(admin.ModelAdmin):
+    model = ScoreHistogram
+    list_display = ('election', 'candidate', 'category')
+admin.site.register(ScoreHistogram,ScoreHistogramAdmin)
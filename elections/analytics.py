@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+"""
+Media naranja visitor analytics.
+
+Every finished media naranja is stored as a ``Visitor`` with its answers,
+its score for every candidate and the category scores behind them.
+``visit_record`` captures that data as plain values when the visitor gets
+their result, and ``record_visit`` stores it.
+
+``write_visits`` writes many records at once, in the format picked by
+``MEDIANARANJA_ANALYTICS_STORAGE``. As ``rows``, the default, it takes one
+INSERT per visitor and then one multi-row insert per table. As ``packed``,
+each visitor is a single ``PackedVisitor`` row of integers pointing to
+``AnalyticsText`` rows, see ``pack_visit``; ``compact_visitors`` moves
+visitors stored as rows to that format.
+
+Elections with many visitors can be sampled, see ``AnalyticsSampling``:
+``sample_visit`` decides whether a visit is stored in full, only counted in
+the rollups, or not recorded at all, and the records carry the rates they
+were sampled at so that statistics can be weighted back.
+
+With
+``MEDIANARANJA_ANALYTICS_BUFFERED`` on, records are put on the bounded queue
+of an ``AnalyticsWriter`` and written in batches by its worker thread, so
+the result page doesn't wait for the inserts. When the queue is full the
+record is written by the request itself.
+"""
+import atexit
+import base64
+import datetime
+import logging
+import random
+import struct
+import threading
+import Queue
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+
+from elections.bulk import bulk_insert, bulk_delete
+from elections.models import Visitor, VisitorAnswer, VisitorScore, CategoryScore, AnalyticsText, PackedVisitor, \
+    AnalyticsSampling, analytics_sampling_cache_key, quiz_snapshot_version, QUIZ_SNAPSHOT_TIMEOUT
+from elections.rollups import update_rollups
+
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_STORAGE = getattr(settings, 'MEDIANARANJA_ANALYTICS_STORAGE', 'rows')
+ANALYTICS_BUFFERED = getattr(settings, 'MEDIANARANJA_ANALYTICS_BUFFERED', False)
+ANALYTICS_QUEUE_SIZE = getattr(settings, 'MEDIANARANJA_ANALYTICS_QUEUE_SIZE', 10000)
+ANALYTICS_BATCH_SIZE = getattr(settings, 'MEDIANARANJA_ANALYTICS_BATCH_SIZE', 500)
+ANALYTICS_FLUSH_INTERVAL = getattr(settings, 'MEDIANARANJA_ANALYTICS_FLUSH_INTERVAL', 1.0)
+ANALYTICS_SAMPLE_RATE = getattr(settings, 'MEDIANARANJA_ANALYTICS_SAMPLE_RATE', None)
+ANALYTICS_ROLLUP_RATE = getattr(settings, 'MEDIANARANJA_ANALYTICS_ROLLUP_RATE', None)
+
+
+def visit_record(election, election_url, snapshot, answer_ids, importances, scores_and_candidates):
+    """
+    Returns what is stored about a visit to the media naranja of
+    ``election``, as plain values that don't need the database anymore.
+    """
+    answers = []
+    for i, importance in enumerate(importances):
+        question = snapshot.questions[i]
+        if answer_ids[i] is not None:
+            answer = snapshot.answer_index[answer_ids[i]][1]
+            answers.append((answer.caption, question.question, question.category.name, importance))
+        else:
+            answers.append(("", question.question, question.category.name, importance))
+
+    scores = []
+    for global_score, category_scores, candidate in scores_and_candidates:
+        scores.append((candidate.name, global_score,
+                       [(snapshot.categories[i].name, category_score)
+                        for i, category_score in enumerate(category_scores)]))
+
+    return {
+        'election_id': election.pk,
+        'election_url': election_url,
+        'datestamp': datetime.datetime.now(),
+        'answers': answers,
+        'scores': scores,
+        # Only used by the rollups, see elections.rollups.
+        'question_ids': [question.pk for question in snapshot.questions],
+        'answer_ids': list(answer_ids),
+        'winner_id': scores_and_candidates and scores_and_candidates[0][2].pk or None,
+        'candidate_ids': [candidate.pk for global_score, category_scores, candidate in scores_and_candidates],
+        'category_ids': [category.pk for category in snapshot.categories],
+    }
+
+
+def sampling_rates(election_id, version=None):
+    """
+    Returns the rate at which the visitors of the election are stored in
+    full and the one at which they are counted in the rollups, which is
+    never lower. They are cached under the quiz snapshot ``version`` of the
+    election, read from the database if not given.
+    """
+    if version is None:
+        version = quiz_snapshot_version(election_id)
+    key = analytics_sampling_cache_key(election_id, version)
+    rates = cache.get(key)
+    if rates is None:
+        rates = (1.0, 1.0)
+        for sampling in AnalyticsSampling.objects.filter(election=election_id):
+            rates = (sampling.rate, sampling.rollup_rate)
+        cache.set(key, rates, QUIZ_SNAPSHOT_TIMEOUT)
+    rate, rollup_rate = rates
+    if ANALYTICS_SAMPLE_RATE is not None:
+        rate = ANALYTICS_SAMPLE_RATE
+    if ANALYTICS_ROLLUP_RATE is not None:
+        rollup_rate = ANALYTICS_ROLLUP_RATE
+    return rate, max(rate, rollup_rate)
+
+
+def sample_visit(election_id, draw=random.random, version=None):
+    """
+    Decides how a visit to the media naranja of the election is recorded.
+    Returns None when it isn't, otherwise the values to add to its
+    ``visit_record``: ``stored``, false when it is only counted in the
+    rollups, and the ``sample_rate`` and ``rollup_rate`` it was sampled at.
+    """
+    rate, rollup_rate = sampling_rates(election_id, version)
+    value = draw()
+    if value >= rollup_rate:
+        return None
+    return {'stored': value < rate, 'sample_rate': rate, 'rollup_rate': rollup_rate}
+
+
+def write_visits(records, using=None):
+    """
+    Stores ``records`` and counts them in the daily rollups, in one
+    transaction. Records sampled only for the rollups aren't stored.
+    """
+    if not records:
+        return
+    if using is None:
+        using = router.db_for_write(Visitor)
+    stored = [record for record in records if record.get('stored', True)]
+    with transaction.commit_on_success(using=using):
+        if ANALYTICS_STORAGE == 'packed':
+            insert_packed_visits(stored, using)
+        else:
+            insert_visit_rows(stored, using)
+        update_rollups(records, using)
+
+
+def write_visit_rows(records, using=None):
+    """
+    Stores ``records`` as ``Visitor``, ``VisitorAnswer``, ``VisitorScore`` and
+    ``CategoryScore`` rows.
+    """
+    if using is None:
+        using = router.db_for_write(Visitor)
+    with transaction.commit_on_success(using=using):
+        insert_visit_rows(records, using)
+
+
+def insert_visit_rows(records, using):
+    visitors = []
+    visitor_answers = []
+    visitor_scores = []
+    for record in records:
+        visitor = Visitor(election_id=record['election_id'], election_url=record['election_url'],
+                          datestamp=record['datestamp'], sample_rate=record.get('sample_rate', 1.0))
+        # A raw save keeps the datestamp of the visit instead of auto_now.
+        visitor.save_base(raw=True, using=using)
+        visitors.append(visitor)
+        for answer_text, question_text, category_text, importance in record['answers']:
+            visitor_answers.append(VisitorAnswer(visitor_id=visitor.pk, answer_text=answer_text,
+                                                 question_text=question_text,
+                                                 question_category_text=category_text,
+                                                 answer_importance=importance))
+        for candidate_name, score, category_scores in record['scores']:
+            visitor_scores.append(VisitorScore(visitor_id=visitor.pk, candidate_name=candidate_name, score=score))
+    bulk_insert(VisitorAnswer, visitor_answers, using=using)
+    bulk_insert(VisitorScore, visitor_scores, using=using)
+
+    # Rows of a multi-row insert get increasing ids, so reading them back
+    # in id order pairs every visitor score with its category scores.
+    visitor_score_ids = {}
+    saved = VisitorScore.objects.using(using).filter(visitor__in=[visitor.pk for visitor in visitors])
+    for pk, visitor_id in saved.order_by('visitor', 'pk').values_list('pk', 'visitor'):
+        visitor_score_ids.setdefault(visitor_id, []).append(pk)
+    category_scores = []
+    for visitor, record in zip(visitors, records):
+        for visitor_score_id, score in zip(visitor_score_ids.get(visitor.pk, []), record['scores']):
+            for category_name, category_score in score[2]:
+                category_scores.append(CategoryScore(visitor_score_id=visitor_score_id,
+                                                     category_name=category_name,
+                                                     category_score=category_score))
+    bulk_insert(CategoryScore, category_scores, using=using)
+
+
+# Packed visitors are sequences of 32 bit integers, stored in base64 since
+# text columns are all this version of Django offers for binary data.
+
+def pack_integers(values):
+    return base64.b64encode(struct.pack('<%di' % len(values), *values))
+
+
+def unpack_integers(data):
+    packed = base64.b64decode(data)
+    return list(struct.unpack('<%di' % (len(packed) // 4), packed))
+
+
+# Bound for the number of parameters of an IN clause; SQLite accepts 999.
+TEXT_LOOKUP_SIZE = 500
+
+
+def get_text_ids(texts, using=None):
+    """
+    Returns a dict mapping each of ``texts`` to its ``AnalyticsText`` id,
+    creating the texts seen for the first time.
+    """
+    if using is None:
+        using = router.db_for_write(AnalyticsText)
+    texts = list(set(texts))
+    text_ids = {}
+    for start in range(0, len(texts), TEXT_LOOKUP_SIZE):
+        found = AnalyticsText.objects.using(using).filter(text__in=texts[start:start + TEXT_LOOKUP_SIZE])
+        text_ids.update(found.values_list('text', 'pk'))
+    for text in texts:
+        if text not in text_ids:
+            text_ids[text] = AnalyticsText.objects.using(using).get_or_create(text=text)[0].pk
+    return text_ids
+
+
+def get_texts(text_ids, using=None):
+    """
+    Returns a dict mapping each of ``text_ids`` to its text.
+    """
+    if using is None:
+        using = router.db_for_read(AnalyticsText)
+    text_ids = list(set(text_ids))
+    texts = {}
+    for start in range(0, len(text_ids), TEXT_LOOKUP_SIZE):
+        found = AnalyticsText.objects.using(using).filter(pk__in=text_ids[start:start + TEXT_LOOKUP_SIZE])
+        texts.update(found.values_list('pk', 'text'))
+    return texts
+
+
+def record_texts(record):
+    texts = []
+    for answer_text, question_text, category_text, importance in record['answers']:
+        texts.extend([answer_text, question_text, category_text])
+    for candidate_name, score, category_scores in record['scores']:
+        texts.append(candidate_name)
+        texts.extend([category_name for category_name, category_score in category_scores])
+    return texts
+
+
+def pack_visit(record, text_ids):
+    """
+    Packs the answers and scores of ``record`` as two strings.
+
+    Answers are four integers each: the ids of the answer, question and
+    category texts and the importance. Every score is the id of the
+    candidate name, the score and the number of category scores, followed
+    by the id of the category name and the score of each category.
+    """
+    answers = []
+    for answer_text, question_text, category_text, importance in record['answers']:
+        answers.extend([text_ids[answer_text], text_ids[question_text], text_ids[category_text], importance])
+    scores = []
+    for candidate_name, score, category_scores in record['scores']:
+        scores.extend([text_ids[candidate_name], int(score), len(category_scores)])
+        for category_name, category_score in category_scores:
+            scores.extend([text_ids[category_name], int(category_score)])
+    return pack_integers(answers), pack_integers(scores)
+
+
+def unpack_visit(packed_answers, packed_scores, texts):
+    """
+    Returns the answers and scores packed by ``pack_visit``, with the texts
+    looked up in ``texts``.
+    """
+    values = unpack_integers(packed_answers)
+    answers = []
+    for i in range(0, len(values), 4):
+        answers.append((texts[values[i]], texts[values[i + 1]], texts[values[i + 2]], values[i + 3]))
+    values = unpack_integers(packed_scores)
+    scores = []
+    i = 0
+    while i < len(values):
+        candidate_name, score, count = texts[values[i]], values[i + 1], values[i + 2]
+        i += 3
+        category_scores = []
+        for j in range(count):
+            category_scores.append((texts[values[i]], values[i + 1]))
+            i += 2
+        scores.append((candidate_name, score, category_scores))
+    return answers, scores
+
+
+def unpack_visitors(packed_visitors, using=None):
+    """
+    Returns the records of ``packed_visitors``, looking up all their texts
+    with one query per ``TEXT_LOOKUP_SIZE`` texts.
+    """
+    packed_visitors = list(packed_visitors)
+    text_ids = []
+    for packed_visitor in packed_visitors:
+        values = unpack_integers(packed_visitor.answers)
+        for i in range(0, len(values), 4):
+            text_ids.extend(values[i:i + 3])
+        values = unpack_integers(packed_visitor.scores)
+        i = 0
+        while i < len(values):
+            text_ids.append(values[i])
+            count = values[i + 2]
+            text_ids.extend(values[i + 3:i + 3 + 2 * count:2])
+            i += 3 + 2 * count
+    texts = get_texts(text_ids, using)
+
+    records = []
+    for packed_visitor in packed_visitors:
+        answers, scores = unpack_visit(packed_visitor.answers, packed_visitor.scores, texts)
+        records.append({
+            'election_id': packed_visitor.election_id,
+            'election_url': packed_visitor.election_url,
+            'datestamp': packed_visitor.datestamp,
+            'sample_rate': packed_visitor.sample_rate,
+            'answers': answers,
+            'scores': scores,
+        })
+    return records
+
+
+def write_packed_visits(records, using=None):
+    """
+    Stores ``records`` as ``PackedVisitor`` rows.
+    """
+    if using is None:
+        using = router.db_for_write(PackedVisitor)
+    with transaction.commit_on_success(using=using):
+        insert_packed_visits(records, using)
+
+
+def insert_packed_visits(records, using):
+    # Nested commit_on_success blocks commit when they exit, so callers that
+    # need a wider transaction use this directly.
+    texts = []
+    for record in records:
+        texts.extend(record_texts(record))
+    text_ids = get_text_ids(texts, using)
+    packed_visitors = []
+    for record in records:
+        answers, scores = pack_visit(record, text_ids)
+        packed_visitors.append(PackedVisitor(election_id=record['election_id'],
+                                             election_url=record['election_url'],
+                                             datestamp=record['datestamp'],
+                                             sample_rate=record.get('sample_rate', 1.0),
+                                             answers=answers, scores=scores))
+    bulk_insert(PackedVisitor, packed_visitors, using=using)
+
+
+def visitor_records(visitor_ids, using=None):
+    """
+    Reads the visitors stored as rows with ids ``visitor_ids`` back as
+    records, in id order.
+    """
+    if using is None:
+        using = router.db_for_read(Visitor)
+    visitors = Visitor.objects.using(using).filter(pk__in=visitor_ids).order_by('pk')
+    records = {}
+    for pk, election_id, election_url, datestamp, sample_rate in visitors.values_list(
+            'pk', 'election', 'election_url', 'datestamp', 'sample_rate'):
+        records[pk] = {'election_id': election_id, 'election_url': election_url, 'datestamp': datestamp,
+                       'sample_rate': sample_rate, 'answers': [], 'scores': []}
+    answers = VisitorAnswer.objects.using(using).filter(visitor__in=visitor_ids).order_by('pk')
+    for visitor_id, answer_text, question_text, category_text, importance in answers.values_list(
+            'visitor', 'answer_text', 'question_text', 'question_category_text', 'answer_importance'):
+        records[visitor_id]['answers'].append((answer_text, question_text, category_text, importance))
+    category_scores = {}
+    scores = CategoryScore.objects.using(using).filter(visitor_score__visitor__in=visitor_ids).order_by('pk')
+    for visitor_score_id, category_name, category_score in scores.values_list(
+            'visitor_score', 'category_name', 'category_score'):
+        category_scores.setdefault(visitor_score_id, []).append((category_name, category_score))
+    scores = VisitorScore.objects.using(using).filter(visitor__in=visitor_ids).order_by('pk')
+    for pk, visitor_id, candidate_name, score in scores.values_list('pk', 'visitor', 'candidate_name', 'score'):
+        records[visitor_id]['scores'].append((candidate_name, score, category_scores.get(pk, [])))
+    return [records[pk] for pk in sorted(records)]
+
+
+def compact_visitors(visitor_ids, using=None):
+    """
+    Moves the visitors with ids ``visitor_ids`` from rows to packed visitors,
+    in one transaction.
+    """
+    if using is None:
+        using = router.db_for_write(Visitor)
+    with transaction.commit_on_success(using=using):
+        insert_packed_visits(visitor_records(visitor_ids, using), using)
+        delete_visitor_rows(visitor_ids, using)
+
+
+def delete_visitors(visitor_ids, using=None):
+    """
+    Deletes the visitors stored as rows with ids ``visitor_ids``, with their
+    answers and scores, in one transaction.
+    """
+    if using is None:
+        using = router.db_for_write(Visitor)
+    with transaction.commit_on_success(using=using):
+        delete_visitor_rows(visitor_ids, using)
+
+
+def delete_visitor_rows(visitor_ids, using):
+    # A few DELETE statements per table instead of the row by row cascade of
+    # QuerySet.delete, which loads every visitor, answer and score first.
+    visitor_score_ids = list(VisitorScore.objects.using(using).filter(visitor__in=visitor_ids)
+                             .values_list('pk', flat=True))
+    bulk_delete(CategoryScore, visitor_score_ids, field='visitor_score', using=using)
+    bulk_delete(VisitorScore, visitor_score_ids, using=using)
+    bulk_delete(VisitorAnswer, visitor_ids, field='visitor', using=using)
+    bulk_delete(Visitor, visitor_ids, using=using)
+
+
+class AnalyticsWriter(object):
+    """
+    Writes records in batches from a background thread.
+
+    ``submit`` puts a record on a queue of at most ``max_size`` records and
+    returns. The worker takes up to ``batch_size`` records at a time and
+    hands them to ``write``; it waits at most ``flush_interval`` seconds for
+    more records before checking whether it was stopped. ``stop`` writes
+    everything still queued and is registered to run at exit.
+    """
+    def __init__(self, write=write_visits, max_size=ANALYTICS_QUEUE_SIZE,
+                 batch_size=ANALYTICS_BATCH_SIZE, flush_interval=ANALYTICS_FLUSH_INTERVAL):
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = Queue.Queue(max_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = False
+        self.registered = False
+
+    def start(self):
+        self.lock.acquire()
+        try:
+            # Threads don't survive a fork, so a worker process started from a
+            # preloaded application gets its own thread here.
+            if self.thread is None or not self.thread.isAlive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self.run, name='medianaranja-analytics')
+                self.thread.setDaemon(True)
+                self.thread.start()
+                if not self.registered:
+                    atexit.register(self.stop)
+                    self.registered = True
+        finally:
+            self.lock.release()
+
+    def submit(self, record):
+        if self.thread is None or not self.thread.isAlive():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.write_batch([record])
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except Queue.Empty:
+                if self.stopping:
+                    return
+                continue
+            batch = []
+            stop = record is None
+            if not stop:
+                batch.append(record)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+            try:
+                if not self.write_batch(batch):
+                    # Start the next batch with a fresh connection.
+                    for connection in connections.all():
+                        connection.close()
+            finally:
+                for i in range(len(batch) + (stop and 1 or 0)):
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def write_batch(self, batch):
+        """
+        Writes ``batch``, logging any error instead of raising it. Returns
+        whether the batch was written.
+        """
+        if not batch:
+            return True
+        try:
+            self.write(batch)
+        except Exception:
+            logger.exception('Could not write %d media naranja visits', len(batch))
+            return False
+        return True
+
+    def flush(self):
+        """
+        Blocks until every submitted record has been written.
+        """
+        if self.thread is not None and self.thread.isAlive():
+            self.queue.join()
+
+    def stop(self):
+        """
+        Writes the queued records and stops the worker.
+        """
+        if self.thread is not None and self.thread.isAlive():
+            self.stopping = True
+            self.queue.put(None)
+            self.thread.join()
+
+
+writer = AnalyticsWriter()
+
+
+def record_visit(record):
+    """
+    Stores a ``visit_record``, in the background when analytics writes are
+    buffered.
+    """
+    if ANALYTICS_BUFFERED:
+        writer.submit(record)
+    else:
+        write_visits([record])
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Imports of the candidates' answers from a spreadsheet.
+
+The answer matrix of an election is a CSV file with a header line, whose
+first cell is ignored and whose other cells are questions of the election,
+and one line per candidate: the candidate's name, then the caption of the
+answer the candidate chose for the question of every column, or nothing.
+Names, questions and captions are compared without case or surrounding
+spaces.
+
+``import_answer_matrix`` resolves all of it against the candidates,
+questions and answers of the election, read once, and replaces the answers
+of the candidates to the questions of the matrix in one transaction: one
+delete and one insert for all of them. A matrix with any problem, listed
+in the report, changes nothing.
+"""
+from django.db import router, transaction
+
+from elections.bulk import bulk_insert, bulk_delete
+from elections.models import Candidate, Question, Answer, invalidate_quiz_snapshot
+
+
+def decode(value):
+    if isinstance(value, unicode):
+        return value
+    return value.decode('utf-8')
+
+
+def normalize(value):
+    return u' '.join(value.split()).lower()
+
+
+def read_answer_matrix(election, lines):
+    """
+    Resolves the answer matrix ``lines`` against ``election``. Returns the
+    answer ids chosen by every candidate id, the ids of the questions of
+    the matrix and the list of problems found.
+    """
+    errors = []
+    lines = iter(lines)
+    try:
+        header = [decode(cell) for cell in next(lines)]
+    except StopIteration:
+        return {}, [], [u'The file is empty']
+    except UnicodeDecodeError:
+        return {}, [], [u'Line 1: the text is not UTF-8']
+    # Spreadsheets often save UTF-8 with a byte order mark.
+    if header and header[0].startswith(u'\ufeff'):
+        header[0] = header[0][1:]
+
+    questions = {}
+    for question in Question.objects.filter(category__election=election):
+        questions.setdefault(normalize(question.question), []).append(question)
+    answers = {}
+    for answer_id, question_id, caption in Answer.objects.filter(question__category__election=election)\
+            .values_list('pk', 'question', 'caption'):
+        answers.setdefault((question_id, normalize(caption)), answer_id)
+    candidates = {}
+    for pk, name in Candidate.objects.filter(election=election).values_list('pk', 'name'):
+        candidates.setdefault(normalize(name), []).append(pk)
+
+    columns = []
+    for column, text in enumerate(header[1:]):
+        same_text = questions.get(normalize(text), [])
+        if not same_text:
+            errors.append(u'Line 1, column %d: %s is not a question of the election' % (column + 2, text))
+            columns.append(None)
+        elif len(same_text) > 1:
+            errors.append(u'Line 1, column %d: there are %d questions %s' % (column + 2, len(same_text), text))
+            columns.append(None)
+        elif same_text[0].pk in columns:
+            errors.append(u'Line 1, column %d: %s is repeated' % (column + 2, text))
+            columns.append(None)
+        else:
+            columns.append(same_text[0].pk)
+
+    chosen = {}
+    for number, line in enumerate(lines):
+        number += 2
+        try:
+            line = [decode(cell) for cell in line]
+        except UnicodeDecodeError:
+            errors.append(u'Line %d: the text is not UTF-8' % number)
+            continue
+        if not u''.join(line).strip():
+            continue
+        same_name = candidates.get(normalize(line[0]), [])
+        if not same_name:
+            errors.append(u'Line %d: %s is not a candidate of the election' % (number, line[0]))
+            continue
+        if len(same_name) > 1:
+            errors.append(u'Line %d: there are %d candidates %s' % (number, len(same_name), line[0]))
+            continue
+        candidate_id = same_name[0]
+        if candidate_id in chosen:
+            errors.append(u'Line %d: %s is repeated' % (number, line[0]))
+            continue
+        if len(line) > len(header):
+            errors.append(u'Line %d: %d cells, but only %d columns' % (number, len(line), len(header)))
+        chosen[candidate_id] = []
+        for column, caption in enumerate(line[1:len(header)]):
+            question_id = columns[column]
+            if question_id is None or not caption.strip():
+                continue
+            answer_id = answers.get((question_id, normalize(caption)))
+            if answer_id is None:
+                errors.append(u'Line %d, column %d: %s is not an answer to %s' % (number, column + 2,
+                              caption, header[column + 1]))
+            else:
+                chosen[candidate_id].append(answer_id)
+    return chosen, [question_id for question_id in columns if question_id is not None], errors
+
+
+def import_answer_matrix(election, lines, dry_run=False):
+    """
+    Imports the answer matrix ``lines`` of ``election``, unless it has
+    problems or ``dry_run`` is set. Returns a report, a dict with the
+    ``candidates`` and ``questions`` of the matrix, the number of
+    ``answers`` chosen in it and the ``errors`` found.
+
+    Candidates in the matrix lose the answers they had to its questions and
+    are marked as having answered if they chose any.
+    """
+    chosen, question_ids, errors = read_answer_matrix(election, lines)
+    report = {
+        'candidates': len(chosen),
+        'questions': len(question_ids),
+        'answers': sum([len(answer_ids) for answer_ids in chosen.values()]),
+        'errors': errors,
+    }
+    if errors or dry_run or not chosen:
+        return report
+
+    through = Candidate.answers.through
+    using = router.db_for_write(through)
+    with transaction.commit_on_success(using=using):
+        old_links = through.objects.using(using).filter(candidate__in=list(chosen),
+                                                        answer__question__in=question_ids)
+        bulk_delete(through, old_links.values_list('pk', flat=True), using=using)
+        bulk_insert(through, [through(candidate_id=candidate_id, answer_id=answer_id)
+                              for candidate_id, answer_ids in chosen.items() for answer_id in answer_ids],
+                    using=using)
+        answered = [candidate_id for candidate_id, answer_ids in chosen.items() if answer_ids]
+        if answered:
+            Candidate.objects.using(using).filter(pk__in=answered).update(has_answered=True)
+    # The links were written without the m2m_changed the snapshot listens to.
+    invalidate_quiz_snapshot(election.pk)
+    return report
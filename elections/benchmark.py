@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Media naranja benchmarks.
+
+``build_synthetic_election`` fills an election with generated candidates,
+categories, questions and answers, and ``run_benchmark`` times the media
+naranja code paths against it. Every measurement records the wall time, the
+number of SQL queries and the peak resident memory of the process, and the
+whole run is returned as a plain dict ready to be dumped as JSON.
+
+The ``benchmark_medianaranja`` management command runs this against a
+throwaway test database, and ``elections.tests.benchmark`` runs it on small
+elections as part of the test suite.
+"""
+import gc
+import platform
+import random
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test.client import RequestFactory
+
+from elections.models import Election, Candidate, Category, Question, Answer, invalidate_quiz_snapshot
+from elections.snapshot import get_quiz_snapshot
+from elections.views.medianaranja_views import get_medianaranja1, post_medianaranja1, medianaranja2
+
+
+def build_synthetic_election(owner, candidates=10, categories=5, questions=4, answers=3, seed=0, name=None):
+    """
+    Creates an election with ``categories`` categories of ``questions``
+    questions each, ``answers`` answers per question and ``candidates``
+    candidates who picked one random answer for every question.
+    """
+    generator = random.Random(seed)
+    if name is None:
+        name = 'Benchmark %d-%d-%d-%d' % (candidates, categories, questions, answers)
+    election = Election.objects.create(name=name, owner=owner, published=True,
+                                       description='Synthetic election for benchmarks')
+    election.category_set.all().delete()
+
+    election_answers = []
+    for i in range(categories):
+        category = Category.objects.create(name='Category %d' % i, election=election, order=i)
+        for j in range(questions):
+            question = Question.objects.create(question='Question %d.%d' % (i, j), category=category)
+            election_answers.append([Answer.objects.create(question=question, caption='Answer %d' % k)
+                                     for k in range(answers)])
+
+    for i in range(candidates):
+        candidate = Candidate.objects.create(name='Candidate %d' % i, election=election)
+        picked = [generator.choice(question_answers) for question_answers in election_answers if question_answers]
+        if picked:
+            candidate.answers.add(*picked)
+    return election
+
+
+def synthetic_visitor(snapshot, seed=0):
+    """
+    Returns random answer ids and importances for ``snapshot``, in form order.
+    """
+    generator = random.Random(seed)
+    answer_ids = []
+    importances = []
+    for question_answers in snapshot.answers:
+        if question_answers:
+            answer_ids.append(generator.choice(question_answers).pk)
+        else:
+            answer_ids.append(None)
+        importances.append(generator.randint(1, 5))
+    return answer_ids, importances
+
+
+def peak_memory():
+    """
+    Peak resident set size of the process, in kilobytes, or None where the
+    resource module is not available.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(function, repeat=5, setup=None):
+    """
+    Calls ``function`` ``repeat`` times and returns its timings, the number of
+    queries of the last call and the peak memory of the process after the
+    calls. ``setup`` runs before every call, outside of the measurements.
+    """
+    timings = []
+    queries = 0
+    use_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    try:
+        for i in range(repeat):
+            if setup is not None:
+                setup()
+            gc.collect()
+            start_queries = len(connection.queries)
+            start = time.time()
+            function()
+            timings.append(time.time() - start)
+            queries = len(connection.queries) - start_queries
+    finally:
+        connection.use_debug_cursor = use_debug_cursor
+    return {
+        'runs': repeat,
+        'wall_time': {'min': min(timings), 'mean': sum(timings) / len(timings), 'max': max(timings)},
+        'queries': queries,
+        'peak_memory_kb': peak_memory(),
+    }
+
+
+def run_benchmark(election, repeat=5, seed=0):
+    """
+    Benchmarks the media naranja of ``election`` and returns the report.
+
+    ``get_medianaranja1``, ``post_medianaranja1`` and ``medianaranja2`` are
+    measured with a cold quiz snapshot (invalidated before every call) and
+    with a warm one. ``Candidate.get_score`` is measured scoring every
+    candidate of the election, as the media naranja did before the snapshot.
+    """
+    factory = RequestFactory()
+    username = election.owner.username
+    snapshot = get_quiz_snapshot(election)
+    answer_ids, importances = synthetic_visitor(snapshot, seed)
+
+    data = {}
+    for i, question in enumerate(snapshot.questions):
+        data['question-id-%d' % i] = question.pk
+        data['question-%d' % i] = answer_ids[i] if answer_ids[i] is not None else -1
+        data['importance-%d' % i] = importances[i]
+
+    def invalidate():
+        invalidate_quiz_snapshot(election.pk)
+
+    def call_get_medianaranja1():
+        get_medianaranja1(factory.get('/'), username, election.slug)
+
+    def call_post_medianaranja1():
+        post_medianaranja1(factory.post('/', data), username, election.slug)
+
+    def call_medianaranja2():
+        medianaranja2(factory.post('/'), answer_ids, importances, get_quiz_snapshot(election), election)
+
+    answers = [[snapshot.answer_index[answer_id][1]] if answer_id is not None else [] for answer_id in answer_ids]
+    candidates = list(election.candidate_set.all())
+
+    def call_get_score():
+        for candidate in candidates:
+            candidate.get_score(answers, importances)
+
+    results = []
+    for name, function in (('get_medianaranja1', call_get_medianaranja1),
+                           ('post_medianaranja1', call_post_medianaranja1),
+                           ('medianaranja2', call_medianaranja2)):
+        result = measure(function, repeat, setup=invalidate)
+        result.update({'name': name, 'snapshot': 'cold'})
+        results.append(result)
+        function()
+        result = measure(function, repeat)
+        result.update({'name': name, 'snapshot': 'warm'})
+        results.append(result)
+    result = measure(call_get_score, repeat)
+    result.update({'name': 'Candidate.get_score', 'snapshot': None})
+    results.append(result)
+
+    return {
+        'election': {
+            'candidates': len(snapshot.candidates),
+            'categories': len(snapshot.categories),
+            'questions': len(snapshot.questions),
+            'answers': sum([len(question_answers) for question_answers in snapshot.answers]),
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+        },
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk reads and writes.
+
+This version of Django saves model instances one INSERT at a time. ``bulk_insert``
+writes a whole list of unsaved instances with a single ``executemany`` on
+the database cursor, which is what the analytics writer and the loaders need
+when they store hundreds of rows at once. Rows written this way don't send
+``pre_save``/``post_save`` signals and the instances don't get their primary
+keys back. ``bulk_delete`` is its counterpart, deleting rows by key without
+loading them or cascading to the rows that point to them.
+
+``keyset_chunks`` walks a big table in primary key order a chunk of ids at a
+time, without the growing OFFSET of sliced querysets.
+
+``close_connections`` is called around forking the worker processes of the
+loaders, which can't share the connections of their parent.
+"""
+from django.db import connections, router, transaction
+from django.db.models import AutoField
+from django.db.models.sql import DeleteQuery
+
+
+def bulk_insert(model, instances, using=None):
+    """
+    Inserts ``instances`` of ``model`` in one statement. Field values are
+    prepared as ``Model.save`` would, so ``auto_now`` and ``auto_now_add``
+    fields are filled in.
+    """
+    instances = list(instances)
+    if not instances:
+        return
+    if using is None:
+        using = router.db_for_write(model)
+    connection = connections[using]
+    opts = model._meta
+    fields = [field for field in opts.local_fields if not isinstance(field, AutoField)]
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(opts.db_table),
+        ', '.join([quote_name(field.column) for field in fields]),
+        ', '.join(['%s'] * len(fields)))
+    rows = []
+    for instance in instances:
+        rows.append([field.get_db_prep_save(field.pre_save(instance, True), connection=connection)
+                     for field in fields])
+    cursor = connection.cursor()
+    cursor.executemany(sql, rows)
+    transaction.set_dirty(using=using)
+
+
+def bulk_delete(model, values, field=None, using=None):
+    """
+    Deletes the rows of ``model`` whose ``field``, the primary key by
+    default, is in ``values``, a hundred values per statement. Rows
+    pointing to them must be deleted first.
+    """
+    values = list(values)
+    if not values:
+        return
+    if using is None:
+        using = router.db_for_write(model)
+    if field is None:
+        field = model._meta.pk
+    else:
+        field = model._meta.get_field(field)
+    DeleteQuery(model).delete_batch(values, using, field=field)
+    transaction.set_dirty(using=using)
+
+
+def keyset_chunks(queryset, chunk_size):
+    """
+    Yields the primary keys of ``queryset`` in ascending order, in lists of
+    at most ``chunk_size``. Each chunk is read with ``pk > last pk``, so rows
+    deleted between chunks don't make it skip others.
+    """
+    last_pk = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def close_connections():
+    """
+    Closes the database connections, so that the next query opens a new one.
+    An in-memory SQLite database only lives in its connection, so it is
+    kept: a forked process works on its own copy.
+    """
+    for connection in connections.all():
+        if connection.settings_dict['ENGINE'].endswith('sqlite3') and \
+                connection.settings_dict['NAME'] in ('', ':memory:'):
+            continue
+        connection.close()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Election bundles: a whole election in one versioned JSON file, to move it
+between instances.
+
+A bundle has the election, its categories, questions and answers, personal
+data labels, background categories and backgrounds, and its candidates with
+their personal data, backgrounds, links and answers. Rows refer to each
+other by the ids they had where the bundle was made. ``election_bundle``
+reads all of it with one query per table, whatever the size of the
+election.
+
+``import_election_bundle`` writes a bundle as a new election of another
+owner, in one transaction, with one insert per table. Ids are remapped by
+reading the new rows back in insertion order. The election is inserted
+without its ``post_save``, so it doesn't get the default questionnaire,
+personal data and backgrounds first.
+
+Photos and logos travel as paths under ``MEDIA_ROOT``: the files are not in
+the bundle.
+"""
+import gzip
+
+from django.db import router, transaction
+from django.utils import simplejson as json
+
+from elections.bulk import bulk_insert
+from elections.models import Election, Candidate, Category, Question, Answer, PersonalData, PersonalDataCandidate,\
+    BackgroundCategory, Background, BackgroundCandidate, Link, invalidate_quiz_snapshot
+
+
+BUNDLE_FORMAT = 'candidator-election'
+BUNDLE_VERSION = 1
+
+ELECTION_FIELDS = ('name', 'slug', 'description', 'information_source', 'date', 'published', 'custom_style',
+                   'highlighted', 'use_default_media_naranja_option')
+
+
+def election_bundle(election):
+    """
+    Returns the JSON-ready bundle of ``election``. It takes eleven queries.
+    """
+    fields = dict((name, getattr(election, name)) for name in ELECTION_FIELDS)
+    fields['logo'] = election.logo.name or None
+
+    questions = {}
+    for pk, category_id, question in Question.objects.filter(category__election=election).order_by('pk')\
+            .values_list('pk', 'category', 'question'):
+        questions.setdefault(category_id, []).append({'id': pk, 'question': question, 'answers': []})
+    answers = {}
+    for pk, question_id, caption in Answer.objects.filter(question__category__election=election).order_by('pk')\
+            .values_list('pk', 'question', 'caption'):
+        answers.setdefault(question_id, []).append({'id': pk, 'caption': caption})
+    categories = []
+    for pk, name, slug, order in Category.objects.filter(election=election).order_by('pk')\
+            .values_list('pk', 'name', 'slug', 'order'):
+        category_questions = questions.get(pk, [])
+        for question in category_questions:
+            question['answers'] = answers.get(question['id'], [])
+        categories.append({'id': pk, 'name': name, 'slug': slug, 'order': order, 'questions': category_questions})
+
+    backgrounds = {}
+    for pk, category_id, name in Background.objects.filter(category__election=election).order_by('pk')\
+            .values_list('pk', 'category', 'name'):
+        backgrounds.setdefault(category_id, []).append({'id': pk, 'name': name})
+    background_categories = [{'id': pk, 'name': name, 'backgrounds': backgrounds.get(pk, [])}
+                             for pk, name in BackgroundCategory.objects.filter(election=election).order_by('pk')
+                             .values_list('pk', 'name')]
+
+    def by_candidate(queryset, *fields):
+        values = {}
+        for row in queryset.filter(candidate__election=election).order_by('pk').values_list('candidate', *fields):
+            values.setdefault(row[0], []).append(list(row[1:]))
+        return values
+    personal_data_values = by_candidate(PersonalDataCandidate.objects, 'personal_data', 'value')
+    background_values = by_candidate(BackgroundCandidate.objects, 'background', 'value')
+    links = by_candidate(Link.objects, 'name', 'url')
+    candidate_answers = by_candidate(Candidate.answers.through.objects, 'answer')
+    candidates = []
+    for pk, name, slug, photo, has_answered in Candidate.objects.filter(election=election).order_by('pk')\
+            .values_list('pk', 'name', 'slug', 'photo', 'has_answered'):
+        candidates.append({
+            'name': name,
+            'slug': slug,
+            'photo': photo or None,
+            'has_answered': has_answered,
+            'personal_data': personal_data_values.get(pk, []),
+            'backgrounds': background_values.get(pk, []),
+            'links': links.get(pk, []),
+            'answers': [answer_id for (answer_id,) in candidate_answers.get(pk, [])],
+        })
+
+    return {
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'election': fields,
+        'categories': categories,
+        'personal_data': [{'id': pk, 'label': label} for pk, label in
+                          PersonalData.objects.filter(election=election).order_by('pk').values_list('pk', 'label')],
+        'background_categories': background_categories,
+        'candidates': candidates,
+    }
+
+
+def open_bundle(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def write_election_bundle(election, path):
+    """
+    Writes the bundle of ``election`` to the file at ``path``, gzipped if
+    its name ends in ``.gz``.
+    """
+    output = open_bundle(path, 'wb')
+    try:
+        json.dump(election_bundle(election), output, separators=(',', ':'))
+    finally:
+        output.close()
+
+
+def read_election_bundle(path):
+    bundle_file = open_bundle(path, 'rb')
+    try:
+        return json.load(bundle_file)
+    finally:
+        bundle_file.close()
+
+
+def insert_and_map(model, rows, queryset, using):
+    """
+    Inserts the ``(bundle id, instance)`` pairs of ``rows`` and returns the
+    new id of every bundle id, reading back ``queryset``, which must hold
+    just the new rows, in insertion order.
+    """
+    bulk_insert(model, [instance for bundle_id, instance in rows], using=using)
+    new_ids = list(queryset.using(using).order_by('pk').values_list('pk', flat=True))
+    return dict(zip([bundle_id for bundle_id, instance in rows], new_ids))
+
+
+def import_election_bundle(bundle, owner, slug=None):
+    """
+    Creates a new election of ``owner`` from ``bundle``, with the slug of
+    the bundle or ``slug``, and returns it. Raises ``ValueError`` when the
+    bundle isn't one or is of a newer version, or when ``owner`` already has
+    an election with that slug.
+    """
+    if bundle.get('format') != BUNDLE_FORMAT:
+        raise ValueError('Not an election bundle')
+    if bundle.get('version', 0) > BUNDLE_VERSION:
+        raise ValueError('Election bundle version %s is newer than %d' % (bundle.get('version'), BUNDLE_VERSION))
+    fields = dict((str(name), value) for name, value in bundle['election'].items())
+    fields['logo'] = fields.get('logo') or ''
+    if slug is not None:
+        fields['slug'] = slug
+    if Election.objects.filter(owner=owner, slug=fields['slug']).exists():
+        raise ValueError('%s already has an election %s' % (owner.username, fields['slug']))
+
+    using = router.db_for_write(Election)
+    with transaction.commit_on_success(using=using):
+        bulk_insert(Election, [Election(owner_id=owner.pk, **fields)], using=using)
+        election = Election.objects.using(using).get(owner=owner, slug=fields['slug'])
+
+        categories = insert_and_map(Category, [(category['id'], Category(election_id=election.pk,
+            name=category['name'], slug=category['slug'], order=category['order']))
+            for category in bundle['categories']], Category.objects.filter(election=election), using)
+        question_rows = []
+        answer_rows = []
+        for category in bundle['categories']:
+            for question in category['questions']:
+                question_rows.append((question['id'], Question(category_id=categories[category['id']],
+                                                               question=question['question'])))
+                answer_rows.extend([(answer['id'], question['id'], answer['caption']) for answer in question['answers']])
+        questions = insert_and_map(Question, question_rows, Question.objects.filter(category__election=election),
+                                   using)
+        answers = insert_and_map(Answer, [(answer_id, Answer(question_id=questions[question_id], caption=caption))
+                                          for answer_id, question_id, caption in answer_rows],
+                                 Answer.objects.filter(question__category__election=election), using)
+
+        personal_data = insert_and_map(PersonalData, [(row['id'], PersonalData(election_id=election.pk,
+            label=row['label'])) for row in bundle['personal_data']],
+            PersonalData.objects.filter(election=election), using)
+        background_categories = insert_and_map(BackgroundCategory, [(row['id'], BackgroundCategory(
+            election_id=election.pk, name=row['name'])) for row in bundle['background_categories']],
+            BackgroundCategory.objects.filter(election=election), using)
+        backgrounds = insert_and_map(Background, [(background['id'], Background(
+            category_id=background_categories[row['id']], name=background['name']))
+            for row in bundle['background_categories'] for background in row['backgrounds']],
+            Background.objects.filter(category__election=election), using)
+
+        candidates = insert_and_map(Candidate, [(position, Candidate(election_id=election.pk, name=row['name'],
+            slug=row['slug'], photo=row['photo'] or '', has_answered=row['has_answered']))
+            for position, row in enumerate(bundle['candidates'])], Candidate.objects.filter(election=election), using)
+        personal_data_values = []
+        background_values = []
+        links = []
+        candidate_answers = []
+        for position, row in enumerate(bundle['candidates']):
+            candidate_id = candidates[position]
+            personal_data_values.extend([PersonalDataCandidate(candidate_id=candidate_id,
+                personal_data_id=personal_data[personal_data_id], value=value)
+                for personal_data_id, value in row['personal_data']])
+            background_values.extend([BackgroundCandidate(candidate_id=candidate_id,
+                background_id=backgrounds[background_id], value=value) for background_id, value in row['backgrounds']])
+            links.extend([Link(candidate_id=candidate_id, name=name, url=url) for name, url in row['links']])
+            candidate_answers.extend([Candidate.answers.through(candidate_id=candidate_id, answer_id=answers[answer_id])
+                                      for answer_id in row['answers']])
+        bulk_insert(PersonalDataCandidate, personal_data_values, using=using)
+        bulk_insert(BackgroundCandidate, background_values, using=using)
+        bulk_insert(Link, links, using=using)
+        bulk_insert(Candidate.answers.through, candidate_answers, using=using)
+
+    # What the signals of the rows inserted would have done.
+    invalidate_quiz_snapshot(election.pk)
+    return election
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming exports of media naranja visitor analytics.
+
+``visitor_export`` yields the visitors of an election as CSV or JSON lines,
+one visitor at a time. Visitors are read in chunks of primary keys, see
+``keyset_chunks``, with a handful of queries per chunk whatever its size,
+so neither the querysets nor the file are ever held in memory. Visitors
+stored as rows come first, then the ones stored packed.
+
+In CSV every visitor takes one line per answer, per candidate score and per
+category score, told apart by the ``type`` column. In JSON lines every
+visitor is one object. Visitors are numbered from 1 in export order, the
+same visitor gets the same number in all of its lines. Each visitor comes
+with the ``sample_rate`` it was stored at: weighting it by the inverse of
+that rate makes up for the visitors that weren't stored.
+
+``streamed_visitor_export`` wraps it for a streamed response: an error
+halfway can't change the status any more, so the file ends with an error
+line instead: a CSV line of ``type`` ``error``, or a JSON object with an
+``error``.
+"""
+import cStringIO
+import csv
+import logging
+
+from django.db import router
+from django.utils import simplejson as json
+
+from elections.analytics import visitor_records, unpack_visitors
+from elections.bulk import keyset_chunks, close_connections
+from elections.models import Visitor, PackedVisitor
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 500
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+CSV_COLUMNS = ('visitor', 'datestamp', 'election_url', 'sample_rate', 'type', 'category', 'question', 'answer',
+               'importance', 'candidate', 'score')
+
+
+def election_visitor_records(election, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Yields the records of every visitor of ``election``, reading
+    ``chunk_size`` visitors at a time.
+    """
+    if using is None:
+        using = router.db_for_read(Visitor)
+    return queryset_visitor_records(Visitor.objects.using(using).filter(election=election),
+                                    PackedVisitor.objects.using(using).filter(election=election),
+                                    chunk_size, using)
+
+
+def queryset_visitor_records(visitors, packed_visitors, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Yields the records of the ``visitors`` and then of the
+    ``packed_visitors`` querysets, reading ``chunk_size`` visitors at a time.
+    """
+    for visitor_ids in keyset_chunks(visitors, chunk_size):
+        for record in visitor_records(visitor_ids, using):
+            yield record
+    for packed_visitor_ids in keyset_chunks(packed_visitors, chunk_size):
+        chunk = packed_visitors.filter(pk__in=packed_visitor_ids).order_by('pk')
+        for record in unpack_visitors(chunk, using):
+            yield record
+
+
+def encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if value is None:
+        return ''
+    return value
+
+
+def csv_lines(number, record):
+    """
+    Returns the CSV lines of the visitor ``record`` as a single string.
+    """
+    visitor = (number, record['datestamp'].isoformat(), record['election_url'], record['sample_rate'])
+    rows = []
+    for answer, question, category, importance in record['answers']:
+        rows.append(visitor + ('answer', category, question, answer, importance, None, None))
+    for candidate, score, category_scores in record['scores']:
+        rows.append(visitor + ('score', None, None, None, None, candidate, score))
+        for category, category_score in category_scores:
+            rows.append(visitor + ('category_score', category, None, None, None, candidate, category_score))
+    output = cStringIO.StringIO()
+    writer = csv.writer(output)
+    for row in rows:
+        writer.writerow([encode(value) for value in row])
+    return output.getvalue()
+
+
+def json_line(number, record):
+    """
+    Returns the visitor ``record`` as one line of JSON.
+    """
+    visitor = {
+        'visitor': number,
+        'datestamp': record['datestamp'].isoformat(),
+        'election_url': record['election_url'],
+        'sample_rate': record['sample_rate'],
+        'answers': [{'category': category, 'question': question, 'answer': answer, 'importance': importance}
+                    for answer, question, category, importance in record['answers']],
+        'scores': [{'candidate': candidate, 'score': score,
+                    'categories': [{'category': category, 'score': category_score}
+                                   for category, category_score in category_scores]}
+                   for candidate, score, category_scores in record['scores']],
+    }
+    return json.dumps(visitor, separators=(',', ':')) + '\n'
+
+
+def visitor_export(election, format, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Yields the visitors of ``election`` in ``format``, ``csv`` or
+    ``jsonl``, as strings to be written one after the other.
+    """
+    if format not in EXPORT_CONTENT_TYPES:
+        raise ValueError('Unknown export format %r' % format)
+    if format == 'csv':
+        output = cStringIO.StringIO()
+        csv.writer(output).writerow(CSV_COLUMNS)
+        yield output.getvalue()
+    for number, record in enumerate(election_visitor_records(election, chunk_size, using)):
+        if format == 'csv':
+            yield csv_lines(number + 1, record)
+        else:
+            yield json_line(number + 1, record)
+
+
+def error_line(format):
+    if format == 'csv':
+        output = cStringIO.StringIO()
+        csv.writer(output).writerow([column == 'type' and 'error' or '' for column in CSV_COLUMNS])
+        return output.getvalue()
+    return json.dumps({'error': 'The export failed, this file is incomplete.'}) + '\n'
+
+
+def streamed_visitor_export(election, format, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Yields the export of ``visitor_export`` for the body of a response. It
+    is read after Django closed the database connections of the request, so
+    it closes the ones it opens itself.
+    """
+    try:
+        for content in visitor_export(election, format, chunk_size, using):
+            yield content
+    except Exception:
+        logger.exception('Could not export the visitors of election %s', election.pk)
+        yield error_line(format)
+    finally:
+        close_connections()
@@ -0,0 +1,35 @@
+# coding= utf-8
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from elections.models import Election
+from elections.retention import PURGE_BATCH_SIZE, RETENTION_DAYS, retention_cutoff, archive_visitors
+
+
+class Command(BaseCommand):
+    help = ('Moves the media naranja visitors past the retention period of their election, or of a closed '
+            'election, to gzipped JSON lines files and deletes them in batches.')
+    option_list = BaseCommand.option_list + (
+        make_option('--directory', dest='directory', default=None,
+                    help='Directory of the archives, MEDIANARANJA_ANALYTICS_ARCHIVE_ROOT by default.'),
+        make_option('--batch-size', dest='batch_size', type='int', default=PURGE_BATCH_SIZE,
+                    help='Number of visitors deleted per transaction.'),
+        make_option('--election', dest='election', type='int', default=None,
+                    help='Only archive the visitors of the election with this id.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        elections = Election.objects.select_related('owner').order_by('pk')
+        if options['election'] is not None:
+            elections = elections.filter(pk=options['election'])
+        if RETENTION_DAYS is None:
+            elections = elections.filter(analyticsretention__isnull=False)
+        for election in elections:
+            before = retention_cutoff(election)
+            if before is None:
+                continue
+            path, archived = archive_visitors(election, before, options['directory'], options['batch_size'])
+            if path and verbosity > 0:
+                self.stdout.write('%s: %d visitors\n' % (path, archived))
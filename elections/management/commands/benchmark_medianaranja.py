@@ -0,0 +1,59 @@
+# coding= utf-8
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test.simple import DjangoTestSuiteRunner
+from django.utils import simplejson as json
+
+from elections.benchmark import build_synthetic_election, run_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the media naranja on a synthetic election built in a throwaway test database '
+            'and prints a JSON report with wall times, query counts and peak memory.')
+    option_list = BaseCommand.option_list + (
+        make_option('--candidates', dest='candidates', type='int', default=10,
+                    help='Number of candidates of the synthetic election.'),
+        make_option('--categories', dest='categories', type='int', default=5,
+                    help='Number of categories of the synthetic election.'),
+        make_option('--questions', dest='questions', type='int', default=4,
+                    help='Number of questions per category.'),
+        make_option('--answers', dest='answers', type='int', default=3,
+                    help='Number of answers per question.'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+                    help='Number of measured calls per benchmark.'),
+        make_option('--seed', dest='seed', type='int', default=0,
+                    help='Seed of the random candidate and visitor answers.'),
+        make_option('--output', dest='output', default=None,
+                    help='File the report is written to, instead of the standard output.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        # Every database gets a test one, as the test runner does: with the
+        # AnalyticsRouter the visits of the benchmark would go to the
+        # analytics database otherwise.
+        runner = DjangoTestSuiteRunner(verbosity=max(verbosity - 1, 0), interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            owner = User.objects.create(username='benchmark')
+            election = build_synthetic_election(owner,
+                                                candidates=options['candidates'],
+                                                categories=options['categories'],
+                                                questions=options['questions'],
+                                                answers=options['answers'],
+                                                seed=options['seed'])
+            report = run_benchmark(election, repeat=options['repeat'], seed=options['seed'])
+        finally:
+            runner.teardown_databases(old_config)
+
+        content = json.dumps(report, indent=2)
+        if options['output']:
+            output = open(options['output'], 'w')
+            try:
+                output.write(content)
+            finally:
+                output.close()
+        else:
+            self.stdout.write(content + '\n')
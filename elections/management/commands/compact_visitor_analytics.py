@@ -0,0 +1,33 @@
+# coding= utf-8
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from elections.analytics import compact_visitors
+from elections.bulk import keyset_chunks
+from elections.models import Visitor
+
+
+class Command(BaseCommand):
+    help = ('Moves media naranja visitors stored as Visitor, VisitorAnswer, VisitorScore and CategoryScore '
+            'rows to the packed format, one transaction per batch.')
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=500,
+                    help='Number of visitors moved per transaction.'),
+        make_option('--election', dest='election', type='int', default=None,
+                    help='Only compact the visitors of the election with this id.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        visitors = Visitor.objects.all()
+        if options['election'] is not None:
+            visitors = visitors.filter(election=options['election'])
+        compacted = 0
+        for visitor_ids in keyset_chunks(visitors, options['batch_size']):
+            compact_visitors(visitor_ids)
+            compacted += len(visitor_ids)
+            if verbosity > 1:
+                self.stdout.write('%d visitors compacted\n' % compacted)
+        if verbosity > 0:
+            self.stdout.write('%d visitors compacted\n' % compacted)
@@ -0,0 +1,102 @@
+# coding= utf-8
+from optparse import make_option
+
+from django.core import serializers
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.commands.dumpdata import sort_dependencies
+from django.db import router, DEFAULT_DB_ALIAS
+from django.db.models import get_app, get_apps, get_model
+
+from elections.bulk import keyset_chunks
+
+DUMP_CHUNK_SIZE = 500
+
+
+def model_objects(queryset, chunk_size=DUMP_CHUNK_SIZE):
+    """
+    Yields the objects of ``queryset`` in primary key order, reading
+    ``chunk_size`` of them at a time.
+    """
+    for pks in keyset_chunks(queryset, chunk_size):
+        for obj in queryset.filter(pk__in=pks).order_by('pk'):
+            yield obj
+
+
+class Command(BaseCommand):
+    args = '[appname appname.ModelName ...]'
+    help = ('Writes the same fixture as dumpdata, but reading the objects from the database a chunk at a time '
+            'and writing them as they are serialized, with json-pretty by default.')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default='json-pretty', dest='format',
+                    help='Serialization format of the fixture.'),
+        make_option('--indent', default=4, dest='indent', type='int',
+                    help='Indent level of the output.'),
+        make_option('--database', dest='database', default=DEFAULT_DB_ALIAS,
+                    help='Database to dump, "default" by default.'),
+        make_option('-e', '--exclude', dest='exclude', action='append', default=[],
+                    help='An appname or appname.ModelName to leave out, once per app or model.'),
+        make_option('-n', '--natural', action='store_true', dest='use_natural_keys', default=False,
+                    help='Use natural keys if they are available.'),
+        make_option('--output', dest='output', default=None,
+                    help='File the fixture is written to, instead of the standard output.'),
+        make_option('--chunk-size', dest='chunk_size', type='int', default=DUMP_CHUNK_SIZE,
+                    help='Number of objects read per query.'),
+    )
+
+    def handle(self, *app_labels, **options):
+        format = options.get('format', 'json-pretty')
+        using = options.get('database', DEFAULT_DB_ALIAS)
+        if format not in serializers.get_public_serializer_formats():
+            raise CommandError('Unknown serialization format: %s' % format)
+
+        excluded_apps = set()
+        excluded_models = set()
+        for exclude in options.get('exclude', []):
+            if '.' in exclude:
+                model = get_model(*exclude.split('.', 1))
+                if model is None:
+                    raise CommandError('Unknown model in excludes: %s' % exclude)
+                excluded_models.add(model)
+            else:
+                try:
+                    excluded_apps.add(get_app(exclude))
+                except ImproperlyConfigured:
+                    raise CommandError('Unknown app in excludes: %s' % exclude)
+
+        app_list = []
+        if not app_labels:
+            app_list = [(app, None) for app in get_apps() if app not in excluded_apps]
+        for label in app_labels:
+            app_label = label.split('.')[0]
+            try:
+                app = get_app(app_label)
+            except ImproperlyConfigured:
+                raise CommandError('Unknown application: %s' % app_label)
+            if app in excluded_apps:
+                continue
+            if '.' in label:
+                model = get_model(*label.split('.', 1))
+                if model is None:
+                    raise CommandError('Unknown model: %s' % label)
+                app_list.append((app, [model]))
+            else:
+                app_list.append((app, None))
+
+        def objects():
+            for model in sort_dependencies(app_list):
+                if model in excluded_models or model._meta.proxy or not router.allow_syncdb(using, model):
+                    continue
+                for obj in model_objects(model._default_manager.using(using).all(), options['chunk_size']):
+                    yield obj
+
+        if options.get('output'):
+            output = open(options['output'], 'wb')
+        else:
+            output = self.stdout
+        try:
+            serializers.serialize(format, objects(), indent=options.get('indent'),
+                                  use_natural_keys=options.get('use_natural_keys', False), stream=output)
+        finally:
+            if options.get('output'):
+                output.close()
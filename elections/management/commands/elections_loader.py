@@ -1,19 +1,98 @@
 # coding= utf-8
+"""
+Loads municipal elections from two CSV files: one line per candidate, with
+the name of the election first, and the questionnaire all of the elections
+share, as ``category``, ``question`` and ``answer`` lines.
+
+Rows are loaded an election at a time: the election, its personal data
+labels and its background are looked up once and kept by the ``Loader``,
+and the candidates of the election, their personal data, backgrounds and
+links take one insert each, all in one transaction.
+
+The candidates file is read as it is loaded, reporting the rows per second
+after each election. With ``--checkpoint`` the loaded elections are recorded
+in a file, and a load that stopped on a crash or a bad line is resumed by
+running the command again with the same file. With ``--workers`` the
+elections are loaded by a pool of processes.
+
+With ``--reload`` the elections already loaded only get the changes, see
+``Reloader``, which ``--dry-run`` lists without making them.
+
+With ``--media`` the photos of the candidates and the logos of the elections
+are then imported from a directory or zip file, and their thumbnails made by
+the ``--workers``, see ``elections.media_import``.
+"""
+from optparse import make_option
+
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.template.defaultfilters import slugify
+from elections.bulk import bulk_insert, bulk_delete, close_connections
+from elections.media_import import import_media
 from elections.models import Election, Candidate, PersonalData, Category, Question, Answer, BackgroundCategory,\
-							 Background, Link, BackgroundCandidate
+							 Background, Link, BackgroundCandidate, PersonalDataCandidate, invalidate_quiz_snapshot
 import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import time
 from django.core.urlresolvers import reverse
 
+# The columns of a candidate line from the third on, with the personal data
+# label they are stored under.
+PERSONAL_DATA_LABELS = (
+	(2, u"Partido"),
+	(3, u"Pacto"),
+	(4, u"¿Va a reelección?"),
+	(5, u"Número de años que ha sido alcalde"),
+	(6, u"Períodos como alcalde"),
+	(7, u"Elecciones anteriores"),
+)
+
+def line_election_name(line):
+	return line[0].decode('utf-8').strip()
+
+def candidate_slug(name, taken):
+	# The slug Candidate.save would give it, without a query per try.
+	slug = unique_slug = slugify(name)
+	counter = 1
+	while unique_slug in taken:
+		unique_slug = slug + str(counter)
+		counter += 1
+	return unique_slug
+
+def line_candidate_name(line):
+	return line[1].decode('utf-8').strip()
+
+def line_links(line, candidate_name):
+	# The facebook address and the twitter username, as (name, url).
+	links = []
+	facebook_address = line[8].decode('utf-8').strip()
+	if facebook_address:
+		links.append((candidate_name, facebook_address))
+	twitter_username = line[9].decode('utf-8').strip()
+	if twitter_username:
+		links.append((u'@'+twitter_username, u"https://twitter.com/"+twitter_username))
+	return links
+
+
 class Loader(object):
 	def __init__(self,username, lines, styles):
 		self.user = User.objects.get(username=username)
 		self.lines = lines
 		self.styles = styles
+		# Per election name: the election, its personal data by label and
+		# the "Aclaraciones al cuestionario" background.
+		self.elections = {}
+		# Only a Reloader counts them.
+		self.changes = {}
 
 	def getElection(self, line):
-		election_name = line[0].decode('utf-8').strip()
+		election_name = line_election_name(line)
+		if election_name in self.elections:
+			return self.elections[election_name][0]
 		election, created = Election.objects.get_or_create(name=election_name, owner=self.user)
 		
 		if(created):
@@ -29,48 +108,88 @@ class Loader(object):
 
 			parser = QuestionsParser(election)
 			parser.createQuestions(self.lines)
+		else:
+			reparos = Background.objects.filter(category__election=election).order_by('category', 'pk')[0]
+
+		personal_data = {}
+		for label_personal_data in PersonalData.objects.filter(election=election).order_by('pk'):
+			personal_data.setdefault(label_personal_data.label, label_personal_data)
+		for column, label in PERSONAL_DATA_LABELS:
+			if label not in personal_data:
+				personal_data[label] = PersonalData.objects.create(label=label, election=election)
+
+		self.elections[election_name] = (election, personal_data, reparos)
 		return election
 
 
 	def getCandidate(self, line):
-		candidate_name = line[1].decode('utf-8').strip()
-		election = self.getElection(line)
-		candidate, created = Candidate.objects.get_or_create(name=candidate_name, election=election, has_answered=False)
-		partido = line[2].decode('utf-8').strip()
-		personal_data, created_personal_data = PersonalData.objects.get_or_create(label=u"Partido", election=election)
-		candidate.add_personal_data(personal_data, partido)
-		pacto = line[3].decode('utf-8').strip()
-		personal_data, created_personal_data = PersonalData.objects.get_or_create(label=u"Pacto", election=election)
-		candidate.add_personal_data(personal_data, pacto)
-		reeleccion = line[4].decode('utf-8').strip()
-		personal_data, created_personal_data = PersonalData.objects.get_or_create(label=u"¿Va a reelección?", election=election)
-		candidate.add_personal_data(personal_data, reeleccion)
-		agnos = line[5].decode('utf-8').strip()
-		personal_data, created_personal_data = PersonalData.objects.get_or_create(label=u"Número de años que ha sido alcalde", election=election)
-		candidate.add_personal_data(personal_data, agnos)
-		periodos = line[6].decode('utf-8').strip()
-		personal_data, created_personal_data = PersonalData.objects.get_or_create(label=u"Períodos como alcalde", election=election)
-		candidate.add_personal_data(personal_data, periodos)
-		postulaciones_previas = line[7].decode('utf-8').strip()
-		personal_data, created_personal_data = PersonalData.objects.get_or_create(label=u"Elecciones anteriores", election=election)
-		candidate.add_personal_data(personal_data, postulaciones_previas)
-
-		reparos = election.backgroundcategory_set.all()[0].background_set.all()[0]
-
-		sin_reparos = BackgroundCandidate.objects.create(candidate=candidate, background=reparos, value=u"Sin aclaraciones")
-
-
-		facebook_address = line[8].decode('utf-8').strip()
-		if facebook_address:
-			facebook = Link.objects.create(name=candidate.name, url=facebook_address, candidate=candidate)
-
-
-		twitter_username = line[9].decode('utf-8').strip()
-		if twitter_username:
-			twitter = Link.objects.create(name=u'@'+twitter_username, url=u"https://twitter.com/"+twitter_username, candidate=candidate)
-		
+		return self.getCandidates([line])[0]
+
 
-		return candidate
+	def getCandidates(self, lines):
+		"""
+		Creates the candidates of ``lines``, all of the same election, or
+		updates the ones that already exist, and returns them in the same
+		order. The candidates take one insert, their personal data, backgrounds
+		and links one more each.
+		"""
+		self.getElection(lines[0])
+		election, personal_data, reparos = self.elections[line_election_name(lines[0])]
+
+		candidates = dict((candidate.name, candidate) for candidate in Candidate.objects.filter(election=election))
+		existing_ids = set([candidate.pk for candidate in candidates.values()])
+		taken = set([candidate.slug for candidate in candidates.values()])
+		new_candidates = []
+		for line in lines:
+			candidate_name = line_candidate_name(line)
+			if candidate_name in candidates:
+				continue
+			candidate = Candidate(name=candidate_name, election_id=election.pk, has_answered=False,
+								  slug=candidate_slug(candidate_name, taken))
+			taken.add(candidate.slug)
+			candidates[candidate_name] = candidate
+			new_candidates.append(candidate)
+		if new_candidates:
+			bulk_insert(Candidate, new_candidates)
+			for candidate in Candidate.objects.filter(election=election).exclude(pk__in=existing_ids):
+				candidates[candidate.name] = candidate
+			# The inserts sent no post_save for the quiz snapshot to notice.
+			invalidate_quiz_snapshot(election.pk)
+
+		values = {}
+		backgrounds = []
+		links = []
+		result = []
+		for line in lines:
+			candidate = candidates[line_candidate_name(line)]
+			result.append(candidate)
+			for column, label in PERSONAL_DATA_LABELS:
+				values[(candidate.pk, personal_data[label].pk)] = line[column].decode('utf-8').strip()
+			backgrounds.append(BackgroundCandidate(candidate_id=candidate.pk, background_id=reparos.pk,
+												   value=u"Sin aclaraciones"))
+			for link_name, url in line_links(line, candidate.name):
+				links.append(Link(name=link_name, url=url, candidate_id=candidate.pk))
+
+		# Like Candidate.add_personal_data, a new value replaces the old one.
+		updated_ids = [candidate.pk for candidate in result if candidate.pk in existing_ids]
+		if updated_ids:
+			personal_data_ids = [label_personal_data.pk for label_personal_data in personal_data.values()]
+			bulk_delete(PersonalDataCandidate, PersonalDataCandidate.objects.filter(
+				candidate__in=updated_ids, personal_data__in=personal_data_ids).values_list('pk', flat=True))
+		bulk_insert(PersonalDataCandidate, [PersonalDataCandidate(candidate_id=candidate_id,
+			personal_data_id=personal_data_id, value=value) for (candidate_id, personal_data_id), value in values.items()])
+		bulk_insert(BackgroundCandidate, backgrounds)
+		bulk_insert(Link, links)
+		return result
+
+
+	def loadElection(self, lines):
+		"""
+		Loads the candidate ``lines`` of one election in a single
+		transaction, creating the election first if needed.
+		"""
+		with transaction.commit_on_success(using=router.db_for_write(Candidate)):
+			return self.getCandidates(lines)
 
 
 class QuestionsParser(object):
@@ -90,24 +209,558 @@ class QuestionsParser(object):
 				self.answer = Answer.objects.create(caption=answer, question=self.question)
 
 
+def questionnaire(lines):
+	"""
+	Returns the questionnaire lines as a list of ``(category,
+	[(question, [answer captions])])``.
+	"""
+	categories = []
+	for line in lines:
+		if line[0]=="category":
+			categories.append((line[1].decode('utf-8').strip(), []))
+		if line[0]=="question":
+			categories[-1][1].append((line[1].decode('utf-8').strip(), []))
+		if line[0]=="answer":
+			categories[-1][1][-1][1].append(line[1].decode('utf-8').strip())
+	return categories
+
+def match(rows, attname, names):
+	"""
+	Pairs every one of ``names`` with a row of ``rows`` whose ``attname``
+	is that name, or else with the row in its position if no name took it,
+	or None, using every row once at most. Returns the rows paired in the
+	order of ``names`` and the rows left over.
+	"""
+	available = {}
+	for row in rows:
+		available.setdefault(getattr(row, attname), []).append(row)
+	paired = []
+	for name in names:
+		same_name = available.get(name)
+		if same_name:
+			paired.append(same_name.pop(0))
+		else:
+			paired.append(None)
+	# A name that changed, such as a typo fixed, keeps the row of the old
+	# one and what refers to it.
+	for position, row in enumerate(paired):
+		if row is None and position < len(rows) and rows[position] not in paired:
+			paired[position] = rows[position]
+	left = [row for row in rows if row not in paired]
+	return paired, left
+
+
+class Reloader(Loader):
+	"""
+	Brings the elections already loaded in line with the lines, with only
+	the inserts, updates and deletes needed, and loads the others as
+	``Loader`` does. ``changes`` counts them by model and action. With
+	``dry_run`` they are only counted.
+
+	The questionnaire, the candidates, their personal data, background and
+	facebook and twitter links follow the lines, and the candidates and
+	questions missing from them are deleted. A category, question or answer
+	whose text isn't in the lines any more takes the text in its position,
+	so that fixing a typo updates it instead of replacing it. Candidates keep their answers
+	to the questions that stay, and what the lines don't have, such as
+	other personal data or links, is left alone.
+	"""
+	def __init__(self, username, lines, styles, dry_run=False):
+		super(Reloader, self).__init__(username, lines, styles)
+		self.dry_run = dry_run
+		self.questionnaire = questionnaire(lines)
+		if isinstance(styles, unicode):
+			self.unicode_styles = styles
+		else:
+			self.unicode_styles = styles.decode('utf-8')
+
+	def count(self, model, action, number=1):
+		if number:
+			key = (model.__name__, action)
+			self.changes[key] = self.changes.get(key, 0) + number
+
+	def create(self, model, **fields):
+		self.count(model, 'inserted')
+		if not self.dry_run:
+			return model.objects.create(**fields)
+
+	def rename(self, model, row, attname, name):
+		if getattr(row, attname) != name:
+			self.count(model, 'updated')
+			if not self.dry_run:
+				setattr(row, attname, name)
+				row.save()
+
+	def delete(self, model, rows):
+		self.count(model, 'deleted', len(rows))
+		if rows and not self.dry_run:
+			model.objects.filter(pk__in=[row.pk for row in rows]).delete()
+
+	def loadElection(self, lines):
+		with transaction.commit_on_success(using=router.db_for_write(Candidate)):
+			return self.reloadElection(lines)
+
+	def reloadElection(self, lines):
+		"""
+		Reloads the candidate ``lines`` of one election and returns the
+		candidates, unsaved in a dry run if they are new.
+		"""
+		election_name = line_election_name(lines[0])
+		elections = list(Election.objects.filter(name=election_name, owner=self.user)[:1])
+		if not elections:
+			self.countNewElection(lines)
+			if self.dry_run:
+				return [Candidate(name=line_candidate_name(line)) for line in lines]
+			return self.getCandidates(lines)
+		election = elections[0]
+		if election.custom_style != self.unicode_styles:
+			self.count(Election, 'updated')
+			if not self.dry_run:
+				election.custom_style = self.unicode_styles
+				election.save()
+		self.reloadQuestionnaire(election)
+		return self.reloadCandidates(election, lines)
+
+	def countNewElection(self, lines):
+		self.count(Election, 'inserted')
+		self.count(Category, 'inserted', len(self.questionnaire))
+		for category_name, questions in self.questionnaire:
+			self.count(Question, 'inserted', len(questions))
+			for question, captions in questions:
+				self.count(Answer, 'inserted', len(captions))
+		self.count(PersonalData, 'inserted', len(PERSONAL_DATA_LABELS))
+		self.count(BackgroundCategory, 'inserted')
+		self.count(Background, 'inserted')
+		self.countNewCandidates(lines)
+
+	def countNewCandidates(self, lines):
+		# What getCandidates inserts for candidates that don't exist yet.
+		self.count(Candidate, 'inserted', len(set([line_candidate_name(line) for line in lines])))
+		self.count(PersonalDataCandidate, 'inserted',
+				   len(set([line_candidate_name(line) for line in lines])) * len(PERSONAL_DATA_LABELS))
+		self.count(BackgroundCandidate, 'inserted', len(lines))
+		for line in lines:
+			self.count(Link, 'inserted', len(line_links(line, line_candidate_name(line))))
+
+	def reloadQuestionnaire(self, election):
+		categories = list(Category.objects.filter(election=election).order_by('order', 'pk'))
+		questions = {}
+		for question in Question.objects.filter(category__election=election).order_by('pk'):
+			questions.setdefault(question.category_id, []).append(question)
+		answers = {}
+		for answer in Answer.objects.filter(question__category__election=election).order_by('pk'):
+			answers.setdefault(answer.question_id, []).append(answer)
+
+		new_answers = []
+		deleted_questions = []
+		deleted_answers = []
+		paired_categories, deleted_categories = match(categories, 'name',
+			[category_name for category_name, category_questions in self.questionnaire])
+		for (category_name, category_questions), category in zip(self.questionnaire, paired_categories):
+			if category is None:
+				category = self.create(Category, name=category_name, election=election)
+			else:
+				self.rename(Category, category, 'name', category_name)
+			paired_questions, left = match(questions.get(category and category.pk, []), 'question',
+				[question_text for question_text, captions in category_questions])
+			deleted_questions.extend(left)
+			for (question_text, captions), question in zip(category_questions, paired_questions):
+				if question is None:
+					question = self.create(Question, question=question_text, category=category)
+				else:
+					self.rename(Question, question, 'question', question_text)
+				paired_answers, left = match(answers.get(question and question.pk, []), 'caption', captions)
+				deleted_answers.extend(left)
+				for caption, answer in zip(captions, paired_answers):
+					if answer is None:
+						new_answers.append(Answer(caption=caption, question=question))
+					else:
+						self.rename(Answer, answer, 'caption', caption)
+		self.count(Answer, 'inserted', len(new_answers))
+		if new_answers and not self.dry_run:
+			bulk_insert(Answer, new_answers)
+			invalidate_quiz_snapshot(election.pk)
+
+		# Deleting an answer also deletes it from the candidates who chose it.
+		for category in deleted_categories:
+			deleted_questions.extend(questions.get(category.pk, []))
+		for question in deleted_questions:
+			deleted_answers.extend(answers.get(question.pk, []))
+		self.delete(Answer, deleted_answers)
+		self.delete(Question, deleted_questions)
+		self.delete(Category, deleted_categories)
+
+	def reloadCandidates(self, election, lines):
+		personal_data = {}
+		for label_personal_data in PersonalData.objects.filter(election=election).order_by('pk'):
+			personal_data.setdefault(label_personal_data.label, label_personal_data)
+		for column, label in PERSONAL_DATA_LABELS:
+			if label not in personal_data:
+				personal_data[label] = self.create(PersonalData, label=label, election=election)
+		backgrounds = list(Background.objects.filter(category__election=election,
+			name=u"Aclaraciones al cuestionario").order_by('category', 'pk')[:1])
+		if backgrounds:
+			reparos = backgrounds[0]
+		else:
+			otros = list(BackgroundCategory.objects.filter(election=election, name=u"Otros").order_by('pk')[:1])
+			if otros:
+				otros = otros[0]
+			else:
+				otros = self.create(BackgroundCategory, name=u"Otros", election=election)
+			reparos = self.create(Background, name=u"Aclaraciones al cuestionario", category=otros)
+		if not self.dry_run:
+			# New candidates are loaded by getCandidates, with these.
+			self.elections[election.name] = (election, personal_data, reparos)
+
+		candidate_lines = {}
+		candidate_names = []
+		for line in lines:
+			candidate_name = line_candidate_name(line)
+			if candidate_name not in candidate_lines:
+				candidate_names.append(candidate_name)
+			candidate_lines[candidate_name] = line
+		candidates = dict((candidate.name, candidate) for candidate in Candidate.objects.filter(election=election))
+		new_lines = [candidate_lines[candidate_name] for candidate_name in candidate_names
+					 if candidate_name not in candidates]
+		self.delete(Candidate, [candidate for candidate in candidates.values() if candidate.name not in candidate_lines])
+		kept = [candidates[candidate_name] for candidate_name in candidate_names if candidate_name in candidates]
+		kept_ids = [candidate.pk for candidate in kept]
+
+		values = {}
+		deleted_values = []
+		personal_data_ids = [label_personal_data.pk for label_personal_data in personal_data.values()
+							 if label_personal_data is not None]
+		for value in PersonalDataCandidate.objects.filter(candidate__in=kept_ids,
+														   personal_data__in=personal_data_ids).order_by('pk'):
+			key = (value.candidate_id, value.personal_data_id)
+			if key in values:
+				deleted_values.append(value)
+			else:
+				values[key] = value
+		links = {}
+		for link in Link.objects.filter(candidate__in=kept_ids).order_by('pk'):
+			links.setdefault(link.candidate_id, []).append(link)
+		background_values = {}
+		if reparos is not None:
+			for background_value in BackgroundCandidate.objects.filter(candidate__in=kept_ids,
+																	   background=reparos).order_by('pk'):
+				background_values.setdefault(background_value.candidate_id, []).append(background_value)
+
+		new_values = []
+		new_links = []
+		new_background_values = []
+		deleted_links = []
+		deleted_background_values = []
+		for candidate in kept:
+			line = candidate_lines[candidate.name]
+			for column, label in PERSONAL_DATA_LABELS:
+				new_value = line[column].decode('utf-8').strip()
+				label_personal_data = personal_data[label]
+				value = values.get((candidate.pk, label_personal_data and label_personal_data.pk))
+				if value is None:
+					new_values.append((candidate, label_personal_data, new_value))
+				elif value.value != new_value:
+					self.count(PersonalDataCandidate, 'updated')
+					if not self.dry_run:
+						PersonalDataCandidate.objects.filter(pk=value.pk).update(value=new_value)
+
+			wanted = line_links(line, candidate.name)
+			for link in links.get(candidate.pk, []):
+				if (link.name, link.url) in wanted:
+					wanted.remove((link.name, link.url))
+				elif link.css_class in ('facebook', 'twitter') or link.name == candidate.name:
+					deleted_links.append(link)
+			for link_name, url in wanted:
+				new_links.append(Link(name=link_name, url=url, candidate=candidate))
+
+			candidate_background_values = background_values.get(candidate.pk, [])
+			if candidate_background_values:
+				deleted_background_values.extend(candidate_background_values[1:])
+			else:
+				new_background_values.append(candidate)
+
+		self.delete(PersonalDataCandidate, deleted_values)
+		self.delete(Link, deleted_links)
+		self.delete(BackgroundCandidate, deleted_background_values)
+		self.count(PersonalDataCandidate, 'inserted', len(new_values))
+		self.count(Link, 'inserted', len(new_links))
+		self.count(BackgroundCandidate, 'inserted', len(new_background_values))
+		if not self.dry_run:
+			# In a dry run the personal data and background may not exist.
+			bulk_insert(PersonalDataCandidate, [PersonalDataCandidate(candidate=candidate,
+				personal_data=label_personal_data, value=value) for candidate, label_personal_data, value in new_values])
+			bulk_insert(Link, new_links)
+			bulk_insert(BackgroundCandidate, [BackgroundCandidate(candidate=candidate, background=reparos,
+				value=u"Sin aclaraciones") for candidate in new_background_values])
+
+		self.countNewCandidates(new_lines)
+		if self.dry_run:
+			return kept + [Candidate(name=line_candidate_name(line)) for line in new_lines]
+		if not new_lines:
+			return kept
+		return kept + self.getCandidates(new_lines)
+
+
+class Checkpoint(object):
+	"""
+	The names of the elections already loaded, one per line of the file at
+	``path``. A name is written once its election is committed, so a load
+	that stopped half way starts again after the last election it loaded.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.loaded = set()
+		if os.path.exists(path):
+			for line in open(path, 'rb'):
+				name = line.rstrip('\n').decode('utf-8')
+				if name:
+					self.loaded.add(name)
+
+	def __contains__(self, election_name):
+		return election_name in self.loaded
+
+	def add(self, election_name):
+		checkpoint = open(self.path, 'ab')
+		try:
+			checkpoint.write(election_name.encode('utf-8') + '\n')
+			checkpoint.flush()
+			os.fsync(checkpoint.fileno())
+		finally:
+			checkpoint.close()
+		self.loaded.add(election_name)
+
+
 class Command(BaseCommand):
 	args = '<username> <candidates csv file> <questions csv file> <css file for custom>'
+	option_list = BaseCommand.option_list + (
+		make_option('--checkpoint', dest='checkpoint', default=None,
+					help='File listing the elections already loaded, which are skipped, and where the ones '
+						 'loaded now are added. Run again with the same file to resume a load that stopped.'),
+		make_option('--workers', dest='workers', type='int', default=1,
+					help='Number of processes loading elections in parallel, one transaction per election.'),
+		make_option('--reload', action='store_true', dest='reload', default=False,
+					help='Update the elections that exist with only the changes in the files, keeping the '
+						 'answers of their candidates.'),
+		make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+					help='Show what a reload would change, without changing anything.'),
+		make_option('--media', dest='media', default=None,
+					help='Directory or zip file with the logos of the elections, as <election slug>.jpg, and the '
+						 'photos of the candidates, as <election slug>/<candidate slug>.jpg.'),
+	)
+
 	def handle(self, *args, **options):
+		verbosity = int(options.get('verbosity', 1))
+		# execute() sets it, but the command may also be handled directly.
+		stdout = getattr(self, 'stdout', sys.stdout)
 		username = args[0]
 		reader = open(args[3], 'rb')
 		style = reader.read()
 		lines_for_election_loader = csv.reader(open(args[1], 'rb'), delimiter=',')
+		# The questionnaire is small and every new election needs it.
 		lines_for_question_loader = []
 		questions_reader = csv.reader(open(args[2], 'rb'), delimiter=',')
 		for question_line in questions_reader:
 			lines_for_question_loader.append(question_line)
-		processCandidates(username, lines_for_election_loader, lines_for_question_loader,style)
-		
+		checkpoint = None
+		if options.get('checkpoint'):
+			checkpoint = Checkpoint(options['checkpoint'])
+
+		def progress(election_name, status, totals):
+			if verbosity > 0:
+				stdout.write(u'%s: %s (%d rows, %.1f rows/s)\n' % (election_name, status, totals['rows'],
+					totals['rows'] / max(totals['seconds'], 0.001)))
+
+		totals = processCandidates(username, lines_for_election_loader, lines_for_question_loader, style,
+								   checkpoint, progress, options.get('workers', 1), options.get('reload', False),
+								   options.get('dry_run', False))
+		if verbosity > 0:
+			stdout.write('%(elections)d elections and %(candidates)d candidates loaded, %(skipped)d elections skipped, '
+						 '%(failed)d failed, in %(seconds).1f s\n' % totals)
+			changes = totals['changes']
+			for model_name in sorted(set([model_name for model_name, action in changes])):
+				stdout.write('%s: %d inserted, %d updated, %d deleted\n' % (model_name,
+					changes.get((model_name, 'inserted'), 0), changes.get((model_name, 'updated'), 0),
+					changes.get((model_name, 'deleted'), 0)))
+			if options.get('dry_run'):
+				stdout.write('Dry run, nothing was changed.\n')
+		if options.get('media') and not options.get('dry_run'):
+			report = import_media(User.objects.get(username=username), options['media'], options.get('workers', 1))
+			if verbosity > 0:
+				stdout.write('%(photos)d photos and %(logos)d logos imported, %(thumbnails)d thumbnails made\n' % report)
+				for name in report['unmatched']:
+					stdout.write('%s: no election or candidate\n' % name)
+
+
+def numbered_lines(lines_for_election_loader):
+	# Line numbers start at 1, as in an editor, and blank lines are left out.
+	return ((number + 1, line) for number, line in enumerate(lines_for_election_loader) if line)
+
+def numbered_line_election_name(numbered_line):
+	return line_election_name(numbered_line[1])
+
+def election_runs(lines_for_election_loader):
+	"""
+	Yields the name of the election and its numbered lines for every run of
+	lines of the same election, as they are read.
+	"""
+	for election_name, numbered_candidate_lines in itertools.groupby(numbered_lines(lines_for_election_loader),
+																	 numbered_line_election_name):
+		yield election_name, list(numbered_candidate_lines)
+
+def election_groups(lines_for_election_loader):
+	"""
+	Returns the name of the election and all of its numbered lines for every
+	election, in the order they first appear. Unlike ``election_runs`` it
+	reads all of the lines first, so no two groups have the same election.
+	"""
+	groups = []
+	lines_by_election = {}
+	for numbered_line in numbered_lines(lines_for_election_loader):
+		election_name = numbered_line_election_name(numbered_line)
+		if election_name not in lines_by_election:
+			lines_by_election[election_name] = []
+			groups.append((election_name, lines_by_election[election_name]))
+		lines_by_election[election_name].append(numbered_line)
+	return groups
+
+def load_election_lines(loader, election_name, numbered_candidate_lines):
+	"""
+	Loads the numbered lines of an election in one transaction and returns
+	the number of candidates loaded, or raises a ``CommandError`` naming the
+	lines.
+	"""
+	try:
+		candidates = loader.loadElection([line for number, line in numbered_candidate_lines])
+	except Exception as error:
+		raise CommandError(u'Could not load %s, lines %d to %d: %s' % (election_name,
+			numbered_candidate_lines[0][0], numbered_candidate_lines[-1][0], error))
+	return len(set([candidate.name for candidate in candidates]))
+
+
+# The Loader of a worker process, see init_worker.
+worker_loader = None
+
+def init_worker(username, lines_for_question_loader, styles, reload, dry_run):
+	global worker_loader
+	close_connections()
+	worker_loader = make_loader(username, lines_for_question_loader, styles, reload, dry_run)
+
+def load_in_worker(group):
+	# Returns the election name, the candidates loaded, the changes of a
+	# reload and the error, if any.
+	election_name, numbered_candidate_lines = group
+	worker_loader.changes = {}
+	try:
+		loaded = load_election_lines(worker_loader, election_name, numbered_candidate_lines)
+		return election_name, loaded, worker_loader.changes, None
+	except CommandError as error:
+		return election_name, 0, {}, unicode(error)
+
+def make_loader(username, lines_for_question_loader, styles, reload=False, dry_run=False):
+	if reload or dry_run:
+		return Reloader(username, lines_for_question_loader, styles, dry_run)
+	return Loader(username, lines_for_question_loader, styles)
+
+def add_changes(totals, changes):
+	for key, number in changes.items():
+		totals['changes'][key] = totals['changes'].get(key, 0) + number
+
+
+def processCandidates(username, lines_for_election_loader, lines_for_question_loader, styles,
+					  checkpoint=None, progress=None, workers=1, reload=False, dry_run=False):
+	"""
+	Loads the candidate lines as they are read, one transaction per run of
+	lines of the same election, so the lines of an election are best kept
+	together. Elections in ``checkpoint`` are skipped and the ones loaded are
+	added to it; with a checkpoint the lines are read and grouped by election
+	first, as ``election_groups`` does. After every election ``progress``, if given, is called with
+	its name, what happened to it and the totals so far, which are also
+	returned: ``rows`` read, ``elections`` and ``candidates`` loaded,
+	``skipped`` elections, ``failed`` elections, ``seconds`` since the
+	start and the ``changes`` of a reload.
+
+	With ``reload`` the elections that exist are brought in line with the
+	lines, see ``Reloader``, and with ``dry_run`` the changes are only
+	counted, and nothing is written, not even the checkpoint. A reload also
+	groups the lines by election first.
+
+	A line that can't be loaded stops the load with a ``CommandError``; its
+	election is rolled back and the ones before it stay loaded.
+
+	With more than one of ``workers``, the lines are read and grouped by
+	election first, and the elections are loaded by that many processes, each
+	with its own connection and one transaction per election. Checkpoint and
+	progress stay in this process. An election that can't be loaded doesn't
+	stop the others: the ``CommandError`` comes at the end, listing all of
+	them.
+	"""
+	start = time.time()
+	totals = {'rows': 0, 'elections': 0, 'candidates': 0, 'skipped': 0, 'failed': 0, 'seconds': 0.0, 'changes': {}}
+	if dry_run:
+		checkpoint = None
 
+	def count(election_name, rows, status):
+		totals['rows'] += rows
+		totals['seconds'] = time.time() - start
+		if progress is not None:
+			progress(election_name, status, totals)
 
-def processCandidates(username, lines_for_election_loader, lines_for_question_loader, styles):
-	loader = Loader(username, lines_for_question_loader, styles)
-	for candidate_line in lines_for_election_loader:
-		candidate = loader.getCandidate(candidate_line)
+	if workers <= 1:
+		loader = make_loader(username, lines_for_question_loader, styles, reload, dry_run)
+		# A reload deletes what isn't in the lines of the election, so it
+		# needs all of them at once, and an election is only done, for the
+		# checkpoint, once all of its lines are loaded.
+		if reload or dry_run or checkpoint is not None:
+			groups = election_groups(lines_for_election_loader)
+		else:
+			groups = election_runs(lines_for_election_loader)
+		for election_name, numbered_candidate_lines in groups:
+			if checkpoint is not None and election_name in checkpoint:
+				totals['skipped'] += 1
+				count(election_name, len(numbered_candidate_lines), u'already loaded')
+				continue
+			loaded = load_election_lines(loader, election_name, numbered_candidate_lines)
+			if checkpoint is not None:
+				checkpoint.add(election_name)
+			totals['elections'] += 1
+			totals['candidates'] += loaded
+			count(election_name, len(numbered_candidate_lines), u'%d candidates' % loaded)
+		add_changes(totals, loader.changes)
+		return totals
 
-	
+	# Fail before starting the workers if the owner doesn't exist.
+	User.objects.get(username=username)
+	pending = []
+	rows = {}
+	for election_name, numbered_candidate_lines in election_groups(lines_for_election_loader):
+		if checkpoint is not None and election_name in checkpoint:
+			totals['skipped'] += 1
+			count(election_name, len(numbered_candidate_lines), u'already loaded')
+		else:
+			pending.append((election_name, numbered_candidate_lines))
+			rows[election_name] = len(numbered_candidate_lines)
+	close_connections()
+	errors = []
+	pool = multiprocessing.Pool(workers, init_worker, (username, lines_for_question_loader, styles, reload, dry_run))
+	try:
+		for election_name, loaded, changes, error in pool.imap_unordered(load_in_worker, pending):
+			if error is not None:
+				errors.append(error)
+				totals['failed'] += 1
+				count(election_name, rows[election_name], u'failed')
+				continue
+			if checkpoint is not None:
+				checkpoint.add(election_name)
+			totals['elections'] += 1
+			totals['candidates'] += loaded
+			add_changes(totals, changes)
+			count(election_name, rows[election_name], u'%d candidates' % loaded)
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+	if errors:
+		raise CommandError(u'\n'.join(errors))
+	return totals
@@ -0,0 +1,21 @@
+# coding= utf-8
+from django.core.management.base import BaseCommand, CommandError
+
+from elections.election_bundle import write_election_bundle
+from elections.models import Election
+
+
+class Command(BaseCommand):
+    args = '<username> <election slug> <bundle file>'
+    help = ('Writes an election, its questionnaire and its candidates to a bundle file, gzipped if its name '
+            'ends in .gz, for import_election_bundle.')
+
+    def handle(self, *args, **options):
+        if len(args) != 3:
+            raise CommandError('Usage: export_election_bundle %s' % self.args)
+        username, slug, path = args
+        try:
+            election = Election.objects.get(owner__username=username, slug=slug)
+        except Election.DoesNotExist:
+            raise CommandError('Election %s/%s does not exist' % (username, slug))
+        write_election_bundle(election, path)
@@ -0,0 +1,41 @@
+# coding= utf-8
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from elections.export import EXPORT_CHUNK_SIZE, EXPORT_CONTENT_TYPES, visitor_export
+from elections.models import Election
+
+
+class Command(BaseCommand):
+    args = '<username> <election slug>'
+    help = ('Writes the media naranja visitors of an election, with their answers and scores, '
+            'as CSV or JSON lines.')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='csv', choices=sorted(EXPORT_CONTENT_TYPES),
+                    help='Output format, csv or jsonl.'),
+        make_option('--chunk-size', dest='chunk_size', type='int', default=EXPORT_CHUNK_SIZE,
+                    help='Number of visitors read per chunk.'),
+        make_option('--output', dest='output', default=None,
+                    help='File the export is written to, instead of the standard output.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Usage: export_visitor_analytics %s' % self.args)
+        username, slug = args
+        try:
+            election = Election.objects.get(owner__username=username, slug=slug)
+        except Election.DoesNotExist:
+            raise CommandError('Election %s/%s does not exist' % (username, slug))
+
+        if options['output']:
+            output = open(options['output'], 'wb')
+        else:
+            output = self.stdout
+        try:
+            for lines in visitor_export(election, options['format'], options['chunk_size']):
+                output.write(lines)
+        finally:
+            if options['output']:
+                output.close()
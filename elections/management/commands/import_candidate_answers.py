@@ -0,0 +1,42 @@
+# coding= utf-8
+import csv
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from elections.answer_matrix import import_answer_matrix
+from elections.models import Election
+
+
+class Command(BaseCommand):
+    args = '<username> <election slug> <answer matrix csv file>'
+    help = ('Sets the answers of the candidates of an election from a CSV file with a line per candidate and a '
+            'column per question, holding the captions of the answers chosen.')
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+                    help='Only check the file, without changing any answer.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 3:
+            raise CommandError('Usage: import_candidate_answers %s' % self.args)
+        username, slug, path = args
+        try:
+            election = Election.objects.get(owner__username=username, slug=slug)
+        except Election.DoesNotExist:
+            raise CommandError('Election %s/%s does not exist' % (username, slug))
+
+        matrix = open(path, 'rb')
+        try:
+            report = import_answer_matrix(election, csv.reader(matrix), options.get('dry_run', False))
+        finally:
+            matrix.close()
+        if report['errors']:
+            raise CommandError(u'%d problems found, no answer was changed:\n%s' % (len(report['errors']),
+                               u'\n'.join(report['errors'])))
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('%(answers)d answers of %(candidates)d candidates to %(questions)d questions' % report)
+            if options.get('dry_run'):
+                self.stdout.write(' checked, nothing was changed.\n')
+            else:
+                self.stdout.write(' imported.\n')
@@ -0,0 +1,31 @@
+# coding= utf-8
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from elections.election_bundle import read_election_bundle, import_election_bundle
+
+
+class Command(BaseCommand):
+    args = '<username> <bundle file>'
+    help = 'Creates an election of a user from a file written by export_election_bundle.'
+    option_list = BaseCommand.option_list + (
+        make_option('--slug', dest='slug', default=None,
+                    help='Slug of the new election, the one in the bundle by default.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Usage: import_election_bundle %s' % self.args)
+        username, path = args
+        try:
+            owner = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError('User %s does not exist' % username)
+        try:
+            election = import_election_bundle(read_election_bundle(path), owner, options.get('slug'))
+        except ValueError as error:
+            raise CommandError(str(error))
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('Imported %s/%s\n' % (username, election.slug))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk imports of candidate photos and election logos.
+
+The images come in a directory or a zip file laid out as::
+
+    <election slug>.<extension>                    the logo of the election
+    <election slug>/<candidate slug>.<extension>   the photo of a candidate
+
+``import_media`` stores every image in ``Election.logo`` or
+``Candidate.photo`` and then makes all the thumbnails the templates show
+them with, listed in ``PHOTO_THUMBNAILS`` and ``LOGO_THUMBNAILS``, so that
+the first visitors after a load don't wait for them. Decoding and resizing
+take most of the time, so the thumbnails are made by a pool of processes.
+"""
+import multiprocessing
+import os
+import zipfile
+
+from django.core.files.base import ContentFile
+from sorl.thumbnail import get_thumbnail
+
+from elections.bulk import close_connections
+from elections.models import Election, Candidate
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+# The geometries and options of the {% thumbnail %} tags of the templates.
+PHOTO_THUMBNAILS = (
+    ('115x144', {'crop': 'center'}),
+    ('32x40', {'crop': 'center'}),
+    ('100x129', {'crop': 'center'}),
+    ('160x200', {'crop': 'center'}),
+    ('80x100', {'crop': 'center'}),
+)
+LOGO_THUMBNAILS = (
+    ('850x80', {}),
+    ('680x64', {}),
+)
+
+
+def media_files(path):
+    """
+    Yields the name, relative to ``path`` and with ``/`` separators, and the
+    content of every file in the directory or zip file ``path``, one at a
+    time.
+    """
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        try:
+            for name in archive.namelist():
+                if not name.endswith('/'):
+                    yield name, archive.read(name)
+        finally:
+            archive.close()
+        return
+    for directory, directories, filenames in os.walk(path):
+        directories.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(directory, filename)
+            image = open(full_path, 'rb')
+            try:
+                yield os.path.relpath(full_path, path).replace(os.sep, '/'), image.read()
+            finally:
+                image.close()
+
+
+def make_thumbnails(job):
+    """
+    Makes the thumbnails of the image ``name`` for the ``thumbnails``
+    geometries and returns how many.
+    """
+    name, thumbnails = job
+    for geometry, options in thumbnails:
+        get_thumbnail(name, geometry, **options)
+    return len(thumbnails)
+
+
+def import_media(owner, path, workers=1):
+    """
+    Stores the images in ``path`` as the logos of the elections of
+    ``owner`` and the photos of their candidates, and makes their
+    thumbnails with ``workers`` processes. Returns a dict with the number of
+    ``photos``, ``logos`` and ``thumbnails`` and the names of the files
+    that matched no election or candidate, ``unmatched``.
+    """
+    elections = dict((election.slug, election) for election in Election.objects.filter(owner=owner))
+    candidates = dict(((candidate.election_id, candidate.slug), candidate)
+                      for candidate in Candidate.objects.filter(election__owner=owner))
+    report = {'photos': 0, 'logos': 0, 'thumbnails': 0, 'unmatched': []}
+    jobs = []
+    for name, content in media_files(path):
+        parts = name.split('/')
+        slug, extension = os.path.splitext(parts[-1])
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            report['unmatched'].append(name)
+        elif len(parts) == 1 and slug in elections:
+            election = elections[slug]
+            election.logo.save(slug + extension.lower(), ContentFile(content))
+            jobs.append((election.logo.name, LOGO_THUMBNAILS))
+            report['logos'] += 1
+        elif len(parts) == 2 and parts[0] in elections and (elections[parts[0]].pk, slug) in candidates:
+            candidate = candidates[(elections[parts[0]].pk, slug)]
+            candidate.photo.save(u'%s-%s%s' % (parts[0], slug, extension.lower()), ContentFile(content))
+            jobs.append((candidate.photo.name, PHOTO_THUMBNAILS))
+            report['photos'] += 1
+        else:
+            report['unmatched'].append(name)
+
+    if workers <= 1:
+        report['thumbnails'] = sum([make_thumbnails(job) for job in jobs])
+        return report
+    close_connections()
+    pool = multiprocessing.Pool(workers, close_connections)
+    try:
+        report['thumbnails'] = sum(pool.imap_unordered(make_thumbnails, jobs))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return report
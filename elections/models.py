@@ -2,6 +2,7 @@
 
 import os
 import re
+import uuid
 from django.db import models
 from django.conf import settings
 from django.forms import ModelForm
@@ -10,8 +11,9 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.utils.translation import ugettext_lazy as _
 from django.template.defaultfilters import slugify
-from django.db.models.signals import  post_save
+from django.db.models.signals import  post_save, post_delete, m2m_changed
 from django.dispatch.dispatcher import receiver
+from django.core.validators import MinValueValidator, MaxValueValidator
 
 
 facebook_regexp = re.compile(r"^https?://[^/]*(facebook\.com|fb\.com|fb\.me)(/.*|/?)")
@@ -19,6 +21,10 @@ twitter_regexp = re.compile(r"^https?://[^/]*(t\.co|twitter\.com)(/.*|/?)")
 http_regexp = re.compile(r"^(ht|f)tps?://.*")
 
 
+def new_quiz_version():
+    return uuid.uuid4().hex
+
+
 # Create your models here.
 class Election(models.Model):
     name = models.CharField(max_length=255, verbose_name=_(u"NOMBRE DE LA ELECCIÓN:"))
@@ -34,6 +40,8 @@ class Election(models.Model):
     custom_style = models.TextField(blank=True)
     highlighted = models.BooleanField(default=False)
     use_default_media_naranja_option = models.BooleanField(default=True) #Default option "Ninguna de las anteriores" in media naranja
+    # Version of the media naranja quiz snapshot, see invalidate_quiz_snapshot.
+    quiz_version = models.CharField(max_length=32, default=new_quiz_version, editable=False)
     
 
     class Meta:
@@ -41,6 +49,13 @@ class Election(models.Model):
 
     def __unicode__(self):
         return u"%s" % self.name
+
+    def delete(self, *args, **kwargs):
+        # The cascade would load every media naranja visitor of the election,
+        # with its answers and scores, and delete them one by one.
+        from elections.retention import delete_election_analytics
+        delete_election_analytics(self)
+        super(Election, self).delete(*args, **kwargs)
     
     def set_slug(self):
         if not self.slug and self.name and self.owner:
@@ -213,34 +228,48 @@ class Candidate(models.Model):
     def get_questions_by_category(self, category):
         return category.question_set.all()
 
+    def get_answers_by_question(self, questions):
+        """
+        Returns the answers of the candidate to ``questions``, by question id,
+        with one query.
+        """
+        return answers_by_question([self], questions)[self.pk]
+
     def get_answer_by_question(self, question):
-        candidate_answers = self.answers
-        for answer in candidate_answers.all():
-            if answer.question == question:
-                return answer
-        return "no answer"
+        return self.get_answers_by_question([question]).get(question.pk, "no answer")
 
     def get_all_answers_by_category(self, category):
-        all_answers = []
-        all_questions = self.get_questions_by_category(category)
-        for question in all_questions:
-            candidate_answer = self.get_answer_by_question(question)
-            all_answers.append((question, candidate_answer))
-        return all_answers
+        all_questions = list(self.get_questions_by_category(category))
+        answers = self.get_answers_by_question(all_questions)
+        return [(question, answers.get(question.pk, "no answer")) for question in all_questions]
 
     def get_answers_two_candidates(self, candidate, category):
-        all_answers = []
-        all_questions = self.get_questions_by_category(category)
-        for question in all_questions:
-            first_candidate_answer = self.get_answer_by_question(question)
-            second_candidate_answer = candidate.get_answer_by_question(question)
-            all_answers.append((question,first_candidate_answer,second_candidate_answer))
-        return all_answers
+        all_questions = list(self.get_questions_by_category(category))
+        answers = answers_by_question([self, candidate], all_questions)
+        return [(question, answers[self.pk].get(question.pk, "no answer"),
+                 answers[candidate.pk].get(question.pk, "no answer")) for question in all_questions]
 
     def __unicode__(self):
         return self.name
 
 
+def answers_by_question(candidates, questions):
+    """
+    Returns the answers of every one of ``candidates`` to ``questions``, as a
+    dict of the answers by question id for every candidate id, with one
+    query. A candidate with more than one answer to a question gets the
+    first one given.
+    """
+    answers = dict((candidate.pk, {}) for candidate in candidates)
+    question_ids = [question.pk for question in questions]
+    if not answers or not question_ids:
+        return answers
+    links = Candidate.answers.through.objects.filter(candidate__in=list(answers), answer__question__in=question_ids)
+    for link in links.select_related('answer').order_by('pk'):
+        answers[link.candidate_id].setdefault(link.answer.question_id, link.answer)
+    return answers
+
+
 class PersonalData(models.Model):
     label = models.CharField(_('Nuevo dato personal'),max_length=255)
     election = models.ForeignKey('Election')
@@ -353,6 +382,8 @@ class Visitor(models.Model):
     election = models.ForeignKey('Election')
     election_url = models.CharField(max_length=255)
     datestamp = models.DateTimeField(auto_now=True)
+    # Share of the visitors stored when this one was, see AnalyticsSampling.
+    sample_rate = models.FloatField(default=1.0)
     def __unicode__(self):
         return str(self.datestamp) + ' - ' + self.election_url 
         
@@ -381,6 +412,150 @@ class CategoryScore(models.Model):
     category_score = models.IntegerField()
     category_name = models.CharField(max_length=255)       
 
+class AnalyticsText(models.Model):
+    """
+    Texts referred to by packed visitors: answers, questions, categories and
+    candidate names, each stored once.
+    """
+    text = models.CharField(max_length=255, unique=True)
+
+    def __unicode__(self):
+        return self.text
+
+class PackedVisitor(models.Model):
+    """
+    A visitor with all its answers and scores packed in two columns of
+    ``AnalyticsText`` ids and integers. See ``elections.analytics.pack_visit``.
+    """
+    election = models.ForeignKey('Election')
+    election_url = models.CharField(max_length=255)
+    datestamp = models.DateTimeField()
+    answers = models.TextField()
+    scores = models.TextField()
+    sample_rate = models.FloatField(default=1.0)
+
+    def __unicode__(self):
+        return str(self.datestamp) + ' - ' + self.election_url
+
+HISTOGRAM_BUCKETS = 10
+
+def score_bucket(score):
+    """
+    Returns the bucket of a 0 to 100 score: 0 for scores under 10, and so on
+    up to 9, which includes 100.
+    """
+    return max(0, min(int(score // (100 / HISTOGRAM_BUCKETS)), HISTOGRAM_BUCKETS - 1))
+
+class ScoreHistogram(models.Model):
+    """
+    How many media naranja visitors got each score with a candidate, in
+    buckets of ten points: overall, or in a category. Kept up to date by
+    ``elections.rollups.update_histograms``.
+
+    ``category_key`` is the id of the category, or 0 overall, for the unique
+    key, like ``AnswerDayRollup.answer_key``.
+    """
+    election = models.ForeignKey('Election')
+    candidate = models.ForeignKey('Candidate')
+    category = models.ForeignKey('Category', null=True, blank=True)
+    category_key = models.IntegerField(default=0, editable=False)
+    bucket_0 = models.IntegerField(default=0)
+    bucket_1 = models.IntegerField(default=0)
+    bucket_2 = models.IntegerField(default=0)
+    bucket_3 = models.IntegerField(default=0)
+    bucket_4 = models.IntegerField(default=0)
+    bucket_5 = models.IntegerField(default=0)
+    bucket_6 = models.IntegerField(default=0)
+    bucket_7 = models.IntegerField(default=0)
+    bucket_8 = models.IntegerField(default=0)
+    bucket_9 = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('candidate', 'category_key')
+
+    def buckets(self):
+        return [getattr(self, 'bucket_%d' % bucket) for bucket in range(HISTOGRAM_BUCKETS)]
+
+class AnalyticsRetention(models.Model):
+    """
+    How long the media naranja visitors of an election are kept before
+    ``archive_visitor_analytics`` moves them to an archive file. Without
+    ``days``, ``MEDIANARANJA_ANALYTICS_RETENTION_DAYS`` applies. Once the
+    election is ``closed`` all of its visitors are archived.
+    """
+    election = models.OneToOneField('Election')
+    days = models.PositiveIntegerField(null=True, blank=True)
+    closed = models.BooleanField(default=False)
+
+    def __unicode__(self):
+        return u"%s" % self.election
+
+class AnalyticsSampling(models.Model):
+    """
+    Share of the media naranja visitors of an election that are stored in
+    full, ``rate``, and share of them counted in the rollups,
+    ``rollup_rate``; the rest aren't recorded at all. Visitors stored in full
+    are always counted. ``MEDIANARANJA_ANALYTICS_SAMPLE_RATE`` and
+    ``MEDIANARANJA_ANALYTICS_ROLLUP_RATE`` override them for every election.
+    """
+    election = models.OneToOneField('Election')
+    rate = models.FloatField(default=1.0, validators=[MinValueValidator(0), MaxValueValidator(1)])
+    rollup_rate = models.FloatField(default=1.0, validators=[MinValueValidator(0), MaxValueValidator(1)])
+
+    def __unicode__(self):
+        return u"%s" % self.election
+
+class ElectionDayRollup(models.Model):
+    """
+    Number of media naranja visitors of an election in a day. Kept up to date
+    by ``elections.rollups.update_rollups``, like the other rollups.
+
+    When visitors are sampled, see ``AnalyticsSampling``, ``visitors`` only
+    counts the sampled ones and ``estimated_visitors`` adds up the inverse of
+    their sample rates. The other rollups of the day only count the sampled
+    visitors too, unscaled: to estimate all of them, multiply their counts
+    by ``estimated_visitors / visitors``.
+    """
+    election = models.ForeignKey('Election')
+    date = models.DateField()
+    visitors = models.IntegerField(default=0)
+    estimated_visitors = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('election', 'date')
+
+class AnswerDayRollup(models.Model):
+    """
+    Visitors who gave an answer to a question in a day, and the sum of the
+    importances they gave it. A null answer counts the visitors who didn't
+    pick any answer.
+
+    ``answer_key`` is the id of the answer, or 0 without one: the unique key
+    can't use ``answer``, as no two nulls are equal to the database.
+    """
+    election = models.ForeignKey('Election')
+    date = models.DateField()
+    question = models.ForeignKey('Question')
+    answer = models.ForeignKey('Answer', null=True, blank=True)
+    answer_key = models.IntegerField(default=0, editable=False)
+    visitors = models.IntegerField(default=0)
+    importance_sum = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('question', 'answer_key', 'date')
+
+class WinnerDayRollup(models.Model):
+    """
+    Visitors whose media naranja was a candidate in a day.
+    """
+    election = models.ForeignKey('Election')
+    date = models.DateField()
+    candidate = models.ForeignKey('Candidate')
+    visitors = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('candidate', 'date')
+
     
 
 
@@ -409,3 +584,52 @@ def create_default_questions(sender, instance, created, **kwargs):
                 for default_answer in default_question['answers']:
                     Answer.objects.create(question=question, caption=default_answer)
 
+
+# Media naranja quiz snapshots (see elections.snapshot) are cached under a
+# per-election version that changes whenever the questionnaire or the
+# candidates' answers change. It is kept in the database, so that every
+# process sees a change as soon as it is made, whatever the cache backend.
+QUIZ_SNAPSHOT_TIMEOUT = getattr(settings, 'MEDIANARANJA_CACHE_TIMEOUT', 60 * 60 * 24)
+
+def quiz_snapshot_version(election_id):
+    for version in Election.objects.filter(pk=election_id).values_list('quiz_version', flat=True):
+        return version
+    return ''
+
+def invalidate_quiz_snapshot(election_id):
+    # A random version rather than a counter: saving an Election read before
+    # the change writes its old version back, and its post_save replaces it.
+    Election.objects.filter(pk=election_id).update(quiz_version=new_quiz_version())
+
+def quiz_election_ids(instance):
+    if isinstance(instance, Election):
+        return [instance.pk]
+    if isinstance(instance, (Category, Candidate)):
+        return [instance.election_id]
+    # The parent rows may already be gone when a cascade deletes questions
+    # and answers; the parent's own signal takes care of the election then.
+    if isinstance(instance, Question):
+        return Category.objects.filter(pk=instance.category_id).values_list('election', flat=True)
+    if isinstance(instance, Answer):
+        return Category.objects.filter(question=instance.question_id).values_list('election', flat=True)
+    return []
+
+def invalidate_quiz_snapshot_on_change(sender, instance, **kwargs):
+    if kwargs.get('action') in ('pre_add', 'pre_remove', 'pre_clear'):
+        return
+    for election_id in quiz_election_ids(instance):
+        invalidate_quiz_snapshot(election_id)
+
+def analytics_sampling_cache_key(election_id, version):
+    return 'elections:analytics-sampling:%d:%s' % (election_id, version)
+
+# The sampling rates are cached under the quiz version too.
+@receiver(post_save, sender=AnalyticsSampling)
+@receiver(post_delete, sender=AnalyticsSampling)
+def invalidate_analytics_sampling(sender, instance, **kwargs):
+    invalidate_quiz_snapshot(instance.election_id)
+
+for model in (Election, Category, Question, Answer, Candidate):
+    post_save.connect(invalidate_quiz_snapshot_on_change, sender=model)
+    post_delete.connect(invalidate_quiz_snapshot_on_change, sender=model)
+m2m_changed.connect(invalidate_quiz_snapshot_on_change, sender=Candidate.answers.through)
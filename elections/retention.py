@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Retention of media naranja visitor analytics.
+
+Visitors older than the retention period of their election, see
+``AnalyticsRetention``, or all of them once the election is closed, are
+written by ``archive_visitors`` to a gzipped JSON lines file in the format of
+``elections.export``, and only then deleted, a batch of visitors per
+transaction so the tables are never locked for long. The daily rollups are
+left alone, so the election's statistics don't change.
+
+``delete_election_analytics`` deletes all the visitors of an election the
+same way, without archiving them, and its rollups, before the election
+itself is deleted.
+"""
+import datetime
+import gzip
+import os
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Max
+
+from elections.analytics import delete_visitors
+from elections.bulk import bulk_delete, keyset_chunks
+from elections.export import queryset_visitor_records, json_line
+from elections.models import Visitor, PackedVisitor, AnalyticsRetention, ElectionDayRollup, AnswerDayRollup,\
+    WinnerDayRollup, ScoreHistogram
+
+
+ARCHIVE_ROOT = getattr(settings, 'MEDIANARANJA_ANALYTICS_ARCHIVE_ROOT', 'analytics_archive')
+RETENTION_DAYS = getattr(settings, 'MEDIANARANJA_ANALYTICS_RETENTION_DAYS', None)
+PURGE_BATCH_SIZE = 500
+
+
+def retention_cutoff(election, now=None):
+    """
+    Returns the datestamp before which the visitors of ``election`` are
+    archived, or None when they are all kept.
+    """
+    if now is None:
+        now = datetime.datetime.now()
+    days = RETENTION_DAYS
+    for retention in AnalyticsRetention.objects.filter(election=election):
+        if retention.closed:
+            return now
+        if retention.days is not None:
+            days = retention.days
+    if days is None:
+        return None
+    return now - datetime.timedelta(days=days)
+
+
+def up_to_last(queryset):
+    # Visitors arriving while a batch job runs are left for the next run.
+    last_pk = queryset.aggregate(last_pk=Max('pk'))['last_pk']
+    if last_pk is None:
+        return queryset.none()
+    return queryset.filter(pk__lte=last_pk)
+
+
+def election_visitors(election, before=None, using=None):
+    """
+    Returns the visitors of ``election`` stored as rows and the ones stored
+    packed, as two querysets, optionally only those older than ``before``.
+    """
+    visitors = Visitor.objects.using(using).filter(election=election)
+    packed_visitors = PackedVisitor.objects.using(using).filter(election=election)
+    if before is not None:
+        visitors = visitors.filter(datestamp__lt=before)
+        packed_visitors = packed_visitors.filter(datestamp__lt=before)
+    return up_to_last(visitors), up_to_last(packed_visitors)
+
+
+def purge_visitors(visitors, packed_visitors, batch_size=PURGE_BATCH_SIZE, using=None):
+    """
+    Deletes the ``visitors`` and ``packed_visitors`` querysets,
+    ``batch_size`` visitors per transaction.
+    """
+    for visitor_ids in keyset_chunks(visitors, batch_size):
+        delete_visitors(visitor_ids, using)
+    for packed_visitor_ids in keyset_chunks(packed_visitors, batch_size):
+        with transaction.commit_on_success(using=using):
+            bulk_delete(PackedVisitor, packed_visitor_ids, using=using)
+
+
+def archive_visitors(election, before, directory=None, batch_size=PURGE_BATCH_SIZE, using=None, now=None):
+    """
+    Moves the visitors of ``election`` older than ``before`` to the file
+    ``<directory>/<owner>/<election slug>/<date and time>.jsonl.gz``.
+    Returns its path and the number of visitors archived, or
+    ``(None, 0)`` when there were none.
+    """
+    if using is None:
+        using = router.db_for_write(Visitor)
+    if directory is None:
+        directory = ARCHIVE_ROOT
+    if now is None:
+        now = datetime.datetime.now()
+    visitors, packed_visitors = election_visitors(election, before, using)
+
+    directory = os.path.join(directory, election.owner.username, election.slug)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, '%s.jsonl.gz' % now.strftime('%Y%m%d-%H%M%S-%f'))
+    # The archive only gets its name once it is complete, and nothing is
+    # deleted before that.
+    archive = gzip.open(path + '.tmp', 'wb')
+    archived = 0
+    try:
+        for record in queryset_visitor_records(visitors, packed_visitors, batch_size, using):
+            archived += 1
+            archive.write(json_line(archived, record))
+    except Exception:
+        archive.close()
+        os.remove(path + '.tmp')
+        raise
+    archive.close()
+    if not archived:
+        os.remove(path + '.tmp')
+        return None, 0
+    os.rename(path + '.tmp', path)
+
+    purge_visitors(visitors, packed_visitors, batch_size, using)
+    return path, archived
+
+
+def delete_election_analytics(election, batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes every visitor of ``election``, ``batch_size`` visitors per
+    transaction, and then its rollups and histograms.
+    """
+    using = router.db_for_write(Visitor)
+    visitors, packed_visitors = election_visitors(election, using=using)
+    purge_visitors(visitors, packed_visitors, batch_size, using)
+    # The rollups may be on another database than the election, which
+    # wouldn't find them when cascading.
+    for model in (ElectionDayRollup, AnswerDayRollup, WinnerDayRollup, ScoreHistogram):
+        using = router.db_for_write(model)
+        with transaction.commit_on_success(using=using):
+            bulk_delete(model, model.objects.using(using).filter(election=election).values_list('pk', flat=True),
+                        using=using)
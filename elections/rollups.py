@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Per election, per day media naranja statistics.
+
+``update_rollups`` adds a batch of visit records to the daily counters of
+``ElectionDayRollup``, ``AnswerDayRollup`` and ``WinnerDayRollup``: visitors,
+visitors per answer with the importances they gave, and visitors per winning
+candidate. It runs in the same transaction that stores the visits, with one
+UPDATE per counter touched by the batch, so the counters never need a scan
+of the visitor tables.
+
+``election_rollups`` sums the counters of an election for its owner's
+dashboard.
+
+``update_histograms``, called with the rollups, counts the scores every
+visitor got with every candidate in ``ScoreHistogram`` buckets, which
+``crowd_comparison`` reads to show visitors where their result stands.
+"""
+from django.db import router, transaction, IntegrityError
+from django.db.models import F, Sum
+
+from elections.bulk import bulk_insert
+from elections.models import ElectionDayRollup, AnswerDayRollup, WinnerDayRollup, ScoreHistogram, \
+    HISTOGRAM_BUCKETS, score_bucket
+
+
+def increment(model, keys, values, using, fields=None):
+    """
+    Adds ``values`` to the counters of the ``model`` row identified by
+    ``keys``, the fields of its unique key, creating the row on its first
+    increment with the other ``fields`` too.
+    """
+    increments = dict((name, F(name) + value) for name, value in values.items())
+    if model.objects.using(using).filter(**keys).update(**increments):
+        return
+    # Foreign keys are given as ids, which the constructor takes by attname.
+    fields = dict((model._meta.get_field(name).attname, value) for name, value in (fields or {}).items())
+    fields.update((model._meta.get_field(name).attname, value) for name, value in keys.items())
+    fields.update(values)
+    savepoint = transaction.savepoint(using=using)
+    try:
+        model.objects.using(using).create(**fields)
+    except IntegrityError:
+        # Another writer created the row first.
+        transaction.savepoint_rollback(savepoint, using=using)
+        model.objects.using(using).filter(**keys).update(**increments)
+    else:
+        transaction.savepoint_commit(savepoint, using=using)
+
+
+def update_rollups(records, using=None):
+    """
+    Counts ``records`` in the daily rollups. Records without question ids,
+    such as visitors read back from storage, are left out.
+    """
+    if using is None:
+        using = router.db_for_write(ElectionDayRollup)
+    visitors = {}
+    answers = {}
+    winners = {}
+    for record in records:
+        if 'question_ids' not in record:
+            continue
+        date = record['datestamp'].date()
+        election_key = (record['election_id'], date)
+        count, estimate = visitors.get(election_key, (0, 0.0))
+        visitors[election_key] = (count + 1, estimate + 1.0 / record.get('rollup_rate', 1.0))
+        for question_id, answer_id, answer in zip(record['question_ids'], record['answer_ids'], record['answers']):
+            key = (record['election_id'], date, question_id, answer_id)
+            count, importance_sum = answers.get(key, (0, 0))
+            answers[key] = (count + 1, importance_sum + answer[3])
+        if record['winner_id'] is not None:
+            key = (record['election_id'], date, record['winner_id'])
+            winners[key] = winners.get(key, 0) + 1
+
+    for (election_id, date), (count, estimate) in visitors.items():
+        increment(ElectionDayRollup, {'election': election_id, 'date': date},
+                  {'visitors': count, 'estimated_visitors': estimate}, using)
+    for (election_id, date, question_id, answer_id), (count, importance_sum) in answers.items():
+        increment(AnswerDayRollup, {'question': question_id, 'answer_key': answer_id or 0, 'date': date},
+                  {'visitors': count, 'importance_sum': importance_sum}, using,
+                  {'election': election_id, 'answer': answer_id})
+    for (election_id, date, candidate_id), count in winners.items():
+        increment(WinnerDayRollup, {'candidate': candidate_id, 'date': date}, {'visitors': count}, using,
+                  {'election': election_id})
+    update_histograms(records, using)
+
+
+# Lookups and updates by id are split in chunks to stay under the query
+# parameter limit of SQLite.
+HISTOGRAM_CHUNK_SIZE = 500
+
+
+def histogram_ids(keys, using):
+    """
+    Returns the ids of the existing ``ScoreHistogram`` rows among ``keys``,
+    ``(election_id, candidate_id, category_id)`` tuples.
+    """
+    candidate_ids = sorted(set([key[1] for key in keys]))
+    ids = {}
+    for start in range(0, len(candidate_ids), HISTOGRAM_CHUNK_SIZE):
+        histograms = ScoreHistogram.objects.using(using)\
+            .filter(candidate__in=candidate_ids[start:start + HISTOGRAM_CHUNK_SIZE])
+        for pk, election_id, candidate_id, category_id in histograms.values_list(
+                'pk', 'election', 'candidate', 'category'):
+            key = (election_id, candidate_id, category_id)
+            if key in keys:
+                ids[key] = pk
+    return ids
+
+
+def new_histogram(key, buckets):
+    election_id, candidate_id, category_id = key
+    fields = dict(('bucket_%d' % bucket, count) for bucket, count in enumerate(buckets))
+    return ScoreHistogram(election_id=election_id, candidate_id=candidate_id, category_id=category_id,
+                          category_key=category_id or 0, **fields)
+
+
+def update_histograms(records, using=None):
+    """
+    Counts the scores of ``records`` in the ``ScoreHistogram`` of their
+    candidates. Missing histograms are created with one insert, and the
+    existing ones take one UPDATE per bucket and count, however many
+    candidates and categories there are.
+    """
+    if using is None:
+        using = router.db_for_write(ScoreHistogram)
+    counts = {}
+    for record in records:
+        if 'candidate_ids' not in record:
+            continue
+        for candidate_id, (candidate_name, score, category_scores) in zip(record['candidate_ids'], record['scores']):
+            scores = [(None, score)]
+            scores.extend(zip(record['category_ids'], [category_score for name, category_score in category_scores]))
+            for category_id, category_score in scores:
+                buckets = counts.setdefault((record['election_id'], candidate_id, category_id),
+                                            [0] * HISTOGRAM_BUCKETS)
+                buckets[score_bucket(category_score)] += 1
+    if not counts:
+        return
+
+    ids = histogram_ids(counts, using)
+    missing = [key for key in counts if key not in ids]
+    if missing:
+        savepoint = transaction.savepoint(using=using)
+        try:
+            bulk_insert(ScoreHistogram, [new_histogram(key, counts[key]) for key in missing], using=using)
+        except IntegrityError:
+            # Another writer created some of them first: these visitors are
+            # added to its rows, and the others are created one by one.
+            transaction.savepoint_rollback(savepoint, using=using)
+            ids = histogram_ids(counts, using)
+            for key in missing:
+                if key not in ids:
+                    new_histogram(key, counts[key]).save(using=using)
+        else:
+            transaction.savepoint_commit(savepoint, using=using)
+
+    updates = {}
+    for key, pk in ids.items():
+        for bucket, count in enumerate(counts[key]):
+            if count:
+                updates.setdefault((bucket, count), []).append(pk)
+    for (bucket, count), pks in updates.items():
+        name = 'bucket_%d' % bucket
+        for start in range(0, len(pks), HISTOGRAM_CHUNK_SIZE):
+            ScoreHistogram.objects.using(using).filter(pk__in=pks[start:start + HISTOGRAM_CHUNK_SIZE])\
+                .update(**{name: F(name) + count})
+
+
+def election_rollups(election, snapshot, since=None, until=None):
+    """
+    Returns the statistics of ``election`` between the dates ``since`` and
+    ``until``, both included and both optional, as a dict with:
+
+    ``visitors``: the number of visitors counted.
+    ``estimated_visitors``: the number of visitors, sampled or not.
+    ``days``: ``(date, visitors)`` for every day with visitors.
+    ``questions``: for every question of ``snapshot``, a dict with the
+    ``question``, its ``average_importance``, the ``unanswered`` count and
+    ``answers``, a list of ``(answer, visitors)``.
+    ``winners``: ``(candidate, visitors)`` for every candidate, most chosen
+    first.
+
+    Answer and winner counts are of the visitors counted: scale them by
+    ``estimated_visitors / visitors`` to estimate them for all visitors.
+
+    It takes three queries, whatever the number of visitors.
+    """
+    using = router.db_for_read(ElectionDayRollup)
+
+    def between(queryset):
+        queryset = queryset.using(using).filter(election=election)
+        if since is not None:
+            queryset = queryset.filter(date__gte=since)
+        if until is not None:
+            queryset = queryset.filter(date__lte=until)
+        return queryset
+
+    days = []
+    estimated_visitors = 0
+    for date, visitors, estimate in between(ElectionDayRollup.objects).order_by('date')\
+            .values_list('date', 'visitors', 'estimated_visitors'):
+        days.append((date, visitors))
+        # Days counted before sampling existed have no estimate.
+        estimated_visitors += estimate or visitors
+
+    totals = {}
+    for question_id, answer_id, visitors, importance_sum in between(AnswerDayRollup.objects)\
+            .values_list('question', 'answer').annotate(Sum('visitors'), Sum('importance_sum')).order_by():
+        totals[(question_id, answer_id)] = (visitors, importance_sum)
+    questions = []
+    for position, question in enumerate(snapshot.questions):
+        visitors, importance_sum = totals.get((question.pk, None), (0, 0))
+        unanswered = visitors
+        answers = []
+        for answer in snapshot.answers[position]:
+            answer_visitors, answer_importance_sum = totals.get((question.pk, answer.pk), (0, 0))
+            answers.append((answer, answer_visitors))
+            visitors += answer_visitors
+            importance_sum += answer_importance_sum
+        questions.append({
+            'question': question,
+            'answers': answers,
+            'unanswered': unanswered,
+            'average_importance': visitors and float(importance_sum) / visitors or 0,
+        })
+
+    counts = dict(between(WinnerDayRollup.objects).values_list('candidate').annotate(Sum('visitors')).order_by())
+    winners = [(candidate, counts.get(candidate.pk, 0)) for candidate in snapshot.candidates]
+    winners.sort(key=lambda winner: -winner[1])
+
+    return {
+        'visitors': sum([visitors for date, visitors in days]),
+        'estimated_visitors': int(round(estimated_visitors)),
+        'days': days,
+        'questions': questions,
+        'winners': winners,
+    }
+
+
+def crowd_comparison(snapshot, score_and_candidate):
+    """
+    Compares the scores a visitor got with a candidate, a
+    ``[global_score, category_scores, candidate]`` item of a ranking, with
+    the scores of everyone else. Returns, overall and then for every category
+    of ``snapshot`` with visitors, a dict with:
+
+    ``category``: the category, None overall.
+    ``score``: the visitor's score.
+    ``visitors``: the number of visitors counted.
+    ``below``: the percentage of them with a lower bucket than the visitor.
+    ``buckets``: ``(lowest score, visitors, height, mine)`` for every bucket,
+    the height as a percentage of the fullest bucket and ``mine`` set on the
+    visitor's bucket.
+
+    It takes one query.
+    """
+    score, category_scores, candidate = score_and_candidate
+    histograms = ScoreHistogram.objects.using(router.db_for_read(ScoreHistogram)).filter(candidate=candidate.pk)
+    histograms = dict((histogram.category_id, histogram) for histogram in histograms)
+    comparisons = []
+    for category, category_score in [(None, score)] + list(zip(snapshot.categories, category_scores)):
+        histogram = histograms.get(category and category.pk)
+        if histogram is None:
+            continue
+        buckets = histogram.buckets()
+        visitors = sum(buckets)
+        if not visitors:
+            continue
+        highest = max(buckets)
+        mine = score_bucket(category_score)
+        comparisons.append({
+            'category': category,
+            'score': category_score,
+            'visitors': visitors,
+            'below': sum(buckets[:mine]) * 100 // visitors,
+            'buckets': [(bucket * 100 // HISTOGRAM_BUCKETS, count, count * 100 // highest, bucket == mine)
+                        for bucket, count in enumerate(buckets)],
+        })
+    return comparisons
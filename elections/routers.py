@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Database routing for media naranja visitor analytics.
+
+``AnalyticsRouter`` sends the visitors, their answers and scores, packed
+visitors, the daily rollups and the score histograms to the
+``MEDIANARANJA_ANALYTICS_DATABASE`` alias, ``analytics`` by default, so the
+writes of a busy election night don't compete with the editors and the
+public pages on the main database. To use it, add that alias to
+``DATABASES`` and::
+
+    DATABASE_ROUTERS = ['elections.routers.AnalyticsRouter']
+
+then create its tables with ``manage.py syncdb --database=analytics``.
+
+Analytics rows point to elections, questions, answers and candidates by id
+only: they can be filtered by them, but not joined with them.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+ANALYTICS_MODELS = ('visitor', 'visitoranswer', 'visitorscore', 'categoryscore', 'analyticstext',
+                    'packedvisitor', 'electiondayrollup', 'answerdayrollup', 'winnerdayrollup', 'scorehistogram')
+
+
+def is_analytics(model):
+    return model._meta.app_label == 'elections' and model._meta.object_name.lower() in ANALYTICS_MODELS
+
+
+class AnalyticsRouter(object):
+
+    def __init__(self):
+        self.database = getattr(settings, 'MEDIANARANJA_ANALYTICS_DATABASE', 'analytics')
+
+    def db_for_read(self, model, **hints):
+        if is_analytics(model):
+            return self.database
+        # Otherwise the election of a visitor would be looked up in the
+        # visitor's database.
+        instance = hints.get('instance')
+        if instance is not None and is_analytics(instance.__class__):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if is_analytics(model):
+            return self.database
+        instance = hints.get('instance')
+        if instance is not None and is_analytics(instance.__class__):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_analytics(obj1.__class__) or is_analytics(obj2.__class__):
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        # The main database keeps empty analytics tables, which cascades
+        # from elections, questions and candidates look into.
+        if db == self.database:
+            return is_analytics(model)
+        return None
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Media naranja scoring engine.
+
+``ScoreMatrix`` reads an election's ``QuizSnapshot`` as a candidate x question
+matrix of answer ids plus a question -> category index, and scores every
+candidate against a visitor's answers in a single pass over that matrix.
+
+``rank_candidates`` puts a cache in front of it: many visitors submit the
+same answers and importances, so rankings are stored under a key made of the
+snapshot version and the normalized answer vector.
+
+``ScoreAccumulator`` keeps the same per category sums for a questionnaire
+answered one category per step.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from elections.snapshot import get_quiz_snapshot
+
+
+# Rankings go to their own cache alias when one is configured, so they can be
+# given their own size limit; the backend evicts old entries.
+result_cache = get_cache(getattr(settings, 'MEDIANARANJA_RESULT_CACHE', 'default'))
+RESULT_CACHE_TIMEOUT = getattr(settings, 'MEDIANARANJA_RESULT_CACHE_TIMEOUT', 60 * 60)
+
+
+class ScoreMatrix(object):
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.candidates = snapshot.candidates
+        self.categories = snapshot.categories
+        self.question_ids = [question.pk for question in snapshot.questions]
+        self.question_categories = snapshot.question_categories
+        # answers[candidate][question] is the answer id the candidate chose,
+        # or None. Candidate.associate_answer keeps one answer per question.
+        self.answers = snapshot.candidate_answers
+
+    @classmethod
+    def for_election(cls, election):
+        return cls(get_quiz_snapshot(election))
+
+    def importances_by_category(self, importances):
+        importances_by_category = [0.0] * len(self.categories)
+        for position, importance in enumerate(importances):
+            importances_by_category[self.question_categories[position]] += importance
+        return importances_by_category
+
+    def scores(self, answers, importances):
+        """
+        Scores every candidate, in ``self.candidates`` order, for a visitor.
+
+        ``answers`` holds one answer id (or None) per question and
+        ``importances`` one weight per question, both in form order. Each
+        result is a ``(global_score, category_scores)`` tuple, exactly as
+        returned by ``Candidate.get_score``.
+        """
+        answered = [(position, answer, importances[position], self.question_categories[position])
+                    for position, answer in enumerate(answers) if answer is not None]
+
+        sums = []
+        for row in self.answers:
+            sum_by_category = [0] * len(self.categories)
+            for position, answer, importance, category in answered:
+                if row[position] == answer:
+                    sum_by_category[category] += importance
+            sums.append(sum_by_category)
+        return self.scores_from_sums(sums, self.importances_by_category(importances))
+
+    def category_sums(self, category, answers, importances):
+        """
+        Returns, for every candidate, the sum of the importances of the
+        questions of ``category`` the candidate answered like the visitor:
+        one column of ``Candidate.get_sum_importances_by_category``.
+
+        ``answers`` and ``importances`` only need to be filled in for the
+        questions of ``category``.
+        """
+        answered = [(position, answers[position], importances[position])
+                    for position, question_category in enumerate(self.question_categories)
+                    if question_category == category and answers[position] is not None]
+        sums = []
+        for row in self.answers:
+            total = 0
+            for position, answer, importance in answered:
+                if row[position] == answer:
+                    total += importance
+            sums.append(total)
+        return sums
+
+    def scores_from_sums(self, sums, importances_by_category):
+        """
+        Turns per candidate, per category sums of matching importances and the
+        importance total of every category into ``scores`` results.
+        """
+        total_importance = sum(importances_by_category)
+        scores = []
+        for sum_by_category in sums:
+            scores_by_category = []
+            for i in range(len(sum_by_category)):
+                if importances_by_category[i] != 0:
+                    scores_by_category.append(sum_by_category[i] * 100.0 / importances_by_category[i])
+                else:
+                    scores_by_category.append(0)
+            if total_importance != 0:
+                scores.append((sum(sum_by_category) * 100.0 / total_importance, scores_by_category))
+            else:
+                scores.append((0, scores_by_category))
+        return scores
+
+    def rank(self, answers, importances):
+        """
+        Returns ``[global_score, category_scores, candidate]`` lists sorted from
+        the best to the worst match.
+        """
+        return self.rank_scores(self.scores(answers, importances))
+
+    def rank_scores(self, scores):
+        # Ties are broken by the category scores, in category order, and then
+        # by the order of the candidates, as MediaNaranja.rank does in the
+        # browser.
+        def sort_key(position):
+            global_score, category_scores = scores[position]
+            return -global_score, [-category_score for category_score in category_scores], position
+        return [[scores[position][0], scores[position][1], self.candidates[position]]
+                for position in sorted(range(len(scores)), key=sort_key)]
+
+
+class ScoreAccumulator(object):
+    """
+    Running scores of a media naranja answered one category per step.
+
+    For every candidate it keeps the sum of the importances of the questions
+    answered like the visitor, category by category, together with the
+    importance total of every category: the same quantities as
+    ``Candidate.get_sum_importances_by_category`` and
+    ``Candidate.get_importances_by_category``. Each step fills in one column,
+    so ranking at the end only takes one pass over the candidates.
+
+    It is kept in the visitor's session and is only valid for the snapshot
+    ``version`` it was started on.
+    """
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        # Only categories with questions are asked, one per step.
+        self.categories = sorted(set(snapshot.question_categories))
+        self.answered = set()
+        self.answers = [None] * len(snapshot.questions)
+        self.importances = [0] * len(snapshot.questions)
+        self.sums = [[0] * len(snapshot.categories) for candidate in snapshot.candidates]
+        self.importances_by_category = [0] * len(snapshot.categories)
+        self.recorded = False
+
+    def steps(self):
+        return len(self.categories)
+
+    def category(self, step):
+        """
+        Returns the category index asked at ``step``, counted from 1.
+        """
+        return self.categories[step - 1]
+
+    def add(self, matrix, step, answers, importances):
+        """
+        Stores the answers given at ``step``. Answering a step again replaces
+        what was stored for it.
+        """
+        category = self.category(step)
+        positions = [position for position, question_category in enumerate(matrix.question_categories)
+                     if question_category == category]
+        for position in positions:
+            self.answers[position] = answers[position]
+            self.importances[position] = importances[position]
+        for row, total in zip(self.sums, matrix.category_sums(category, self.answers, self.importances)):
+            row[category] = total
+        self.importances_by_category[category] = sum([self.importances[position] for position in positions])
+        self.answered.add(step)
+        self.recorded = False
+
+    def next_step(self):
+        """
+        Returns the first step still to be answered, or None.
+        """
+        for step in range(1, self.steps() + 1):
+            if step not in self.answered:
+                return step
+        return None
+
+    def rank(self, matrix):
+        return matrix.rank_scores(matrix.scores_from_sums(self.sums, self.importances_by_category))
+
+
+def ranking_cache_key(snapshot, answers, importances):
+    vector = []
+    for answer, importance in zip(answers, importances):
+        vector.append('%d:%d' % (answer or 0, importance))
+    digest = hashlib.md5(','.join(vector)).hexdigest()
+    return 'elections:ranking:%d:%s:%s' % (snapshot.election_id, snapshot.version, digest)
+
+
+def rank_candidates(snapshot, answers, importances):
+    """
+    Same as ``ScoreMatrix(snapshot).rank(answers, importances)``, served from
+    the result cache when somebody already submitted the same answers to the
+    same version of the quiz.
+    """
+    key = ranking_cache_key(snapshot, answers, importances)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return [[global_score, list(category_scores), snapshot.candidates[position]]
+                for position, global_score, category_scores in cached]
+
+    scores_and_candidates = ScoreMatrix(snapshot).rank(answers, importances)
+    positions = dict((candidate.pk, position) for position, candidate in enumerate(snapshot.candidates))
+    result_cache.set(key, [(positions[candidate.pk], global_score, tuple(category_scores))
+                           for global_score, category_scores, candidate in scores_and_candidates],
+                     RESULT_CACHE_TIMEOUT)
+    return scores_and_candidates
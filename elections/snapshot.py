@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled media naranja quiz snapshots.
+
+A ``QuizSnapshot`` holds everything the media naranja reads from an election:
+its categories, questions and answers in form order, the candidates and the
+answer each candidate gave to every question. It is built with a fixed number
+of queries and kept in the cache until one of the receivers in
+``elections.models`` changes the election's ``quiz_version``.
+
+``get_quiz_bundle`` serializes a snapshot to the compact JSON document the
+embedded media naranja downloads to score candidates in the browser.
+"""
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.utils import simplejson as json
+
+from elections.models import Candidate, Question, Answer, quiz_snapshot_version, QUIZ_SNAPSHOT_TIMEOUT
+
+
+class QuizSnapshot(object):
+    def __init__(self, election_id, version, categories, questions, question_categories,
+                 answers, candidates, candidate_answers):
+        self.election_id = election_id
+        self.version = version
+        # Category instances, in display order.
+        self.categories = tuple(categories)
+        # Question instances in form order, category by category.
+        self.questions = tuple(questions)
+        # Index in ``categories`` of every question.
+        self.question_categories = tuple(question_categories)
+        # For every question, the tuple of its Answer instances.
+        self.answers = tuple(tuple(question_answers) for question_answers in answers)
+        self.candidates = tuple(candidates)
+        # candidate_answers[candidate][question] is the id of the answer the
+        # candidate gave, or None.
+        self.candidate_answers = tuple(tuple(row) for row in candidate_answers)
+        # Lookups used to resolve a submitted form without the database:
+        # question id -> position, and answer id -> (position, Answer).
+        self.question_positions = dict((question.pk, position) for position, question in enumerate(self.questions))
+        self.answer_index = {}
+        for position, question_answers in enumerate(self.answers):
+            for answer in question_answers:
+                self.answer_index[answer.pk] = (position, answer)
+
+    @classmethod
+    def build(cls, election, version=None):
+        categories = list(election.category_set.all())
+        category_index = dict((category.pk, position) for position, category in enumerate(categories))
+
+        questions_by_category = [[] for category in categories]
+        for question in Question.objects.filter(category__election=election).order_by('pk'):
+            if question.category_id in category_index:
+                position = category_index[question.category_id]
+                # Fill the foreign key cache so question.category is free.
+                question._category_cache = categories[position]
+                questions_by_category[position].append(question)
+
+        questions = []
+        question_categories = []
+        for position, category_questions in enumerate(questions_by_category):
+            questions.extend(category_questions)
+            question_categories.extend([position] * len(category_questions))
+
+        question_index = dict((question.pk, position) for position, question in enumerate(questions))
+        answers = [[] for question in questions]
+        for answer in Answer.objects.filter(question__category__election=election).order_by('pk'):
+            if answer.question_id in question_index:
+                position = question_index[answer.question_id]
+                answer._question_cache = questions[position]
+                answers[position].append(answer)
+
+        candidates = list(election.candidate_set.all())
+        candidate_index = dict((candidate.pk, position) for position, candidate in enumerate(candidates))
+        candidate_answers = [[None] * len(questions) for candidate in candidates]
+        links = Candidate.answers.through.objects.filter(candidate__election=election)
+        for candidate_id, answer_id, question_id in links.values_list('candidate', 'answer', 'answer__question'):
+            row = candidate_index.get(candidate_id)
+            column = question_index.get(question_id)
+            if row is not None and column is not None:
+                candidate_answers[row][column] = answer_id
+
+        return cls(election.pk, version, categories, questions, question_categories,
+                   answers, candidates, candidate_answers)
+
+
+def quiz_snapshot_cache_key(election_id, version):
+    return 'elections:quiz-snapshot:%d:%s' % (election_id, version)
+
+
+def get_quiz_snapshot(election):
+    """
+    Returns the cached snapshot of ``election``, building it on a miss.
+    """
+    version = quiz_snapshot_version(election.pk)
+    key = quiz_snapshot_cache_key(election.pk, version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = QuizSnapshot.build(election, version)
+        cache.set(key, snapshot, QUIZ_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def quiz_bundle(election, snapshot):
+    """
+    Returns the JSON-ready bundle of ``snapshot``.
+
+    Questions keep their form order and refer to their category by index.
+    ``matrix`` has one row per candidate with the answer id chosen for every
+    question, or null, which is all ``static/js/medianaranja.js`` needs to
+    rank candidates the same way ``elections.scoring.ScoreMatrix`` does.
+    """
+    questions = []
+    for position, question in enumerate(snapshot.questions):
+        questions.append({
+            'id': question.pk,
+            'question': question.question,
+            'category': snapshot.question_categories[position],
+            'answers': [[answer.pk, answer.caption] for answer in snapshot.answers[position]],
+        })
+    candidates = []
+    for candidate in snapshot.candidates:
+        candidates.append({
+            'id': candidate.pk,
+            'name': candidate.name,
+            'url': reverse('candidate_detail_embeded', kwargs={'username': election.owner.username,
+                                                               'election_slug': election.slug,
+                                                               'slug': candidate.slug}),
+            'photo': candidate.photo and candidate.photo.url or None,
+        })
+    return {
+        'version': snapshot.version,
+        'election': {'id': election.pk, 'name': election.name, 'slug': election.slug,
+                     'owner': election.owner.username},
+        'categories': [category.name for category in snapshot.categories],
+        'questions': questions,
+        'candidates': candidates,
+        'matrix': [list(row) for row in snapshot.candidate_answers],
+    }
+
+
+def quiz_bundle_cache_key(election_id, version):
+    return 'elections:quiz-bundle:%d:%s' % (election_id, version)
+
+
+def get_quiz_bundle(election, snapshot=None):
+    """
+    Returns the bundle of ``election`` already encoded as JSON. It is cached
+    under the snapshot version, so every partner page embedding the same
+    version of the quiz is served the same string.
+    """
+    if snapshot is None:
+        snapshot = get_quiz_snapshot(election)
+    key = quiz_bundle_cache_key(election.pk, snapshot.version)
+    content = cache.get(key)
+    if content is None:
+        content = json.dumps(quiz_bundle(election, snapshot), separators=(',', ':'))
+        cache.set(key, content, QUIZ_SNAPSHOT_TIMEOUT)
+    return content
@@ -0,0 +1,176 @@
+/*
+ * Media naranja scored in the browser.
+ *
+ * The embedded questionnaire downloads the election's quiz bundle (see
+ * elections.snapshot.quiz_bundle) and, once it is loaded, ranks the
+ * candidates here instead of posting the form. The answers are still sent to
+ * the beacon url, with the ranking shown, so they are recorded for analysis.
+ * If the bundle can't be
+ * loaded the form is posted as usual and the server ranks the candidates.
+ *
+ * MediaNaranja.scores and MediaNaranja.rank follow elections.scoring.ScoreMatrix,
+ * ties included.
+ */
+var MediaNaranja = (function($){
+
+    function scores(bundle, answers, importances){
+        var categoryCount = bundle.categories.length;
+        var importancesByCategory = [];
+        var totalImportance = 0;
+        var i, j;
+        for (i = 0; i < categoryCount; i++) {
+            importancesByCategory.push(0);
+        }
+        for (i = 0; i < importances.length; i++) {
+            importancesByCategory[bundle.questions[i].category] += importances[i];
+            totalImportance += importances[i];
+        }
+
+        var result = [];
+        for (i = 0; i < bundle.matrix.length; i++) {
+            var row = bundle.matrix[i];
+            var sumByCategory = [];
+            var sum = 0;
+            for (j = 0; j < categoryCount; j++) {
+                sumByCategory.push(0);
+            }
+            for (j = 0; j < answers.length; j++) {
+                if (answers[j] !== null && row[j] === answers[j]) {
+                    sumByCategory[bundle.questions[j].category] += importances[j];
+                    sum += importances[j];
+                }
+            }
+            var scoresByCategory = [];
+            for (j = 0; j < categoryCount; j++) {
+                scoresByCategory.push(importancesByCategory[j] !== 0 ? sumByCategory[j] * 100.0 / importancesByCategory[j] : 0);
+            }
+            result.push([totalImportance !== 0 ? sum * 100.0 / totalImportance : 0, scoresByCategory]);
+        }
+        return result;
+    }
+
+    function rank(bundle, answers, importances){
+        var candidateScores = scores(bundle, answers, importances);
+        var ranking = [];
+        for (var i = 0; i < candidateScores.length; i++) {
+            ranking.push([candidateScores[i][0], candidateScores[i][1], bundle.candidates[i], i]);
+        }
+        // Ties are broken by the category scores and then by the order of
+        // the candidates in the bundle, as ScoreMatrix.rank_scores does.
+        ranking.sort(function(a, b){
+            if (a[0] !== b[0]) {
+                return b[0] - a[0];
+            }
+            for (var j = 0; j < a[1].length; j++) {
+                if (a[1][j] !== b[1][j]) {
+                    return b[1][j] - a[1][j];
+                }
+            }
+            return a[3] - b[3];
+        });
+        return ranking;
+    }
+
+    // Reads the form the same way elections.views.post_medianaranja1 does.
+    function readForm(bundle, form){
+        var positions = {};
+        var answers = [];
+        var importances = [];
+        var i;
+        for (i = 0; i < bundle.questions.length; i++) {
+            positions[bundle.questions[i].id] = i;
+            answers.push(null);
+            importances.push(0);
+        }
+        for (i = 0; i < bundle.questions.length; i++) {
+            var position = positions[parseInt(form.find("[name='question-id-" + i + "']").val(), 10)];
+            if (position === undefined) {
+                return null;
+            }
+            importances[position] = parseInt(form.find("[name='importance-" + i + "']:checked").val(), 10) || 0;
+            var answer = parseInt(form.find("[name='question-" + i + "']:checked").val(), 10);
+            if (!isNaN(answer) && answer !== -1) {
+                answers[position] = answer;
+            }
+        }
+        return {answers: answers, importances: importances};
+    }
+
+    function percent(score){
+        var rounded = Math.round(score);
+        return $('<p/>').text(rounded + ' %').append(
+            $('<span class="percent"/>').append($('<span/>').css('width', rounded + '%')));
+    }
+
+    function photo(options, candidate, width, height){
+        return $('<img/>').attr({
+            src: candidate.photo || options.staticUrl + 'img/default-user.gif',
+            alt: candidate.name,
+            width: width,
+            height: height
+        });
+    }
+
+    function render(bundle, ranking, options){
+        var messages = options.messages;
+        var winner = ranking[0];
+        var results = $(options.results).empty();
+
+        var header = $('<header/>')
+            .append($('<div class="tit"/>').append($('<a/>').attr('href', winner[2].url).append(
+                $('<h2/>').text(messages.winner.replace('__candidate__', winner[2].name)
+                                                .replace('__score__', winner[0].toFixed(1))))))
+            .append($('<div class="globo_left"/>').text(messages.indexes));
+        var categories = $('<div class="categoria_porcentaje"/>');
+        var percents = $('<div class="porcentaje"/>');
+        $.each(bundle.categories, function(i, category){
+            categories.append($('<div class="subcategory"/>').text(category));
+            percents.append(percent(winner[1][i]));
+        });
+        header.append(categories).append(percents);
+
+        results.append($('<div class="contenedor1_embeded"/>').append($('<div class="contenedor2_embeded"/>')
+            .append($('<div class="txt_intro"/>').append($('<p/>').text(messages.intro)))
+            .append($('<div class="candidatesBasicInformation wrapW"/>').css('border', '0px').append(header))
+            .append($('<div class="profileImg img_medianaranja"/>').append(photo(options, winner[2], 160, 200)))));
+
+        var others = $('<div class="contenedor2_embeded"/>').append($('<div class="globo_left"/>').text(messages.others));
+        $.each(ranking.slice(1), function(position, data){
+            var otherCategories = $('<div class="categoria_porcentaje"/>');
+            var otherPercents = $('<div class="porcentaje"/>');
+            $.each(bundle.categories, function(i, category){
+                otherCategories.append($('<p/>').text(category));
+                otherPercents.append(percent(data[1][i]));
+            });
+            others.append($('<div class="otrosporcentajes"/>').addClass(position % 2 === 0 ? 'izquierda' : 'derecha')
+                .append($('<div class="profileImg_small"/>').append(photo(options, data[2], 80, 100)))
+                .append($('<div class="otrosporcentajes_data"/>')
+                    .append($('<h6/>').append($('<a/>').attr('href', data[2].url).text(data[2].name)))
+                    .append(otherCategories)
+                    .append(otherPercents)));
+        });
+        results.append($('<div class="contenedor1_embeded"/>').append(others));
+        results.show();
+    }
+
+    function embed(options){
+        var form = $(options.form);
+        $.getJSON(options.bundleUrl, function(bundle){
+            form.submit(function(){
+                var visitor = readForm(bundle, form);
+                if (visitor === null || bundle.candidates.length === 0) {
+                    // The questionnaire changed since the page was rendered.
+                    return true;
+                }
+                var ranking = rank(bundle, visitor.answers, visitor.importances);
+                var ids = $.map(ranking, function(data){ return data[2].id; });
+                $.post(options.beaconUrl, form.serialize() + '&' + $.param({ranking: ids.join(',')}));
+                render(bundle, ranking, options);
+                form.hide();
+                return false;
+            });
+        });
+    }
+
+    return {scores: scores, rank: rank, embed: embed};
+})(jQuery);
@@ -13,4 +13,16 @@ from personal_data import *
 from question import *
 from election_embeded import *
 from election_loader import *
-from settings_variables import *
\ No newline at end of file
+from settings_variables import *
+from scoring import *
+from snapshot import *
+from benchmark import *
+from analytics import *
+from rollups import *
+from export import *
+from retention import *
+from routers import *
+from answer_matrix import *
+from election_bundle import *
+from json_pretty import *
+from media_import import *
@@ -0,0 +1,245 @@
+import datetime
+import threading
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+# Imported models
+from elections.models import Election, Visitor, VisitorAnswer, VisitorScore, CategoryScore, AnalyticsText, PackedVisitor,\
+    AnalyticsSampling, ElectionDayRollup, quiz_snapshot_version
+from elections import analytics
+from elections.analytics import AnalyticsWriter, write_visits, write_packed_visits, pack_integers, unpack_integers,\
+    get_text_ids, record_texts, pack_visit, unpack_visit, unpack_visitors, visitor_records, compact_visitors,\
+    sampling_rates, sample_visit
+from elections.bulk import bulk_insert
+
+
+def visit(election, candidates=('BarBaz', 'FooFoo'), datestamp=None):
+    return {
+        'election_id': election.pk,
+        'election_url': '/joe/barbaz',
+        'datestamp': datestamp or datetime.datetime(2012, 10, 28, 12, 0),
+        'sample_rate': 1.0,
+        'answers': [('Si', 'FooQuestion', 'FooCat', 5), ('', 'BarQuestion', 'FooCat2', 3)],
+        'scores': [(name, 50.0 * (i + 1), [('FooCat', 100.0 * i), ('FooCat2', 10.0 * i)])
+                   for i, name in enumerate(candidates)],
+    }
+
+
+class WriteVisitsTest(TestCase):
+
+    def setUp(self):
+        user, created = User.objects.get_or_create(username='joe')
+        self.election, created = Election.objects.get_or_create(name='election',
+                                                                 owner=user,
+                                                                 slug='barbaz')
+
+    def test_bulk_insert(self):
+        visitor = Visitor.objects.create(election=self.election, election_url='/joe/barbaz')
+        answers = [VisitorAnswer(visitor=visitor, answer_text='Answer %d' % i, question_text='Question',
+                                 question_category_text='Category', answer_importance=i) for i in range(5)]
+
+        self.assertNumQueries(1, bulk_insert, VisitorAnswer, answers)
+        self.assertEqual([answer.answer_importance for answer in visitor.visitoranswer_set.order_by('pk')],
+                         range(5))
+
+    def test_write_visits(self):
+        write_visits([visit(self.election), visit(self.election, candidates=('Silent',))])
+
+        first, second = Visitor.objects.order_by('pk')
+        self.assertEqual(first.datestamp, datetime.datetime(2012, 10, 28, 12, 0))
+        self.assertEqual([(answer.answer_text, answer.question_text, answer.question_category_text, answer.answer_importance)
+                          for answer in first.visitoranswer_set.order_by('pk')],
+                         [('Si', 'FooQuestion', 'FooCat', 5), ('', 'BarQuestion', 'FooCat2', 3)])
+        scores = first.visitorscore_set.order_by('pk')
+        self.assertEqual([(score.candidate_name, score.score) for score in scores], [('BarBaz', 50), ('FooFoo', 100)])
+        self.assertEqual([(category.category_name, category.category_score)
+                          for category in scores[1].categoryscore_set.order_by('pk')],
+                         [('FooCat', 100), ('FooCat2', 10)])
+        self.assertEqual(second.visitorscore_set.get().candidate_name, 'Silent')
+        self.assertEqual(CategoryScore.objects.count(), 6)
+
+    def test_write_visits_with_a_constant_number_of_queries(self):
+        records = [visit(self.election) for i in range(3)]
+        # one insert per visitor, then answers, scores, score ids and category scores
+        self.assertNumQueries(7, write_visits, records)
+
+
+class AnalyticsWriterTest(TestCase):
+
+    def setUp(self):
+        self.batches = []
+
+    def write(self, batch):
+        self.batches.append(list(batch))
+
+    def test_records_are_written_in_batches(self):
+        writer = AnalyticsWriter(write=self.write, max_size=100, batch_size=3, flush_interval=0.01)
+        for i in range(7):
+            writer.queue.put(i)
+        writer.start()
+        writer.flush()
+        writer.stop()
+
+        self.assertEqual(self.batches, [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_stop_writes_queued_records(self):
+        writer = AnalyticsWriter(write=self.write, max_size=100, batch_size=100, flush_interval=0.01)
+        for i in range(5):
+            writer.submit(i)
+        writer.stop()
+
+        self.assertEqual(sum(self.batches, []), range(5))
+        self.assertFalse(writer.thread.isAlive())
+
+    def test_full_queue_writes_synchronously(self):
+        writing = threading.Event()
+        release = threading.Event()
+        def blocked_write(batch):
+            if batch == ['first']:
+                writing.set()
+                release.wait()
+            self.write(batch)
+        writer = AnalyticsWriter(write=blocked_write, max_size=1, batch_size=1, flush_interval=0.01)
+        writer.submit('first')
+        writing.wait()
+        writer.submit('queued')
+
+        writer.submit('written by the caller')
+        self.assertEqual(self.batches, [['written by the caller']])
+        release.set()
+        writer.stop()
+
+        self.assertEqual(self.batches, [['written by the caller'], ['first'], ['queued']])
+
+    def test_errors_do_not_stop_the_worker(self):
+        def failing_write(batch):
+            if batch == ['fails']:
+                raise ValueError
+            self.write(batch)
+        writer = AnalyticsWriter(write=failing_write, max_size=100, batch_size=1, flush_interval=0.01)
+        writer.submit('fails')
+        writer.flush()
+        writer.submit('written')
+        writer.stop()
+
+        self.assertEqual(self.batches, [['written']])
+
+
+class PackedVisitorsTest(TestCase):
+
+    def setUp(self):
+        user, created = User.objects.get_or_create(username='joe')
+        self.election, created = Election.objects.get_or_create(name='election',
+                                                                 owner=user,
+                                                                 slug='barbaz')
+
+    def test_pack_integers(self):
+        self.assertEqual(unpack_integers(pack_integers([0, 1, -1, 2 ** 31 - 1])), [0, 1, -1, 2 ** 31 - 1])
+        self.assertEqual(unpack_integers(pack_integers([])), [])
+
+    def test_pack_visit(self):
+        record = visit(self.election)
+        text_ids = get_text_ids(record_texts(record))
+        texts = dict((pk, text) for text, pk in text_ids.items())
+
+        answers, scores = pack_visit(record, text_ids)
+
+        self.assertEqual(unpack_visit(answers, scores, texts), (record['answers'], record['scores']))
+
+    def test_texts_are_stored_once(self):
+        write_packed_visits([visit(self.election), visit(self.election)])
+
+        self.assertEqual(PackedVisitor.objects.count(), 2)
+        self.assertEqual(sorted(AnalyticsText.objects.values_list('text', flat=True)),
+                         sorted(['Si', '', 'FooQuestion', 'BarQuestion', 'FooCat', 'FooCat2', 'BarBaz', 'FooFoo']))
+
+    def test_unpack_visitors(self):
+        records = [visit(self.election), visit(self.election, candidates=('Silent',))]
+        write_packed_visits(records)
+
+        unpacked = unpack_visitors(PackedVisitor.objects.order_by('pk'))
+
+        self.assertEqual(unpacked, records)
+
+    def test_packed_storage(self):
+        analytics.ANALYTICS_STORAGE = 'packed'
+        try:
+            write_visits([visit(self.election)])
+        finally:
+            analytics.ANALYTICS_STORAGE = 'rows'
+
+        self.assertEqual(Visitor.objects.count(), 0)
+        self.assertEqual(unpack_visitors(PackedVisitor.objects.all()), [visit(self.election)])
+
+    def test_compact_visitors(self):
+        records = [visit(self.election), visit(self.election, candidates=('Silent',))]
+        write_visits(records)
+        self.assertEqual(visitor_records(Visitor.objects.values_list('pk', flat=True)), records)
+
+        compact_visitors(list(Visitor.objects.values_list('pk', flat=True)))
+
+        self.assertEqual(Visitor.objects.count(), 0)
+        self.assertEqual(VisitorAnswer.objects.count(), 0)
+        self.assertEqual(VisitorScore.objects.count(), 0)
+        self.assertEqual(CategoryScore.objects.count(), 0)
+        self.assertEqual(unpack_visitors(PackedVisitor.objects.order_by('pk')), records)
+
+    def test_compact_command(self):
+        write_visits([visit(self.election) for i in range(5)])
+
+        call_command('compact_visitor_analytics', batch_size=2, verbosity=0)
+
+        self.assertEqual(Visitor.objects.count(), 0)
+        self.assertEqual(PackedVisitor.objects.count(), 5)
+
+
+class SamplingTest(TestCase):
+
+    def setUp(self):
+        user, created = User.objects.get_or_create(username='joe')
+        self.election, created = Election.objects.get_or_create(name='election',
+                                                                 owner=user,
+                                                                 slug='barbaz')
+
+    def test_sampling_rates(self):
+        self.assertEqual(sampling_rates(self.election.pk), (1.0, 1.0))
+
+        sampling = AnalyticsSampling.objects.create(election=self.election, rate=0.1, rollup_rate=0.5)
+        self.assertEqual(sampling_rates(self.election.pk), (0.1, 0.5))
+        # One query for the version, and none once it is known.
+        self.assertNumQueries(1, sampling_rates, self.election.pk)
+        self.assertNumQueries(0, sampling_rates, self.election.pk, quiz_snapshot_version(self.election.pk))
+
+        sampling.rollup_rate = 0.05
+        sampling.save()
+        self.assertEqual(sampling_rates(self.election.pk), (0.1, 0.1))
+
+    def test_settings_override_the_elections(self):
+        AnalyticsSampling.objects.create(election=self.election, rate=0.1, rollup_rate=0.5)
+        analytics.ANALYTICS_SAMPLE_RATE = 0.2
+        try:
+            self.assertEqual(sampling_rates(self.election.pk), (0.2, 0.5))
+        finally:
+            analytics.ANALYTICS_SAMPLE_RATE = None
+
+    def test_sample_visit(self):
+        AnalyticsSampling.objects.create(election=self.election, rate=0.1, rollup_rate=0.5)
+
+        self.assertEqual(sample_visit(self.election.pk, draw=lambda: 0.05),
+                         {'stored': True, 'sample_rate': 0.1, 'rollup_rate': 0.5})
+        self.assertEqual(sample_visit(self.election.pk, draw=lambda: 0.3)['stored'], False)
+        self.assertEqual(sample_visit(self.election.pk, draw=lambda: 0.7), None)
+
+    def test_records_sampled_for_the_rollups_are_not_stored(self):
+        stored = visit(self.election)
+        stored.update({'question_ids': [], 'answer_ids': [], 'winner_id': None,
+                       'stored': True, 'sample_rate': 0.1, 'rollup_rate': 0.5})
+        counted = dict(stored, stored=False)
+
+        write_visits([stored, counted])
+
+        self.assertEqual(list(Visitor.objects.values_list('sample_rate', flat=True)), [0.1])
+        rollup = ElectionDayRollup.objects.get()
+        self.assertEqual((rollup.visitors, rollup.estimated_visitors), (2, 4.0))
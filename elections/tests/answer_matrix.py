@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+# Imported models
+from elections.models import Election, Candidate, Category, Question, Answer
+from elections.answer_matrix import import_answer_matrix
+from elections.management.commands.import_candidate_answers import Command
+
+
+class AnswerMatrixTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='joe', password='doe', email='joe@doe.cl')
+        self.election, created = Election.objects.get_or_create(name='election',
+                                                                 owner=user,
+                                                                 slug='barbaz')
+        self.election.category_set.all().delete()
+        category = Category.objects.create(name='FooCat', election=self.election)
+        self.question1 = Question.objects.create(question='¿Aborto?', category=category)
+        self.yes1 = Answer.objects.create(question=self.question1, caption='Sí')
+        self.no1 = Answer.objects.create(question=self.question1, caption='No')
+        self.question2 = Question.objects.create(question='¿Matrimonio igualitario?', category=category)
+        self.yes2 = Answer.objects.create(question=self.question2, caption='Sí')
+        self.no2 = Answer.objects.create(question=self.question2, caption='No')
+        self.foo = Candidate.objects.create(name='Foo', election=self.election, has_answered=False)
+        self.bar = Candidate.objects.create(name='Bar', election=self.election, has_answered=False)
+        self.bar.answers.add(self.yes1)
+        self.lines = [
+            ['\xef\xbb\xbfCandidato', '¿Aborto?', ' ¿matrimonio  igualitario? '],
+            ['Foo', 'sí', 'No'],
+            ['bar', '', 'no'],
+        ]
+
+    def test_import(self):
+        report = import_answer_matrix(self.election, self.lines)
+
+        self.assertEqual(report, {'candidates': 2, 'questions': 2, 'answers': 3, 'errors': []})
+        self.assertEqual(list(Candidate.objects.get(pk=self.foo.pk).answers.order_by('pk')), [self.yes1, self.no2])
+        self.assertEqual(list(Candidate.objects.get(pk=self.bar.pk).answers.order_by('pk')), [self.no2])
+        self.assertTrue(Candidate.objects.get(pk=self.foo.pk).has_answered)
+
+    def test_import_keeps_the_answers_to_other_questions(self):
+        report = import_answer_matrix(self.election, [['', '¿Matrimonio igualitario?'], ['Bar', 'Sí']])
+
+        self.assertEqual(report['answers'], 1)
+        self.assertEqual(list(self.bar.answers.order_by('pk')), [self.yes1, self.yes2])
+
+    def test_import_takes_a_constant_number_of_queries(self):
+        # questions, answers and candidates; then the old links, their
+        # delete, the insert, the has_answered update and the new snapshot
+        # version
+        self.assertNumQueries(8, import_answer_matrix, self.election, self.lines)
+
+    def test_problems_are_reported_and_nothing_is_changed(self):
+        lines = self.lines + [['Foo', 'Sí', 'Sí'], ['Nobody', 'Sí', 'Sí'], ['Bar', 'Quizás', 'No']]
+        lines[0] = lines[0] + ['¿Pena de muerte?']
+        report = import_answer_matrix(self.election, lines)
+
+        self.assertEqual(report['errors'], [
+            u'Line 1, column 4: ¿Pena de muerte? is not a question of the election',
+            u'Line 4: Foo is repeated',
+            u'Line 5: Nobody is not a candidate of the election',
+            u'Line 6: Bar is repeated',
+        ])
+        self.assertEqual(list(self.bar.answers.all()), [self.yes1])
+        self.assertFalse(Candidate.objects.get(pk=self.foo.pk).has_answered)
+
+    def test_candidates_with_the_same_name(self):
+        Candidate.objects.create(name=' foo', election=self.election)
+        report = import_answer_matrix(self.election, self.lines)
+
+        self.assertEqual(report['errors'], [u'Line 2: there are 2 candidates Foo'])
+        self.assertEqual(self.foo.answers.count(), 0)
+
+    def test_text_that_is_not_utf8(self):
+        report = import_answer_matrix(self.election, [self.lines[0], ['Foo', 'S\xed', 'No']])
+        self.assertEqual(report['errors'], [u'Line 2: the text is not UTF-8'])
+        self.assertEqual(self.foo.answers.count(), 0)
+
+        report = import_answer_matrix(self.election, [['Candidato', '\xbfAborto?']])
+        self.assertEqual(report['errors'], [u'Line 1: the text is not UTF-8'])
+
+    def test_unknown_answer(self):
+        report = import_answer_matrix(self.election, [self.lines[0], ['Foo', 'Quizás', '']])
+
+        self.assertEqual(report['errors'], [u'Line 2, column 2: Quizás is not an answer to ¿Aborto?'])
+        self.assertEqual(self.foo.answers.count(), 0)
+
+    def test_dry_run(self):
+        report = import_answer_matrix(self.election, self.lines, dry_run=True)
+
+        self.assertEqual(report['answers'], 3)
+        self.assertEqual(self.foo.answers.count(), 0)
+
+    def test_command(self):
+        handle, path = tempfile.mkstemp()
+        os.write(handle, '\n'.join([','.join(line) for line in self.lines]))
+        os.close(handle)
+        try:
+            call_command('import_candidate_answers', 'joe', 'barbaz', path, verbosity=0)
+            self.assertEqual(self.foo.answers.count(), 2)
+
+            os.remove(path)
+            handle, path = tempfile.mkstemp()
+            os.write(handle, 'Candidato,¿Aborto?\nNobody,Sí\n')
+            os.close(handle)
+            self.assertRaises(CommandError, Command().handle, 'joe', 'barbaz', path)
+        finally:
+            os.remove(path)
@@ -0,0 +1,57 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils import simplejson as json
+
+from elections.benchmark import build_synthetic_election, run_benchmark, measure
+
+
+class MediaNaranjaBenchmarkTest(TestCase):
+
+    def setUp(self):
+        self.user, created = User.objects.get_or_create(username='joe')
+
+    def test_build_synthetic_election(self):
+        election = build_synthetic_election(self.user, candidates=3, categories=2, questions=2, answers=3)
+
+        self.assertEqual(election.candidate_set.count(), 3)
+        self.assertEqual(election.category_set.count(), 2)
+        for candidate in election.candidate_set.all():
+            self.assertEqual(candidate.answers.count(), 4)
+            self.assertEqual(len(set(answer.question_id for answer in candidate.answers.all())), 4)
+
+    def test_measure(self):
+        result = measure(lambda: list(User.objects.all()), repeat=2)
+
+        self.assertEqual(result['runs'], 2)
+        self.assertEqual(result['queries'], 1)
+        self.assertTrue(result['wall_time']['min'] <= result['wall_time']['max'])
+
+    def results_by_name(self, report):
+        return dict(((result['name'], result['snapshot']), result) for result in report['results'])
+
+    def test_report(self):
+        election = build_synthetic_election(self.user, candidates=3, categories=2, questions=2, answers=2)
+
+        report = json.loads(json.dumps(run_benchmark(election, repeat=1)))
+
+        self.assertEqual(report['election'], {'candidates': 3, 'categories': 2, 'questions': 4, 'answers': 8})
+        results = self.results_by_name(report)
+        self.assertEqual(sorted(results.keys()), sorted([
+            ('get_medianaranja1', 'cold'), ('get_medianaranja1', 'warm'),
+            ('post_medianaranja1', 'cold'), ('post_medianaranja1', 'warm'),
+            ('medianaranja2', 'cold'), ('medianaranja2', 'warm'),
+            ('Candidate.get_score', None),
+        ]))
+
+    def test_questionnaire_query_counts_do_not_grow_with_the_election(self):
+        small = build_synthetic_election(self.user, candidates=2, categories=1, questions=1, answers=2)
+        large = build_synthetic_election(self.user, candidates=6, categories=3, questions=3, answers=2)
+
+        small_results = self.results_by_name(run_benchmark(small, repeat=1))
+        large_results = self.results_by_name(run_benchmark(large, repeat=1))
+
+        for snapshot in ('cold', 'warm'):
+            self.assertEqual(small_results[('get_medianaranja1', snapshot)]['queries'],
+                             large_results[('get_medianaranja1', snapshot)]['queries'])
+        # The election and its snapshot version.
+        self.assertEqual(large_results[('get_medianaranja1', 'warm')]['queries'], 2)
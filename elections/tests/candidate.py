@@ -304,6 +304,36 @@ class CandidateModelTest(TestCase):
         expected_result = candidate1.get_answers_two_candidates(candidate2, category)
         self.assertEqual(real_result, expected_result)
 
+    def test_get_answers_two_candidates_queries(self):
+        candidate1 = Candidate.objects.create(name='Juan Candidato',
+                                            election=self.election)
+        candidate2 = Candidate.objects.create(name='Mario Candidato',
+                                            election=self.election)
+        category = Category.objects.create(name='FooCat', election=self.election, slug='foo-cat')
+        other_category = Category.objects.create(name='BarCat', election=self.election, slug='bar-cat')
+        expected_result = []
+        for number in range(5):
+            question = Question.objects.create(question='FooQuestion%d' % number, category=category)
+            answer1 = Answer.objects.create(question=question, caption='Yes')
+            answer2 = Answer.objects.create(question=question, caption='No')
+            candidate1.associate_answer(answer1)
+            if number % 2:
+                candidate2.associate_answer(answer2)
+                expected_result.append((question, answer1, answer2))
+            else:
+                expected_result.append((question, answer1, "no answer"))
+        other_question = Question.objects.create(question='BarQuestion', category=other_category)
+        other_answer = Answer.objects.create(question=other_question, caption='Yes')
+        candidate2.associate_answer(other_answer)
+
+        # The questions, and the answers of both candidates to them.
+        results = []
+        self.assertNumQueries(2, lambda: results.append(candidate1.get_answers_two_candidates(candidate2, category)))
+        self.assertEqual(results[0], expected_result)
+        self.assertEqual(candidate2.get_all_answers_by_category(other_category),
+                         [(other_question, other_answer)])
+        self.assertEqual(candidate1.get_all_answers_by_category(other_category), [(other_question, "no answer")])
+
 
 class CandidateDetailViewTest(TestCase):
     def setUp(self):
@@ -471,6 +471,7 @@ class ElectionCompareViewTest(TestCase):
                                                'second_candidate_slug': second_candidate.slug,
                                                'category_slug': category}))
         self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.context['answers'], [])
 
     def test_compare_one_candidate_two_times(self):
         user = User.objects.create(username='foobar')
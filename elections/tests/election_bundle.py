@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+# Imported models
+from elections.models import Election, Candidate, Category, Question, Answer, PersonalData, BackgroundCategory,\
+    Background, BackgroundCandidate, Link
+from elections.election_bundle import election_bundle, import_election_bundle
+
+
+class ElectionBundleTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='joe', password='doe', email='joe@doe.cl')
+        self.other_user = User.objects.create_user(username='jane', password='doe', email='jane@doe.cl')
+        self.election, created = Election.objects.get_or_create(name='election',
+                                                                 owner=self.user,
+                                                                 slug='barbaz',
+                                                                 description=u'Elección de prueba')
+        self.election.category_set.all().delete()
+        self.election.personaldata_set.all().delete()
+        self.election.backgroundcategory_set.all().delete()
+        category = Category.objects.create(name='FooCat', election=self.election, order=2)
+        question = Question.objects.create(question=u'¿Aborto?', category=category)
+        self.yes = Answer.objects.create(question=question, caption=u'Sí')
+        Answer.objects.create(question=question, caption='No')
+        Category.objects.create(name='Empty', election=self.election, order=1)
+        party = PersonalData.objects.create(label='Partido', election=self.election)
+        background = Background.objects.create(name='Estudios', category=BackgroundCategory.objects.create(
+            name='Otros', election=self.election))
+        self.candidate = Candidate.objects.create(name=u'Ñandú', election=self.election, has_answered=False)
+        self.candidate.answers.add(self.yes)
+        self.candidate.add_personal_data(party, 'IND')
+        BackgroundCandidate.objects.create(candidate=self.candidate, background=background, value='Derecho')
+        Link.objects.create(candidate=self.candidate, name='@nandu', url='https://twitter.com/nandu')
+        Candidate.objects.create(name='Other', election=self.election)
+
+    def test_bundle_takes_a_constant_number_of_queries(self):
+        self.assertNumQueries(11, election_bundle, self.election)
+
+    def test_import_takes_a_constant_number_of_queries(self):
+        # the slug check, the election and its reading back, an insert and a
+        # read back of the new ids for categories, questions, answers,
+        # personal data, background categories, backgrounds and candidates,
+        # an insert for each of the candidates' rows and the new snapshot
+        # version
+        self.assertNumQueries(22, import_election_bundle, election_bundle(self.election), self.other_user)
+
+    def test_import(self):
+        election = import_election_bundle(election_bundle(self.election), self.other_user)
+
+        self.assertEqual((election.owner, election.slug, election.description),
+                         (self.other_user, 'barbaz', u'Elección de prueba'))
+        self.assertEqual([(category.name, category.order) for category in election.category_set.order_by('pk')],
+                         [('FooCat', 2), ('Empty', 1)])
+        question = Question.objects.get(category__election=election)
+        self.assertEqual([answer.caption for answer in question.answer_set.order_by('pk')], [u'Sí', 'No'])
+        self.assertEqual(list(election.personaldata_set.values_list('label', flat=True)), ['Partido'])
+        self.assertEqual(list(Background.objects.filter(category__election=election).values_list('name', flat=True)),
+                         ['Estudios'])
+        candidate = election.candidate_set.get(name=u'Ñandú')
+        self.assertNotEqual(candidate.pk, self.candidate.pk)
+        self.assertEqual(candidate.slug, self.candidate.slug)
+        self.assertFalse(candidate.has_answered)
+        self.assertEqual(list(candidate.answers.all()), [question.answer_set.get(caption=u'Sí')])
+        self.assertEqual(candidate.get_personal_data, {'Partido': 'IND'})
+        self.assertEqual(candidate.backgroundcandidate_set.get().background.category.election, election)
+        self.assertEqual(list(candidate.link_set.values_list('name', 'url')), [('@nandu', 'https://twitter.com/nandu')])
+        self.assertEqual(election.candidate_set.count(), 2)
+
+    def test_import_leaves_the_original_alone(self):
+        import_election_bundle(election_bundle(self.election), self.user, slug='copy')
+
+        self.assertEqual(list(self.candidate.answers.all()), [self.yes])
+        self.assertEqual(Election.objects.filter(owner=self.user, name='election').count(), 2)
+        self.assertEqual(Category.objects.filter(election__owner=self.user, name='FooCat').count(), 2)
+
+    def test_import_errors(self):
+        bundle = election_bundle(self.election)
+        self.assertRaises(ValueError, import_election_bundle, bundle, self.user)
+        self.assertRaises(ValueError, import_election_bundle, {'format': 'other'}, self.other_user)
+        bundle['version'] = 1000
+        self.assertRaises(ValueError, import_election_bundle, bundle, self.other_user)
+
+    def test_commands(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'barbaz.json.gz')
+            call_command('export_election_bundle', 'joe', 'barbaz', path)
+            call_command('import_election_bundle', 'jane', path, slug='copy', verbosity=0)
+        finally:
+            shutil.rmtree(directory)
+
+        election = Election.objects.get(owner=self.other_user, slug='copy')
+        self.assertEqual(election.candidate_set.get(name=u'Ñandú').answers.count(), 1)
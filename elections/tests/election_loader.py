@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 
 
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.test import TestCase, TransactionTestCase
 from elections.management.commands.elections_loader import *
 from django.contrib.auth.models import User
 
@@ -129,7 +134,7 @@ class ElectionLoaderIntegrationTestCase(TestCase):
 		command.handle(self.user.username
 			,'elections/tests/media/candidatos.csv'
 			, 'elections/tests/media/questions.csv'
-			, 'elections/tests/media/style.css')
+			, 'elections/tests/media/style.css', verbosity=0)
 		reader = open('elections/tests/media/style.css', 'rb')
 		style = reader.read()
 		self.assertEquals(Election.objects.count(),5)
@@ -322,4 +327,326 @@ class ElectionLoaderTestCase(TestCase):
 
 		self.assertEquals(second_category_questions[0].answer_set.count(), 2)
 		self.assertEquals(second_category_questions[0].answer_set.all()[0].caption, u"respuesta 3")
-		self.assertEquals(second_category_questions[0].answer_set.all()[1].caption, u"respuesta 4")
\ No newline at end of file
+		self.assertEquals(second_category_questions[0].answer_set.all()[1].caption, u"respuesta 4")
+
+
+class BulkElectionLoaderTestCase(TestCase):
+	def setUp(self):
+		self.lines = [
+			["category","la categoria1"],
+			["question","la pregunta1"],
+			["answer","respuesta 1"],
+			["answer","respuesta 2"],
+		]
+		self.candidates = [
+			["Algarrobo", "BORIS COLJA", "IND", "pacto wena onda amigui", "SI", "20", "1900-1990", "2008",
+			 "http://www.facebook.com/boris-colja", "boris"],
+			["Algarrobo", "Fiera", "NO SOY IND", "pacto wena onda amigui", "NO", "0", "", "", "", "fieraferoz"],
+			["Algarrobo", "Fiera!", "PS", "otro pacto", "NO", "0", "", "", "", ""],
+		]
+		self.user = User.objects.create_user(username='ciudadanointeligente',
+                                                password='fci',
+                                                email='fci@ciudadanointeligente.cl')
+		self.loader = Loader('ciudadanointeligente', self.lines, u"un estilo")
+
+	def test_load_election(self):
+		candidates = self.loader.loadElection(self.candidates)
+		election = Election.objects.get(name=u"Algarrobo")
+
+		self.assertEquals([candidate.name for candidate in candidates], [u"BORIS COLJA", u"Fiera", u"Fiera!"])
+		self.assertEquals(election.candidate_set.count(), 3)
+		self.assertEquals(sorted(election.candidate_set.values_list('slug', flat=True)),
+						  [u"boris-colja", u"fiera", u"fiera1"])
+		boris = Candidate.objects.get(name=u"BORIS COLJA", election=election)
+		self.assertFalse(boris.has_answered)
+		self.assertEquals(boris.get_personal_data[u'Partido'], u'IND')
+		self.assertEquals(boris.get_personal_data[u'Períodos como alcalde'], u'1900-1990')
+		self.assertEquals(boris.link_set.count(), 2)
+		self.assertEquals(boris.backgroundcandidate_set.get().value, u"Sin aclaraciones")
+		self.assertEquals(Candidate.objects.get(name=u"Fiera!", election=election).link_set.count(), 0)
+		self.assertEquals(election.personaldata_set.count(), 6)
+
+	def test_load_election_takes_a_constant_number_of_queries(self):
+		self.loader.loadElection(self.candidates[:1])
+		# The election, its personal data and background are cached: one
+		# query for the candidates, one insert and one read back for the new
+		# ones, and an insert for each of personal data, backgrounds and
+		# links, plus a select and a delete for the personal data of the
+		# candidate that already existed, and the new snapshot version.
+		self.assertNumQueries(9, self.loader.loadElection, self.candidates)
+
+	def test_reloading_a_candidate_replaces_its_personal_data(self):
+		self.loader.loadElection(self.candidates)
+		line = list(self.candidates[0])
+		line[2] = "PPD"
+		Loader('ciudadanointeligente', self.lines, u"un estilo").loadElection([line])
+
+		election = Election.objects.get(name=u"Algarrobo")
+		boris = Candidate.objects.get(name=u"BORIS COLJA", election=election)
+		self.assertEquals(election.candidate_set.count(), 3)
+		self.assertEquals(len(boris.get_personal_data), 6)
+		self.assertEquals(boris.get_personal_data[u'Partido'], u'PPD')
+		self.assertEquals(election.personaldata_set.filter(label=u"Partido").count(), 1)
+
+	def test_process_candidates_loads_an_election_at_a_time(self):
+		lines = self.candidates + [["otra comuna", "PRUEBA2", "IND", "", "NO", "0", "", "", "", ""]]
+		processCandidates(self.user.username, iter(lines), self.lines, u"un estilo")
+
+		self.assertEquals(Election.objects.get(name=u"Algarrobo").candidate_set.count(), 3)
+		self.assertEquals(Election.objects.get(name=u"otra comuna").candidate_set.count(), 1)
+		self.assertEquals(Election.objects.get(name=u"otra comuna").category_set.count(), 1)
+
+
+
+class ResumableElectionLoaderTestCase(TransactionTestCase):
+	def setUp(self):
+		self.questions = [
+			["category","la categoria1"],
+			["question","la pregunta1"],
+			["answer","respuesta 1"],
+		]
+		self.candidates = [
+			["Algarrobo", "BORIS COLJA", "IND", "", "SI", "20", "", "", "", ""],
+			["Algarrobo", "Fiera", "IND", "", "NO", "0", "", "", "", ""],
+			[],
+			["otra comuna", "PRUEBA2", "IND", "", "NO", "0", "", "", "", ""],
+		]
+		self.user = User.objects.create_user(username='ciudadanointeligente',
+                                                password='fci',
+                                                email='fci@ciudadanointeligente.cl')
+		self.directory = tempfile.mkdtemp()
+		self.checkpoint_path = os.path.join(self.directory, 'checkpoint')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_reports_progress_after_every_election(self):
+		reports = []
+		def progress(election_name, status, totals):
+			reports.append((election_name, status, totals['rows']))
+		totals = processCandidates(self.user.username, iter(self.candidates), self.questions, u"", None, progress)
+
+		self.assertEquals(reports, [(u"Algarrobo", u"2 candidates", 2), (u"otra comuna", u"1 candidates", 3)])
+		self.assertEquals(totals['elections'], 2)
+		self.assertEquals(totals['candidates'], 3)
+		self.assertEquals(totals['skipped'], 0)
+
+	def test_checkpoint_records_the_loaded_elections(self):
+		processCandidates(self.user.username, iter(self.candidates), self.questions, u"",
+						  Checkpoint(self.checkpoint_path))
+
+		checkpoint = Checkpoint(self.checkpoint_path)
+		self.assertTrue(u"Algarrobo" in checkpoint)
+		self.assertTrue(u"otra comuna" in checkpoint)
+		self.assertFalse(u"COMUNA1" in checkpoint)
+
+	def test_bad_line_stops_the_load_and_resumes_after_the_last_election(self):
+		lines = self.candidates[:3] + [["otra comuna", "PRUEBA2", "IND"]] + self.candidates[3:]
+		self.assertRaises(CommandError, processCandidates, self.user.username, iter(lines), self.questions,
+						  u"", Checkpoint(self.checkpoint_path))
+
+		self.assertEquals(Election.objects.get(name=u"Algarrobo").candidate_set.count(), 2)
+		self.assertFalse(Election.objects.filter(name=u"otra comuna").exists())
+		self.assertFalse(u"otra comuna" in Checkpoint(self.checkpoint_path))
+
+		totals = processCandidates(self.user.username, iter(self.candidates), self.questions, u"",
+								   Checkpoint(self.checkpoint_path))
+		self.assertEquals(totals['skipped'], 1)
+		self.assertEquals(totals['elections'], 1)
+		self.assertEquals(Election.objects.get(name=u"Algarrobo").candidate_set.count(), 2)
+		self.assertEquals(Election.objects.get(name=u"otra comuna").candidate_set.count(), 1)
+
+	def test_checkpoint_keeps_loading_an_election_until_all_of_its_lines_are(self):
+		lines = [self.candidates[0], self.candidates[3], self.candidates[1]]
+		totals = processCandidates(self.user.username, iter(lines), self.questions, u"",
+								   Checkpoint(self.checkpoint_path))
+
+		self.assertEquals(totals['skipped'], 0)
+		self.assertEquals(totals['elections'], 2)
+		self.assertEquals(totals['candidates'], 3)
+		self.assertEquals(sorted(Election.objects.get(name=u"Algarrobo").candidate_set.values_list('name', flat=True)),
+						  [u"BORIS COLJA", u"Fiera"])
+
+	def test_command_resumes_with_checkpoint(self):
+		command = Command()
+		command.stdout = StringIO()
+		command.handle(self.user.username
+			,'elections/tests/media/candidatos.csv'
+			, 'elections/tests/media/questions.csv'
+			, 'elections/tests/media/style.css', checkpoint=self.checkpoint_path)
+		self.assertTrue(u"COMUNA1: 2 candidates" in command.stdout.getvalue())
+
+		command.stdout = StringIO()
+		command.handle(self.user.username
+			,'elections/tests/media/candidatos.csv'
+			, 'elections/tests/media/questions.csv'
+			, 'elections/tests/media/style.css', checkpoint=self.checkpoint_path)
+		self.assertTrue(u"COMUNA1: already loaded" in command.stdout.getvalue())
+		self.assertTrue(u"0 elections and 0 candidates loaded, 2 elections skipped" in command.stdout.getvalue())
+		self.assertEquals(Election.objects.get(name=u"COMUNA1").candidate_set.count(), 2)
+
+
+
+class ParallelElectionLoaderTestCase(TestCase):
+	def setUp(self):
+		self.questions = [
+			["category","la categoria1"],
+			["question","la pregunta1"],
+			["answer","respuesta 1"],
+		]
+		self.user = User.objects.create_user(username='ciudadanointeligente',
+                                                password='fci',
+                                                email='fci@ciudadanointeligente.cl')
+
+	def test_election_groups_merge_the_lines_of_an_election(self):
+		lines = [["Algarrobo", "A"], ["otra comuna", "B"], [], ["Algarrobo", "C"]]
+
+		self.assertEquals(election_groups(lines), [
+			(u"Algarrobo", [(1, ["Algarrobo", "A"]), (4, ["Algarrobo", "C"])]),
+			(u"otra comuna", [(2, ["otra comuna", "B"])]),
+		])
+		self.assertEquals([election_name for election_name, numbered_lines in election_runs(lines)],
+						  [u"Algarrobo", u"otra comuna", u"Algarrobo"])
+
+	def test_load_in_worker_returns_the_error(self):
+		from elections.management.commands import elections_loader
+		elections_loader.worker_loader = Loader(self.user.username, self.questions, u"")
+		try:
+			election_name, loaded, changes, error = load_in_worker((u"Algarrobo", [
+				(1, ["Algarrobo", "BORIS COLJA", "IND", "", "SI", "20", "", "", "", ""]),
+			]))
+			self.assertEquals((election_name, loaded, changes, error), (u"Algarrobo", 1, {}, None))
+
+			election_name, loaded, changes, error = load_in_worker((u"otra comuna", [(7, ["otra comuna", "PRUEBA2"])]))
+			self.assertEquals((election_name, loaded), (u"otra comuna", 0))
+			self.assertTrue(error.startswith(u"Could not load otra comuna, lines 7 to 7"))
+		finally:
+			elections_loader.worker_loader = None
+
+
+
+class ReloadElectionLoaderTestCase(TestCase):
+	def setUp(self):
+		self.questions = [
+			["category","la categoria1"],
+			["question","la pregunta1"],
+			["answer","respuesta 1"],
+			["answer","respuesta 2"],
+			["question","la pregunta2"],
+			["answer","respuesta 3"],
+		]
+		self.candidates = [
+			["Algarrobo", "BORIS COLJA", "IND", "pacto", "SI", "20", "", "", "http://www.facebook.com/boris", "boris"],
+			["Algarrobo", "Fiera", "IND", "pacto", "NO", "0", "", "", "", "fieraferoz"],
+		]
+		self.user = User.objects.create_user(username='ciudadanointeligente',
+                                                password='fci',
+                                                email='fci@ciudadanointeligente.cl')
+		processCandidates(self.user.username, self.candidates, self.questions, u"un estilo")
+		self.election = Election.objects.get(name=u"Algarrobo")
+		self.boris = Candidate.objects.get(name=u"BORIS COLJA", election=self.election)
+		self.boris.answers.add(Answer.objects.get(caption=u"respuesta 1", question__category__election=self.election),
+							   Answer.objects.get(caption=u"respuesta 3", question__category__election=self.election))
+
+	def reload(self, candidates, questions, dry_run=False):
+		return processCandidates(self.user.username, candidates, questions, u"un estilo", reload=True,
+								 dry_run=dry_run)['changes']
+
+	def test_reloading_the_same_lines_changes_nothing(self):
+		changes = self.reload(self.candidates, self.questions)
+
+		self.assertEquals(changes, {})
+		self.assertEquals(self.boris.link_set.count(), 2)
+		self.assertEquals(self.boris.backgroundcandidate_set.count(), 1)
+		self.assertEquals(self.boris.answers.count(), 2)
+
+	def test_reloading_the_lines_of_an_election_apart_changes_nothing(self):
+		candidates = [self.candidates[0], ["otra comuna", "PRUEBA2", "IND", "", "NO", "0", "", "", "", ""],
+					  self.candidates[1]]
+		processCandidates(self.user.username, candidates[1:2], self.questions, u"un estilo")
+
+		self.assertEquals(self.reload(candidates, self.questions, dry_run=True), {})
+		self.assertEquals(self.reload(candidates, self.questions), {})
+		self.assertEquals(sorted(self.election.candidate_set.values_list('name', flat=True)),
+						  [u"BORIS COLJA", u"Fiera"])
+		self.assertEquals(self.boris.answers.count(), 2)
+
+	def test_reload_applies_only_the_changes(self):
+		candidates = [
+			["Algarrobo", "BORIS COLJA", "PPD", "pacto", "SI", "20", "", "", "http://www.facebook.com/boris", "colja"],
+			["Algarrobo", "Nueva", "IND", "", "NO", "0", "", "", "", ""],
+		]
+		questions = self.questions[:3] + [["answer","respuesta 4"]]
+		changes = self.reload(candidates, questions)
+
+		self.assertEquals(changes, {
+			('Answer', 'updated'): 1,
+			('Answer', 'deleted'): 1,
+			('Question', 'deleted'): 1,
+			('Candidate', 'inserted'): 1,
+			('Candidate', 'deleted'): 1,
+			('PersonalDataCandidate', 'inserted'): 6,
+			('PersonalDataCandidate', 'updated'): 1,
+			('BackgroundCandidate', 'inserted'): 1,
+			('Link', 'inserted'): 1,
+			('Link', 'deleted'): 1,
+		})
+		boris = Candidate.objects.get(pk=self.boris.pk)
+		self.assertEquals(boris.get_personal_data[u'Partido'], u'PPD')
+		self.assertEquals(sorted(boris.link_set.values_list('name', flat=True)), [u"@colja", u"BORIS COLJA"])
+		self.assertEquals([answer.caption for answer in boris.answers.all()], [u"respuesta 1"])
+		self.assertEquals(sorted(self.election.candidate_set.values_list('name', flat=True)),
+						  [u"BORIS COLJA", u"Nueva"])
+		self.assertEquals(sorted(Answer.objects.filter(question__category__election=self.election)
+								 .values_list('caption', flat=True)), [u"respuesta 1", u"respuesta 4"])
+
+	def test_reload_updates_fixed_texts_in_place(self):
+		questions = [
+			["category","la categoría1"],
+			["question","la pregunta 1"],
+			["answer","respuesta uno"],
+			["answer","respuesta 2"],
+			["question","la pregunta2"],
+			["answer","respuesta 3"],
+		]
+		self.assertEquals(self.reload(self.candidates, questions, dry_run=True), {
+			('Category', 'updated'): 1,
+			('Question', 'updated'): 1,
+			('Answer', 'updated'): 1,
+		})
+		self.assertEquals(self.reload(self.candidates, questions), {
+			('Category', 'updated'): 1,
+			('Question', 'updated'): 1,
+			('Answer', 'updated'): 1,
+		})
+
+		boris = Candidate.objects.get(pk=self.boris.pk)
+		self.assertEquals(sorted(boris.answers.values_list('caption', flat=True)), [u"respuesta 3", u"respuesta uno"])
+		self.assertEquals(boris.answers.get(caption=u"respuesta uno").question.question, u"la pregunta 1")
+		self.assertEquals(self.reload(self.candidates, questions), {})
+
+	def test_dry_run_counts_the_changes_without_making_them(self):
+		candidates = [self.candidates[0], ["Algarrobo", "Nueva", "IND", "", "NO", "0", "", "", "", "nueva"],
+					  ["otra comuna", "PRUEBA2", "IND", "", "NO", "0", "", "", "", ""]]
+		changes = self.reload(candidates, self.questions, dry_run=True)
+
+		self.assertEquals(changes[('Candidate', 'inserted')], 2)
+		self.assertEquals(changes[('Candidate', 'deleted')], 1)
+		self.assertEquals(changes[('Election', 'inserted')], 1)
+		self.assertEquals(changes[('Link', 'inserted')], 1)
+		self.assertEquals(self.election.candidate_set.count(), 2)
+		self.assertFalse(Election.objects.filter(name=u"otra comuna").exists())
+
+		self.assertEquals(self.reload(candidates, self.questions), changes)
+
+	def test_command_prints_the_changes(self):
+		command = Command()
+		command.stdout = StringIO()
+		command.handle(self.user.username
+			,'elections/tests/media/candidatos.csv'
+			, 'elections/tests/media/questions.csv'
+			, 'elections/tests/media/style.css', reload=True, dry_run=True)
+
+		self.assertTrue(u"Candidate: 4 inserted, 0 updated, 0 deleted" in command.stdout.getvalue())
+		self.assertTrue(u"Dry run, nothing was changed." in command.stdout.getvalue())
+		self.assertFalse(Election.objects.filter(name=u"COMUNA1").exists())
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import csv
+import os
+import tempfile
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.utils import simplejson as json
+
+# Imported models
+from elections.models import Election
+from elections.analytics import write_visit_rows, write_packed_visits
+from elections import export
+from elections.export import visitor_export, election_visitor_records, streamed_visitor_export
+from elections.tests.analytics import visit
+
+
+class VisitorExportTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='joe', password='doe', email='joe@doe.cl')
+        self.election, created = Election.objects.get_or_create(name='election',
+                                                                 owner=user,
+                                                                 slug='barbaz')
+        other_user = User.objects.create_user(username='jane', password='doe', email='jane@doe.cl')
+        self.other_election = Election.objects.create(name='other', owner=other_user, slug='other')
+        write_visit_rows([visit(self.election), visit(self.election, candidates=(u'Ñandú',)),
+                          visit(self.other_election)])
+        write_packed_visits([visit(self.election, candidates=('Packed',))])
+
+    def test_records_of_both_storages(self):
+        records = list(election_visitor_records(self.election, chunk_size=1))
+
+        self.assertEqual([[score[0] for score in record['scores']] for record in records],
+                         [['BarBaz', 'FooFoo'], [u'Ñandú'], ['Packed']])
+
+    def test_chunks_take_a_constant_number_of_queries(self):
+        # per chunk of rows: ids, visitors, answers, category scores and scores;
+        # per chunk of packed visitors: ids, visitors and texts; plus the two empty chunks
+        self.assertNumQueries(10, lambda: list(election_visitor_records(self.election, chunk_size=10)))
+
+    def test_csv(self):
+        rows = list(csv.reader(''.join(visitor_export(self.election, 'csv', chunk_size=2)).splitlines()))
+
+        self.assertEqual(rows[0], ['visitor', 'datestamp', 'election_url', 'sample_rate', 'type', 'category',
+                                   'question', 'answer', 'importance', 'candidate', 'score'])
+        self.assertEqual(rows[1], ['1', '2012-10-28T12:00:00', '/joe/barbaz', '1.0', 'answer', 'FooCat',
+                                   'FooQuestion', 'Si', '5', '', ''])
+        self.assertEqual(rows[3], ['1', '2012-10-28T12:00:00', '/joe/barbaz', '1.0', 'score', '', '', '', '',
+                                   'BarBaz', '50'])
+        self.assertEqual(rows[4], ['1', '2012-10-28T12:00:00', '/joe/barbaz', '1.0', 'category_score', 'FooCat',
+                                   '', '', '', 'BarBaz', '0'])
+        self.assertEqual([row[9] for row in rows if row[4] == 'score'], ['BarBaz', 'FooFoo', 'Ñandú', 'Packed'])
+        self.assertEqual(rows[-1][0], '3')
+
+    def test_json_lines(self):
+        visitors = [json.loads(line) for line in ''.join(visitor_export(self.election, 'jsonl')).splitlines()]
+
+        self.assertEqual(len(visitors), 3)
+        self.assertEqual(visitors[0]['answers'][0],
+                         {'category': 'FooCat', 'question': 'FooQuestion', 'answer': 'Si', 'importance': 5})
+        self.assertEqual(visitors[0]['scores'][1],
+                         {'candidate': 'FooFoo', 'score': 100,
+                          'categories': [{'category': 'FooCat', 'score': 100}, {'category': 'FooCat2', 'score': 10}]})
+        self.assertEqual(visitors[1]['scores'][0]['candidate'], u'Ñandú')
+        self.assertEqual(visitors[2]['visitor'], 3)
+
+    def test_streamed_export_ends_with_an_error_line(self):
+        record = list(election_visitor_records(self.election))[0]
+        def failing_records(election, chunk_size, using):
+            yield record
+            raise ValueError
+        original_records = export.election_visitor_records
+        export.election_visitor_records = failing_records
+        try:
+            lines = ''.join(streamed_visitor_export(self.election, 'csv')).splitlines()
+            # the header, the lines of the first visitor and the error
+            self.assertEqual(len(lines), 1 + len(export.csv_lines(1, record).splitlines()) + 1)
+            self.assertEqual(lines[-1], ',,,,error,,,,,,')
+
+            lines = ''.join(streamed_visitor_export(self.election, 'jsonl')).splitlines()
+            self.assertEqual(len(lines), 2)
+            self.assertTrue('error' in json.loads(lines[-1]))
+        finally:
+            export.election_visitor_records = original_records
+
+    def test_command(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            call_command('export_visitor_analytics', 'joe', 'barbaz', format='jsonl', chunk_size=1, output=path)
+            self.assertEqual(len(open(path).read().splitlines()), 3)
+        finally:
+            os.remove(path)
+
+    def test_download(self):
+        self.client.login(username='joe', password='doe')
+        response = self.client.get(reverse('election_analytics_export', kwargs={'slug': 'barbaz', 'format': 'csv'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=barbaz-visitors.csv')
+        self.assertTrue(response.content.startswith('visitor,datestamp'))
+
+    def test_download_only_for_the_owner(self):
+        self.client.login(username='joe', password='doe')
+        url = reverse('election_analytics_export', kwargs={'slug': 'other', 'format': 'jsonl'})
+
+        self.assertEqual(self.client.get(url).status_code, 404)
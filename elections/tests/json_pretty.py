@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from StringIO import StringIO
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.management import call_command
+from django.core.serializers.base import DeserializationError
+from django.utils import simplejson as json
+
+# Imported models
+from elections.models import Election, Candidate
+from serializers.json_pretty import Serializer, Deserializer
+
+
+class JSONPrettyTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='joe', password='doe', email='joe@doe.cl')
+        self.election, created = Election.objects.get_or_create(name='election',
+                                                                 owner=user,
+                                                                 slug='barbaz')
+        Candidate.objects.create(name=u'Ñandú', election=self.election)
+        Candidate.objects.create(name='Foo', election=self.election)
+        self.candidates = Candidate.objects.filter(election=self.election).order_by('pk')
+
+    def test_same_objects_as_json(self):
+        pretty = serializers.serialize('json-pretty', self.candidates, indent=4)
+
+        self.assertEqual(json.loads(pretty), json.loads(serializers.serialize('json', self.candidates)))
+        self.assertTrue(u'"name": "Ñandú"'.encode('utf-8') in pretty)
+        self.assertTrue(pretty.startswith('[\n    {\n        "'))
+        self.assertTrue(pretty.endswith('\n    }\n]'))
+        self.assertEqual(json.loads(serializers.serialize('json-pretty', self.candidates)),
+                         json.loads(pretty))
+        self.assertEqual(serializers.serialize('json-pretty', Candidate.objects.none(), indent=4), '[]')
+
+    def test_objects_are_written_as_they_are_serialized(self):
+        stream = StringIO()
+        serializer = Serializer()
+        written = []
+
+        def objects():
+            for candidate in self.candidates:
+                written.append(len(stream.getvalue()))
+                yield candidate
+        serializer.serialize(objects(), stream=stream, indent=2)
+
+        self.assertEqual(written[0], 1)
+        self.assertTrue(written[1] > 1)
+        self.assertEqual(serializer.objects, [])
+
+    def test_deserializer_reads_an_object_at_a_time(self):
+        pretty = serializers.serialize('json-pretty', self.candidates, indent=4)
+        read = StringIO(pretty)
+        objects = Deserializer(read, chunk_size=16)
+
+        first = next(objects)
+        self.assertEqual(first.object.name, u'Ñandú')
+        self.assertTrue(read.tell() < len(pretty))
+        self.assertEqual([obj.object.name for obj in objects], ['Foo'])
+        self.assertEqual([obj.object.name for obj in Deserializer(pretty.decode('utf-8'))], [u'Ñandú', 'Foo'])
+
+    def test_deserializer_errors(self):
+        item = '{"model": "elections.candidate", "pk": 1, "fields": {}}'
+        for fixture in ('', item, '[{"model": "elections.candidate"', '[%s, ]' % item, '[]]', '[%s %s]' % (item, item)):
+            self.assertRaises(DeserializationError, list, Deserializer(fixture, chunk_size=4))
+        self.assertEqual(list(Deserializer(' [ ] ')), [])
+
+    def test_dump_fixture(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            call_command('dump_fixture', 'elections.Candidate', output=path, chunk_size=1)
+            objects = list(Deserializer(open(path, 'rb')))
+        finally:
+            os.remove(path)
+
+        self.assertEqual([obj.object.pk for obj in objects], list(Candidate.objects.order_by('pk')
+                                                                   .values_list('pk', flat=True)))
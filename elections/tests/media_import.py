@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import zipfile
+
+from StringIO import StringIO
+
+from django.conf import settings
+from django.test import TestCase
+from django.contrib.auth.models import User
+from sorl.thumbnail import default, delete
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+# Imported models
+from elections.models import Election, Candidate
+from elections.media_import import import_media, PHOTO_THUMBNAILS, LOGO_THUMBNAILS
+from elections.management.commands.elections_loader import Command
+
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+
+
+class MediaImportTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='joe', password='doe', email='joe@doe.cl')
+        self.election = Election.objects.create(name='election', owner=self.user, slug='barbaz')
+        self.candidate = Candidate.objects.create(name=u'Juan Pérez', election=self.election)
+        self.other = Candidate.objects.create(name=u'Pedro', election=self.election)
+        self.media = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.media, 'barbaz'))
+        shutil.copy(os.path.join(dirname, 'media/dummy_logo.jpg'), os.path.join(self.media, 'barbaz.jpg'))
+        shutil.copy(os.path.join(dirname, 'media/dummy.jpg'), os.path.join(self.media, 'barbaz', 'juan-perez.JPG'))
+        shutil.copy(os.path.join(dirname, 'media/dummy.jpg'), os.path.join(self.media, 'barbaz', 'nadie.jpg'))
+        open(os.path.join(self.media, 'barbaz', 'notes.txt'), 'w').close()
+
+        # The fixture has elections of the first user too.
+        self.fixture_images = self.image_names()
+
+    def tearDown(self):
+        shutil.rmtree(self.media)
+        # The images and their thumbnails are written under MEDIA_ROOT.
+        for name in self.image_names() - self.fixture_images:
+            delete(name)
+
+    def image_names(self):
+        names = set(Election.objects.filter(owner=self.user).values_list('logo', flat=True))
+        names.update(Candidate.objects.filter(election__owner=self.user).values_list('photo', flat=True))
+        names.discard('')
+        return names
+
+    def thumbnail_files(self):
+        files = set()
+        for directory, directories, filenames in os.walk(os.path.join(settings.MEDIA_ROOT,
+                                                                      thumbnail_settings.THUMBNAIL_PREFIX)):
+            files.update([os.path.join(directory, filename) for filename in filenames])
+        return files
+
+    def thumbnail_count(self, name):
+        return len(default.kvstore._get(ImageFile(name).key, identity='thumbnails') or [])
+
+    def assertImported(self, report):
+        self.assertEquals(report['logos'], 1)
+        self.assertEquals(report['photos'], 1)
+        self.assertEquals(report['thumbnails'], len(PHOTO_THUMBNAILS) + len(LOGO_THUMBNAILS))
+        self.assertEquals(sorted(report['unmatched']), ['barbaz/nadie.jpg', 'barbaz/notes.txt'])
+
+        election = Election.objects.get(pk=self.election.pk)
+        candidate = Candidate.objects.get(pk=self.candidate.pk)
+        self.assertTrue(election.logo.name.startswith('logos/barbaz'))
+        self.assertTrue(candidate.photo.name.startswith('photos/barbaz-juan-perez'))
+        self.assertTrue(candidate.photo.name.endswith('.jpg'))
+        self.assertFalse(Candidate.objects.get(pk=self.other.pk).photo)
+        self.assertEquals(self.thumbnail_count(election.logo.name), len(LOGO_THUMBNAILS))
+        self.assertEquals(self.thumbnail_count(candidate.photo.name), len(PHOTO_THUMBNAILS))
+
+    def test_import_directory(self):
+        self.assertImported(import_media(self.user, self.media))
+
+    def test_import_zip(self):
+        archive_path = os.path.join(self.media, 'media.zip')
+        archive = zipfile.ZipFile(archive_path, 'w')
+        for name in ('barbaz.jpg', 'barbaz/juan-perez.JPG', 'barbaz/nadie.jpg', 'barbaz/notes.txt'):
+            archive.write(os.path.join(self.media, name), name)
+        archive.close()
+
+        self.assertImported(import_media(self.user, archive_path))
+
+    def test_only_the_elections_of_the_owner(self):
+        other_user = User.objects.create_user(username='jane', password='doe', email='jane@doe.cl')
+
+        report = import_media(other_user, self.media)
+
+        self.assertEquals(report['logos'], 0)
+        self.assertEquals(report['photos'], 0)
+        self.assertEquals(report['thumbnails'], 0)
+        self.assertEquals(len(report['unmatched']), 4)
+        self.assertFalse(Election.objects.get(pk=self.election.pk).logo)
+
+    def test_import_with_workers(self):
+        thumbnail_files = self.thumbnail_files()
+        try:
+            report = import_media(self.user, self.media, workers=2)
+            made = self.thumbnail_files() - thumbnail_files
+        finally:
+            # The workers record the thumbnails in their own copy of the test
+            # database, so delete() doesn't know about them.
+            for name in self.thumbnail_files() - thumbnail_files:
+                os.remove(name)
+
+        self.assertEquals(report['logos'], 1)
+        self.assertEquals(report['photos'], 1)
+        self.assertEquals(report['thumbnails'], len(PHOTO_THUMBNAILS) + len(LOGO_THUMBNAILS))
+        self.assertEquals(len(made), len(PHOTO_THUMBNAILS) + len(LOGO_THUMBNAILS))
+
+    def test_loader_command_imports_the_media(self):
+        shutil.copy(os.path.join(dirname, 'media/dummy_logo.jpg'), os.path.join(self.media, 'comuna1.jpg'))
+        os.mkdir(os.path.join(self.media, 'comuna1'))
+        shutil.copy(os.path.join(dirname, 'media/dummy.jpg'), os.path.join(self.media, 'comuna1', 'fiera.jpg'))
+        command = Command()
+        command.stdout = StringIO()
+        command.handle(self.user.username,
+                       os.path.join(dirname, 'media/candidatos.csv'),
+                       os.path.join(dirname, 'media/questions.csv'),
+                       os.path.join(dirname, 'media/style.css'), media=self.media)
+
+        output = command.stdout.getvalue()
+        self.assertTrue(u"2 photos and 2 logos imported, 14 thumbnails made" in output)
+        self.assertTrue(u"barbaz/nadie.jpg: no election or candidate" in output)
+        election = Election.objects.get(owner=self.user, slug='comuna1')
+        self.assertTrue(election.logo.name.startswith('logos/comuna1'))
+        self.assertTrue(Candidate.objects.get(election=election, slug='fiera').photo.name.startswith(
+            'photos/comuna1-fiera'))
+        self.assertFalse(Candidate.objects.get(election=election, slug='boris-colja').photo)
@@ -2,6 +2,7 @@ from django.test import TestCase
 from django.contrib.auth import authenticate, login
 from django.core.urlresolvers import reverse
 from django.test.client import Client
+from django.utils import simplejson as json
 from django.utils.unittest import skip
 
 # Imported models
@@ -93,6 +94,38 @@ class TestMediaNaranja(TestCase):
         response = self.client.post(url, {})
         self.assertEqual(response.status_code, 404)
 
+    def test_post_resolves_answers_without_per_question_queries(self):
+        url = reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        data = {'question-0': self.answer1_1.pk, 'question-1': self.answer2_2.pk, \
+            'importance-0': 5, 'importance-1': 3,\
+            'question-id-0': self.question1.pk, 'question-id-1': self.question2.pk}
+        self.client.post(url, data)
+        # election, snapshot version, visitor, then one insert for the
+        # visitor answers, one for the visitor scores, reading their ids
+        # back, one for the category scores, the visitors, answers and
+        # winner rollups, the score histograms with one update for each of
+        # the 4 buckets these scores fall in, and the histograms of the
+        # winner for the result page
+        self.assertNumQueries(17, self.client.post, url, data)
+
+    def test_post_answer_of_another_question(self):
+        url = reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        response = self.client.post(url, {'question-0': self.answer1_2.pk, 'question-1': self.answer2_2.pk, \
+            'importance-0': 5, 'importance-1': 3,\
+            'question-id-0': self.question1.pk, 'question-id-1': self.question2.pk})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Visitor.objects.count(), 0)
+
+    def test_post_question_of_another_election(self):
+        other_election = Election.objects.create(name='other', owner=self.user)
+        other_question = other_election.category_set.all()[0].question_set.all()[0]
+        url = reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        response = self.client.post(url, {'question-0': self.answer1_1.pk, 'question-1': -1, \
+            'importance-0': 5, 'importance-1': 3,\
+            'question-id-0': self.question1.pk, 'question-id-1': other_question.pk})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Visitor.objects.count(), 0)
+
     def test_get_number_of_questions_by_category(self):
         number_by_questions_expected = [1,1]
         number_by_questions = self.candidate1.get_number_of_questions_by_category()
@@ -397,3 +430,289 @@ class TestElectionsWithoutDefaultOptionInMediaNaranja(TestCase):
 
         self.assertEquals(response.context['winner'][0], expected_winner[0])
         self.assertEquals(response.context['winner'][1], expected_winner[1])
+
+
+
+class TestMediaNaranjaQuestionnairePage(TestCase):
+
+    def setUp(self):
+        user, created = User.objects.get_or_create(username='joe')
+        election, created = Election.objects.get_or_create(name='election',
+                                                            owner=user,
+                                                            slug='barbaz')
+        #deleting default categories
+        for category in election.category_set.all():
+            category.delete()
+        #end of deleting default categories
+        self.user = user
+        self.election = election
+        self.category = Category.objects.create(name='FooCat', election=election)
+        self.add_questions(2)
+
+    def add_questions(self, number):
+        for i in range(number):
+            question = Question.objects.create(question='FooQuestion %d' % i, category=self.category)
+            answer = Answer.objects.create(question=question, caption='FooAnswer %d' % i)
+            candidate = Candidate.objects.create(name='Candidate %d %d' % (question.pk, i), election=self.election)
+            candidate.associate_answer(answer)
+
+    def test_questionnaire_is_built_with_a_constant_number_of_queries(self):
+        url = reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        embeded_url = reverse("medianaranja1_embeded",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        self.client.get(url)
+        self.client.get(embeded_url)
+        # The election and its snapshot version.
+        self.assertNumQueries(2, self.client.get, url)
+        self.assertNumQueries(2, self.client.get, embeded_url)
+
+        self.add_questions(10)
+        self.client.get(url)
+        self.client.get(embeded_url)
+        self.assertNumQueries(2, self.client.get, url)
+        self.assertNumQueries(2, self.client.get, embeded_url)
+
+    def test_rendered_questionnaire_follows_changes(self):
+        url = reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        response = self.client.get(url)
+        self.assertContains(response, 'FooQuestion 1')
+        self.assertNotContains(response, 'BarQuestion')
+
+        question = Question.objects.create(question='BarQuestion', category=self.category)
+        response = self.client.get(url)
+        self.assertContains(response, 'BarQuestion')
+        self.assertEqual(response.context['stt'][0][1][-1], (2, question, ()))
+
+        self.election.use_default_media_naranja_option = False
+        self.election.save()
+        response = self.client.get(url)
+        self.assertNotContains(response, 'value="-1"')
+
+
+class TestMediaNaranjaBundle(TestCase):
+
+    def setUp(self):
+        user, created = User.objects.get_or_create(username='joe')
+        election, created = Election.objects.get_or_create(name='election',
+                                                            owner=user,
+                                                            slug='barbaz')
+        #deleting default categories
+        for category in election.category_set.all():
+            category.delete()
+        #end of deleting default categories
+        category = Category.objects.create(name='FooCat', election=election)
+        question = Question.objects.create(question='FooQuestion', category=category)
+        answer = Answer.objects.create(question=question, caption='FooAnswer')
+        candidate = Candidate.objects.create(name='BarBaz', election=election)
+        candidate.associate_answer(answer)
+
+        self.election = election
+        self.question = question
+        self.answer = answer
+        self.candidate = candidate
+        self.url = reverse('medianaranja_bundle', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+
+    def test_reverse_routing(self):
+        self.assertEqual(self.url, '/joe/barbaz/medianaranja/bundle.json')
+        self.assertEqual(reverse('medianaranja_beacon', kwargs={'username': 'joe', 'election_slug': 'barbaz'}),
+                         '/joe/barbaz/medianaranja/beacon')
+
+    def test_get_bundle(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        bundle = json.loads(response.content)
+        self.assertEqual(bundle['questions'][0]['id'], self.question.pk)
+        self.assertEqual(bundle['matrix'], [[self.answer.pk]])
+
+    def test_get_bundle_of_unknown_election(self):
+        url = reverse('medianaranja_bundle', kwargs={'username': 'joe', 'election_slug': 'unknown'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_versioned_bundle_is_cacheable(self):
+        version = json.loads(self.client.get(self.url).content)['version']
+
+        response = self.client.get(self.url, {'v': version})
+        self.assertTrue('max-age=86400' in response['Cache-Control'])
+        self.assertEqual(response['ETag'], '"%s"' % version)
+
+        response = self.client.get(self.url, {'v': 'stale'})
+        self.assertTrue('max-age=0' in response['Cache-Control'])
+
+    def test_bundle_is_revalidated_by_version(self):
+        version = json.loads(self.client.get(self.url).content)['version']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"%s"' % version)
+        self.assertEqual(response.status_code, 304)
+
+        self.candidate.associate_answer(Answer.objects.create(question=self.question, caption='Other'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"%s"' % version)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(json.loads(response.content)['version'], version)
+
+    def test_embeded_questionnaire_loads_the_bundle(self):
+        url = reverse('medianaranja1_embeded', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        response = self.client.get(url)
+
+        self.assertContains(response, 'js/medianaranja.js')
+        self.assertContains(response, '%s?v=%s' % (self.url, response.context['questionnaire_version']))
+        self.assertContains(response, '/joe/barbaz/medianaranja/beacon')
+
+    def test_beacon_records_the_visit(self):
+        url = reverse('medianaranja_beacon', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        response = self.client.post(url, {'question-id-0': self.question.pk,
+                                          'question-0': self.answer.pk,
+                                          'importance-0': 5})
+
+        self.assertEqual(response.status_code, 204)
+        visitor = Visitor.objects.get(election=self.election)
+        self.assertEqual(visitor.visitoranswer_set.get().answer_text, "FooAnswer")
+        self.assertEqual(visitor.visitorscore_set.get().score, 100.0)
+
+    def test_beacon_records_the_ranking_shown(self):
+        other = Candidate.objects.create(name='FooFoo', election=self.election)
+        url = reverse('medianaranja_beacon', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        # Without an answer both candidates score 0, so either order is right.
+        response = self.client.post(url, {'question-id-0': self.question.pk,
+                                          'importance-0': 5,
+                                          'ranking': '%d,%d' % (other.pk, self.candidate.pk)})
+
+        self.assertEqual(response.status_code, 204)
+        visitor = Visitor.objects.get(election=self.election)
+        self.assertEqual([score.candidate_name for score in visitor.visitorscore_set.order_by('pk')],
+                         ['FooFoo', 'BarBaz'])
+
+    def test_beacon_rejects_a_wrong_ranking(self):
+        other = Candidate.objects.create(name='FooFoo', election=self.election)
+        url = reverse('medianaranja_beacon', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        data = {'question-id-0': self.question.pk, 'question-0': self.answer.pk, 'importance-0': 5}
+
+        for ranking in ('%d,%d' % (other.pk, self.candidate.pk),
+                        '%d' % self.candidate.pk,
+                        '%d,%d' % (self.candidate.pk, self.candidate.pk),
+                        '%d,0' % self.candidate.pk,
+                        'foo'):
+            data['ranking'] = ranking
+            self.assertEqual(self.client.post(url, data).status_code, 404)
+        self.assertFalse(Visitor.objects.filter(election=self.election).exists())
+
+    def test_beacon_only_accepts_posts(self):
+        url = reverse('medianaranja_beacon', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+
+class TestPaginatedMediaNaranja(TestCase):
+
+    def setUp(self):
+        user, created = User.objects.get_or_create(username='joe')
+        election, created = Election.objects.get_or_create(name='election',
+                                                            owner=user,
+                                                            slug='barbaz')
+        #deleting default categories
+        for category in election.category_set.all():
+            category.delete()
+        #end of deleting default categories
+        candidate1 = Candidate.objects.create(name='BarBaz', election=election)
+        candidate2 = Candidate.objects.create(name='FooFoo', election=election)
+        category1 = Category.objects.create(name='FooCat', election=election, order=1)
+        category2 = Category.objects.create(name='FooCat2', election=election, order=2)
+        Category.objects.create(name='Empty', election=election, order=3)
+        question1 = Question.objects.create(question='FooQuestion', category=category1)
+        question2 = Question.objects.create(question='BarQuestion', category=category2)
+        answer1_1 = Answer.objects.create(question=question1, caption='BarAnswer1Question1')
+        answer1_2 = Answer.objects.create(question=question2, caption='BarAnswer1Question2')
+        answer2_1 = Answer.objects.create(question=question1, caption='BarAnswer2Question1')
+        answer2_2 = Answer.objects.create(question=question2, caption='BarAnswer2Question2')
+        candidate1.associate_answer(answer1_1)
+        candidate1.associate_answer(answer1_2)
+        candidate2.associate_answer(answer2_1)
+        candidate2.associate_answer(answer1_2)
+
+        self.election = election
+        self.candidate1 = candidate1
+        self.candidate2 = candidate2
+        self.question1 = question1
+        self.question2 = question2
+        self.answer1_1 = answer1_1
+        self.answer1_2 = answer1_2
+        self.answer2_1 = answer2_1
+        self.answer2_2 = answer2_2
+
+    def step_url(self, step):
+        return reverse('medianaranja_step', kwargs={'username': 'joe', 'election_slug': 'barbaz', 'step': step})
+
+    def test_reverse_routing(self):
+        self.assertEqual(self.step_url(1), '/joe/barbaz/medianaranja/1')
+        self.assertEqual(reverse('medianaranja_result', kwargs={'username': 'joe', 'election_slug': 'barbaz'}),
+                         '/joe/barbaz/medianaranja/result')
+
+    def test_one_page_per_category_with_questions(self):
+        response = self.client.get(self.step_url(1))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'medianaranja_step.html')
+        self.assertEqual(response.context['steps'], 2)
+        self.assertEqual(response.context['questions'], [(0, self.question1, (self.answer1_1, self.answer2_1))])
+        self.assertContains(response, 'FooQuestion')
+        self.assertNotContains(response, 'BarQuestion')
+
+        response = self.client.get(self.step_url(2))
+        self.assertEqual(response.context['questions'], [(1, self.question2, (self.answer1_2, self.answer2_2))])
+        self.assertTrue(response.context['is_last_step'])
+
+        self.assertEqual(self.client.get(self.step_url(3)).status_code, 404)
+
+    def test_single_page_links_to_the_paginated_questionnaire(self):
+        url = reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        self.assertContains(self.client.get(url), self.step_url(1))
+
+    def test_result_matches_single_page_form(self):
+        response = self.client.post(self.step_url(1), {'question-id-0': self.question1.pk,
+                                                       'question-0': self.answer2_1.pk,
+                                                       'importance-0': 5})
+        self.assertRedirects(response, self.step_url(2))
+        response = self.client.post(self.step_url(2), {'question-id-1': self.question2.pk,
+                                                       'question-1': self.answer1_2.pk,
+                                                       'importance-1': 1})
+        result_url = reverse('medianaranja_result', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        self.assertRedirects(response, result_url)
+        response = self.client.get(result_url)
+
+        single_page = self.client.post(reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'}),
+                                       {'question-id-0': self.question1.pk, 'question-0': self.answer2_1.pk, 'importance-0': 5,
+                                        'question-id-1': self.question2.pk, 'question-1': self.answer1_2.pk, 'importance-1': 1})
+        self.assertTemplateUsed(response, 'medianaranja2.html')
+        self.assertEqual(response.context['winner'], single_page.context['winner'])
+        self.assertEqual(response.context['winner'][2], self.candidate2)
+        self.assertEqual(response.context['others'], single_page.context['others'])
+
+    def test_result_is_recorded_once(self):
+        self.client.post(self.step_url(1), {'question-id-0': self.question1.pk, 'question-0': self.answer1_1.pk, 'importance-0': 3})
+        self.client.post(self.step_url(2), {'question-id-1': self.question2.pk, 'question-1': -1, 'importance-1': 3})
+        result_url = reverse('medianaranja_result', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        self.client.get(result_url)
+        self.client.get(result_url)
+
+        visitor = Visitor.objects.get(election=self.election)
+        self.assertEqual(visitor.visitoranswer_set.count(), 2)
+        self.assertEqual(visitor.visitorscore_set.count(), 2)
+
+    def test_result_redirects_to_missing_steps(self):
+        result_url = reverse('medianaranja_result', kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        self.assertRedirects(self.client.get(result_url), self.step_url(1))
+
+        self.client.post(self.step_url(2), {'question-id-1': self.question2.pk, 'question-1': -1, 'importance-1': 3})
+        self.assertRedirects(self.client.get(result_url), self.step_url(1))
+
+    def test_changed_questionnaire_starts_over(self):
+        self.client.post(self.step_url(1), {'question-id-0': self.question1.pk, 'question-0': self.answer1_1.pk, 'importance-0': 3})
+
+        self.candidate2.associate_answer(self.answer1_1)
+
+        response = self.client.post(self.step_url(2), {'question-id-1': self.question2.pk, 'question-1': -1, 'importance-1': 3})
+        self.assertRedirects(response, self.step_url(1))
+
+    def test_answers_of_another_category_are_rejected(self):
+        response = self.client.post(self.step_url(1), {'question-id-0': self.question1.pk,
+                                                       'question-0': self.answer1_2.pk,
+                                                       'importance-0': 3})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,98 @@
+import datetime
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import simplejson as json
+
+# Imported models
+from elections.models import Election, Visitor, VisitorAnswer, VisitorScore, CategoryScore, PackedVisitor, \
+    AnalyticsRetention
+from elections.analytics import write_visit_rows, write_packed_visits
+from elections.retention import retention_cutoff, archive_visitors, delete_election_analytics
+from elections.tests.analytics import visit
+
+
+class RetentionTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='joe', password='doe', email='joe@doe.cl')
+        self.election, created = Election.objects.get_or_create(name='election',
+                                                                 owner=user,
+                                                                 slug='barbaz')
+        self.other_election = Election.objects.create(name='other', owner=user, slug='other')
+        self.now = datetime.datetime(2012, 11, 30, 12, 0)
+        old = datetime.datetime(2012, 10, 1, 12, 0)
+        recent = datetime.datetime(2012, 11, 29, 12, 0)
+        write_visit_rows([visit(self.election, datestamp=old), visit(self.election, datestamp=recent),
+                          visit(self.other_election, datestamp=old)])
+        write_packed_visits([visit(self.election, candidates=('Packed',), datestamp=old),
+                             visit(self.election, candidates=('Packed',), datestamp=recent)])
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_retention_cutoff(self):
+        self.assertEqual(retention_cutoff(self.election, self.now), None)
+
+        retention = AnalyticsRetention.objects.create(election=self.election, days=30)
+        self.assertEqual(retention_cutoff(self.election, self.now), datetime.datetime(2012, 10, 31, 12, 0))
+
+        retention.closed = True
+        retention.save()
+        self.assertEqual(retention_cutoff(self.election, self.now), self.now)
+
+    def test_archive_visitors(self):
+        path, archived = archive_visitors(self.election, datetime.datetime(2012, 11, 1), self.directory,
+                                          batch_size=1, now=self.now)
+
+        self.assertEqual(archived, 2)
+        self.assertEqual(path, os.path.join(self.directory, 'joe', 'barbaz', '20121130-120000-000000.jsonl.gz'))
+        lines = [json.loads(line) for line in gzip.open(path).read().splitlines()]
+        self.assertEqual([[score['candidate'] for score in line['scores']] for line in lines],
+                         [['BarBaz', 'FooFoo'], ['Packed']])
+        self.assertEqual(lines[0]['datestamp'], '2012-10-01T12:00:00')
+
+        self.assertEqual(list(Visitor.objects.filter(election=self.election).values_list('datestamp', flat=True)),
+                         [datetime.datetime(2012, 11, 29, 12, 0)])
+        self.assertEqual(PackedVisitor.objects.count(), 1)
+        self.assertEqual(Visitor.objects.filter(election=self.other_election).count(), 1)
+        self.assertEqual(VisitorAnswer.objects.count(), 4)
+        self.assertEqual(VisitorScore.objects.count(), 4)
+        self.assertEqual(CategoryScore.objects.count(), 8)
+
+    def test_nothing_to_archive(self):
+        self.assertEqual(archive_visitors(self.election, datetime.datetime(2012, 9, 1), self.directory),
+                         (None, 0))
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'joe', 'barbaz')), [])
+
+    def test_command(self):
+        AnalyticsRetention.objects.create(election=self.election, closed=True)
+
+        call_command('archive_visitor_analytics', directory=self.directory, verbosity=0)
+
+        self.assertEqual(Visitor.objects.filter(election=self.election).count(), 0)
+        self.assertEqual(PackedVisitor.objects.count(), 0)
+        self.assertEqual(Visitor.objects.filter(election=self.other_election).count(), 1)
+        archives = os.listdir(os.path.join(self.directory, 'joe', 'barbaz'))
+        self.assertEqual(len(gzip.open(os.path.join(self.directory, 'joe', 'barbaz', archives[0])).readlines()), 4)
+
+    def test_delete_election_analytics(self):
+        delete_election_analytics(self.election, batch_size=1)
+
+        self.assertEqual(Visitor.objects.filter(election=self.election).count(), 0)
+        self.assertEqual(PackedVisitor.objects.count(), 0)
+        self.assertEqual(VisitorScore.objects.count(), 2)
+        self.assertEqual(CategoryScore.objects.count(), 4)
+
+    def test_deleting_an_election_deletes_its_visitors_in_batches(self):
+        self.election.delete()
+
+        self.assertEqual(Visitor.objects.count(), 1)
+        self.assertEqual(VisitorAnswer.objects.count(), 2)
+        self.assertEqual(PackedVisitor.objects.count(), 0)
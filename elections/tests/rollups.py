@@ -0,0 +1,234 @@
+import datetime
+
+from django.db import IntegrityError
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+
+# Imported models
+from elections.models import Election, Candidate, Category, Question, Answer, Visitor, \
+    ElectionDayRollup, AnswerDayRollup, WinnerDayRollup, AnalyticsSampling, ScoreHistogram, score_bucket
+from elections.analytics import write_visits
+from elections.rollups import update_rollups, election_rollups, update_histograms, crowd_comparison
+from elections.snapshot import get_quiz_snapshot
+
+
+class RollupsTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='joe', password='doe', email='joe@doe.cl')
+        election, created = Election.objects.get_or_create(name='election',
+                                                            owner=user,
+                                                            slug='barbaz')
+        #deleting default categories
+        for category in election.category_set.all():
+            category.delete()
+        #end of deleting default categories
+        candidate1 = Candidate.objects.create(name='BarBaz', election=election)
+        candidate2 = Candidate.objects.create(name='FooFoo', election=election)
+        category = Category.objects.create(name='FooCat', election=election)
+        question1 = Question.objects.create(question='FooQuestion', category=category)
+        question2 = Question.objects.create(question='BarQuestion', category=category)
+        answer1_1 = Answer.objects.create(question=question1, caption='BarAnswer1Question1')
+        answer2_1 = Answer.objects.create(question=question1, caption='BarAnswer2Question1')
+        answer1_2 = Answer.objects.create(question=question2, caption='BarAnswer1Question2')
+        candidate1.associate_answer(answer1_1)
+        candidate2.associate_answer(answer2_1)
+
+        self.user = user
+        self.election = election
+        self.category = category
+        self.candidate1 = candidate1
+        self.candidate2 = candidate2
+        self.question1 = question1
+        self.question2 = question2
+        self.answer1_1 = answer1_1
+        self.answer2_1 = answer2_1
+        self.answer1_2 = answer1_2
+
+    def post(self, answer1, importance1, answer2, importance2):
+        url = reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        self.client.post(url, {'question-id-0': self.question1.pk, 'question-0': answer1, 'importance-0': importance1,
+                               'question-id-1': self.question2.pk, 'question-1': answer2, 'importance-1': importance2})
+
+    def record(self, day, answer1, importance1, winner):
+        return {
+            'election_id': self.election.pk,
+            'election_url': '/joe/barbaz',
+            'datestamp': datetime.datetime(2012, 10, day, 12, 0),
+            'answers': [('', 'FooQuestion', 'FooCat', importance1), ('', 'BarQuestion', 'FooCat', 3)],
+            'scores': [],
+            'question_ids': [self.question1.pk, self.question2.pk],
+            'answer_ids': [answer1, None],
+            'winner_id': winner,
+        }
+
+    def test_submissions_update_the_rollups(self):
+        self.post(self.answer1_1.pk, 5, self.answer1_2.pk, 1)
+        self.post(self.answer1_1.pk, 3, -1, 2)
+        self.post(self.answer2_1.pk, 4, -1, 2)
+
+        today = datetime.date.today()
+        self.assertEqual(ElectionDayRollup.objects.get(election=self.election, date=today).visitors, 3)
+        rollup = AnswerDayRollup.objects.get(question=self.question1, answer=self.answer1_1, date=today)
+        self.assertEqual((rollup.visitors, rollup.importance_sum), (2, 8))
+        rollup = AnswerDayRollup.objects.get(question=self.question2, answer=None, date=today)
+        self.assertEqual((rollup.visitors, rollup.importance_sum), (2, 4))
+        self.assertEqual(WinnerDayRollup.objects.get(candidate=self.candidate1, date=today).visitors, 2)
+        self.assertEqual(WinnerDayRollup.objects.get(candidate=self.candidate2, date=today).visitors, 1)
+
+    def test_sampled_submissions(self):
+        sampling = AnalyticsSampling.objects.create(election=self.election, rate=0, rollup_rate=1)
+        self.post(self.answer1_1.pk, 5, self.answer1_2.pk, 1)
+        sampling.rollup_rate = 0
+        sampling.save()
+        self.post(self.answer1_1.pk, 5, self.answer1_2.pk, 1)
+
+        self.assertEqual(Visitor.objects.count(), 0)
+        self.assertEqual(ElectionDayRollup.objects.get(election=self.election).visitors, 1)
+
+    def test_estimated_visitors(self):
+        sampled = self.record(28, self.answer1_1.pk, 5, self.candidate1.pk)
+        sampled['rollup_rate'] = 0.25
+        update_rollups([self.record(27, self.answer1_1.pk, 5, self.candidate1.pk), sampled])
+        # counted before sampling was recorded
+        ElectionDayRollup.objects.filter(date=datetime.date(2012, 10, 27)).update(estimated_visitors=0)
+
+        rollups = election_rollups(self.election, get_quiz_snapshot(self.election))
+
+        self.assertEqual((rollups['visitors'], rollups['estimated_visitors']), (2, 5))
+
+    def test_batches_update_each_counter_once(self):
+        records = [self.record(28, self.answer1_1.pk, 5, self.candidate1.pk) for i in range(10)]
+        update_rollups(records)
+
+        # visitors, two answers and the winner
+        self.assertNumQueries(4, update_rollups, records)
+        self.assertEqual(ElectionDayRollup.objects.get(election=self.election).visitors, 20)
+        self.assertEqual(AnswerDayRollup.objects.get(answer=self.answer1_1).importance_sum, 100)
+
+    def test_unanswered_counter_is_unique(self):
+        update_rollups([self.record(28, None, 5, None), self.record(28, None, 2, None)])
+
+        rollup = AnswerDayRollup.objects.get(question=self.question1, answer=None)
+        self.assertEqual((rollup.answer_key, rollup.visitors, rollup.importance_sum), (0, 2, 7))
+        # as a writer that didn't see the row would
+        self.assertRaises(IntegrityError, AnswerDayRollup.objects.create, election=self.election,
+                          date=datetime.date(2012, 10, 28), question=self.question1, answer=None)
+
+    def test_records_without_ids_are_not_counted(self):
+        record = self.record(28, self.answer1_1.pk, 5, self.candidate1.pk)
+        del record['question_ids']
+        update_rollups([record])
+
+        self.assertEqual(ElectionDayRollup.objects.count(), 0)
+
+    def test_election_rollups(self):
+        write_visits([self.record(27, self.answer1_1.pk, 5, self.candidate1.pk),
+                      self.record(28, self.answer1_1.pk, 3, self.candidate1.pk),
+                      self.record(28, self.answer2_1.pk, 4, self.candidate2.pk),
+                      self.record(29, None, 1, None)])
+        snapshot = get_quiz_snapshot(self.election)
+
+        self.assertNumQueries(3, election_rollups, self.election, snapshot)
+        rollups = election_rollups(self.election, snapshot)
+
+        self.assertEqual(rollups['visitors'], 4)
+        self.assertEqual(rollups['days'], [(datetime.date(2012, 10, 27), 1), (datetime.date(2012, 10, 28), 2),
+                                           (datetime.date(2012, 10, 29), 1)])
+        question = rollups['questions'][0]
+        self.assertEqual(question['question'], self.question1)
+        self.assertEqual(question['answers'], [(self.answer1_1, 2), (self.answer2_1, 1)])
+        self.assertEqual(question['unanswered'], 1)
+        self.assertEqual(question['average_importance'], 13 / 4.0)
+        self.assertEqual(rollups['questions'][1]['answers'], [(self.answer1_2, 0)])
+        self.assertEqual(rollups['questions'][1]['unanswered'], 4)
+        self.assertEqual(rollups['winners'], [(self.candidate1, 2), (self.candidate2, 1)])
+
+        rollups = election_rollups(self.election, snapshot, since=datetime.date(2012, 10, 28),
+                                   until=datetime.date(2012, 10, 28))
+        self.assertEqual(rollups['visitors'], 2)
+        self.assertEqual(rollups['questions'][0]['answers'], [(self.answer1_1, 1), (self.answer2_1, 1)])
+
+    def scored(self, score1, category_score1, score2, category_score2):
+        return {
+            'election_id': self.election.pk,
+            'scores': [('BarBaz', score1, [('FooCat', category_score1)]),
+                       ('FooFoo', score2, [('FooCat', category_score2)])],
+            'candidate_ids': [self.candidate1.pk, self.candidate2.pk],
+            'category_ids': [self.category.pk],
+        }
+
+    def test_score_bucket(self):
+        self.assertEqual([score_bucket(score) for score in (0, 9.99, 10, 55.5, 99.9, 100)], [0, 0, 1, 5, 9, 9])
+
+    def test_update_histograms(self):
+        update_histograms([self.scored(100, 100, 0, 0), self.scored(50, 55, 0, 0)])
+
+        histogram = ScoreHistogram.objects.get(candidate=self.candidate1, category=None)
+        self.assertEqual(histogram.buckets(), [0, 0, 0, 0, 0, 1, 0, 0, 0, 1])
+        self.assertEqual(ScoreHistogram.objects.get(candidate=self.candidate2, category=self.category).buckets(),
+                         [2, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+
+        records = [self.scored(100, 100, 0, 0), self.scored(100, 15, 0, 0)]
+        # the histograms, then one update per bucket and count: 2 in bucket 9,
+        # 1 in bucket 9, 1 in bucket 1 and 2 in bucket 0
+        self.assertNumQueries(5, update_histograms, records)
+        histogram = ScoreHistogram.objects.get(candidate=self.candidate1, category=self.category)
+        self.assertEqual(histogram.buckets(), [0, 1, 0, 0, 0, 1, 0, 0, 0, 2])
+
+    def test_overall_histogram_is_unique(self):
+        update_histograms([self.scored(100, 100, 0, 0)])
+
+        self.assertEqual(ScoreHistogram.objects.get(candidate=self.candidate1, category=None).category_key, 0)
+        # as a writer that didn't see the row would
+        self.assertRaises(IntegrityError, ScoreHistogram.objects.create, election=self.election,
+                          candidate=self.candidate1, category=None)
+
+    def test_crowd_comparison(self):
+        update_histograms([self.scored(100, 100, 0, 0), self.scored(50, 55, 0, 0), self.scored(20, 20, 0, 0),
+                           self.scored(60, 60, 0, 0)])
+        snapshot = get_quiz_snapshot(self.election)
+
+        self.assertNumQueries(1, crowd_comparison, snapshot, [60, [60], self.candidate1])
+        overall, category = crowd_comparison(snapshot, [60, [60], self.candidate1])
+
+        self.assertEqual(overall['category'], None)
+        self.assertEqual(category['category'], self.category)
+        self.assertEqual((overall['score'], overall['visitors'], overall['below']), (60, 4, 50))
+        self.assertEqual(overall['buckets'][6], (60, 1, 100, True))
+        self.assertEqual(overall['buckets'][0], (0, 0, 0, False))
+        self.assertEqual(crowd_comparison(snapshot, [0, [0], self.candidate2])[0]['below'], 0)
+
+    def test_crowd_comparison_on_the_result_page(self):
+        self.post(self.answer1_1.pk, 5, self.answer1_2.pk, 1)
+        url = reverse("medianaranja1",kwargs={'username': 'joe', 'election_slug':'barbaz'})
+        response = self.client.post(url, {'question-id-0': self.question1.pk, 'question-0': self.answer1_1.pk,
+                                          'importance-0': 5, 'question-id-1': self.question2.pk,
+                                          'question-1': self.answer1_2.pk, 'importance-1': 1})
+
+        crowd = response.context['crowd']
+        self.assertEqual([comparison['category'] for comparison in crowd], [None, self.category])
+        self.assertEqual(crowd[0]['visitors'], 2)
+        self.assertContains(response, 'crowd_mine')
+
+    def test_analytics_page(self):
+        self.post(self.answer1_1.pk, 5, self.answer1_2.pk, 1)
+        url = reverse('election_analytics', kwargs={'slug': 'barbaz'})
+
+        self.client.login(username='joe', password='doe')
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'elections/updating/analytics.html')
+        self.assertEqual(response.context['rollups']['visitors'], 1)
+        self.assertContains(response, 'BarAnswer1Question1')
+
+    def test_analytics_page_is_only_for_the_owner(self):
+        url = reverse('election_analytics', kwargs={'slug': 'barbaz'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        User.objects.create_user(username='doe', password='joe', email='doe@joe.cl')
+        self.client.login(username='doe', password='joe')
+        self.assertEqual(self.client.get(url).status_code, 404)
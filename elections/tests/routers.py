@@ -0,0 +1,97 @@
+import os
+import tempfile
+
+from django.test import TransactionTestCase
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.core.urlresolvers import reverse
+from django.db import connections, router
+from django.db.models import get_models
+
+# Imported models
+from elections.models import Election, Candidate, Category, Question, Answer, Visitor, VisitorAnswer, \
+    VisitorScore, ElectionDayRollup
+from elections.routers import AnalyticsRouter
+
+
+class AnalyticsRouterTest(TransactionTestCase):
+
+    def setUp(self):
+        # A second SQLite file as the analytics database, with the router on.
+        # TestCase would only manage the transactions of the default database.
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        connections.databases['analytics'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.path}
+        self.routers = router.routers
+        router.routers = [AnalyticsRouter()]
+        connection = connections['analytics']
+        cursor = connection.cursor()
+        for model in get_models():
+            if router.allow_syncdb('analytics', model):
+                statements, pending = connection.creation.sql_create_model(model, no_style(), set())
+                for statement in statements:
+                    cursor.execute(statement)
+
+        user = User.objects.create_user(username='joe', password='doe', email='joe@doe.cl')
+        election, created = Election.objects.get_or_create(name='election',
+                                                            owner=user,
+                                                            slug='barbaz')
+        #deleting default categories
+        for category in election.category_set.all():
+            category.delete()
+        #end of deleting default categories
+        candidate = Candidate.objects.create(name='BarBaz', election=election)
+        category = Category.objects.create(name='FooCat', election=election)
+        question = Question.objects.create(question='FooQuestion', category=category)
+        answer = Answer.objects.create(question=question, caption='BarAnswer1Question1')
+        candidate.associate_answer(answer)
+
+        self.election = election
+        self.question = question
+        self.answer = answer
+
+    def tearDown(self):
+        router.routers = self.routers
+        connections['analytics'].close()
+        del connections._connections['analytics']
+        del connections.databases['analytics']
+        os.remove(self.path)
+
+    def post(self):
+        url = reverse("medianaranja1", kwargs={'username': 'joe', 'election_slug': 'barbaz'})
+        self.client.post(url, {'question-id-0': self.question.pk, 'question-0': self.answer.pk, 'importance-0': 5})
+
+    def test_routes(self):
+        self.assertEqual(router.db_for_write(Visitor), 'analytics')
+        self.assertEqual(router.db_for_read(ElectionDayRollup), 'analytics')
+        self.assertEqual(router.db_for_write(Election), 'default')
+        self.assertTrue(router.allow_syncdb('analytics', VisitorScore))
+        self.assertFalse(router.allow_syncdb('analytics', Election))
+        self.assertTrue(router.allow_syncdb('default', Visitor))
+
+    def test_visits_are_written_to_the_analytics_database(self):
+        self.post()
+
+        self.assertEqual(Visitor.objects.using('analytics').get().election, self.election)
+        self.assertEqual(VisitorAnswer.objects.using('analytics').get().answer_text, 'BarAnswer1Question1')
+        self.assertEqual(ElectionDayRollup.objects.using('analytics').get().visitors, 1)
+        self.assertEqual(Visitor.objects.using('default').count(), 0)
+        self.assertEqual(ElectionDayRollup.objects.using('default').count(), 0)
+
+    def test_analytics_page_and_export(self):
+        self.post()
+        self.client.login(username='joe', password='doe')
+
+        response = self.client.get(reverse('election_analytics', kwargs={'slug': 'barbaz'}))
+        self.assertEqual(response.context['rollups']['visitors'], 1)
+        response = self.client.get(reverse('election_analytics_export', kwargs={'slug': 'barbaz', 'format': 'jsonl'}))
+        self.assertEqual(len(response.content.splitlines()), 1)
+
+    def test_deleting_an_election_deletes_its_analytics(self):
+        self.post()
+
+        self.election.delete()
+
+        self.assertEqual(Visitor.objects.using('analytics').count(), 0)
+        self.assertEqual(VisitorAnswer.objects.using('analytics').count(), 0)
+        self.assertEqual(ElectionDayRollup.objects.using('analytics').count(), 0)
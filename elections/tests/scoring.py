@@ -0,0 +1,213 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+# Imported models
+from elections.models import Election, Candidate, Category, Question, Answer
+from elections.scoring import ScoreMatrix, ScoreAccumulator, rank_candidates, ranking_cache_key, result_cache
+from elections.snapshot import QuizSnapshot, get_quiz_snapshot
+
+
+class ScoreMatrixTest(TestCase):
+
+    def setUp(self):
+        user, created = User.objects.get_or_create(username='joe')
+        election, created = Election.objects.get_or_create(name='election',
+                                                            owner=user,
+                                                            slug='barbaz')
+        #deleting default categories
+        for category in election.category_set.all():
+            category.delete()
+        #end of deleting default categories
+        candidate1 = Candidate.objects.create(name='BarBaz', election=election)
+        candidate2 = Candidate.objects.create(name='FooFoo', election=election)
+        candidate3 = Candidate.objects.create(name='Silent', election=election)
+        category1 = Category.objects.create(name='FooCat', election=election, order=1)
+        category2 = Category.objects.create(name='FooCat2', election=election, order=2)
+        question1 = Question.objects.create(question='FooQuestion', category=category1)
+        question2 = Question.objects.create(question='BarQuestion', category=category2)
+        question3 = Question.objects.create(question='BazQuestion', category=category1)
+        answer1_1 = Answer.objects.create(question=question1, caption='BarAnswer1Question1')
+        answer1_2 = Answer.objects.create(question=question2, caption='BarAnswer1Question2')
+        answer1_3 = Answer.objects.create(question=question3, caption='BarAnswer1Question3')
+        answer2_1 = Answer.objects.create(question=question1, caption='BarAnswer2Question1')
+        answer2_2 = Answer.objects.create(question=question2, caption='BarAnswer2Question2')
+        answer2_3 = Answer.objects.create(question=question3, caption='BarAnswer2Question3')
+
+        candidate1.associate_answer(answer1_1)
+        candidate1.associate_answer(answer1_2)
+        candidate1.associate_answer(answer1_3)
+        candidate2.associate_answer(answer2_1)
+        candidate2.associate_answer(answer1_2)
+        candidate2.associate_answer(answer2_3)
+
+        self.election = election
+        self.candidate1 = candidate1
+        self.candidate2 = candidate2
+        self.candidate3 = candidate3
+        self.category1 = category1
+        self.category2 = category2
+        self.question1 = question1
+        self.question2 = question2
+        self.question3 = question3
+        self.answer1_1 = answer1_1
+        self.answer1_2 = answer1_2
+        self.answer1_3 = answer1_3
+        self.answer2_1 = answer2_1
+        self.answer2_3 = answer2_3
+
+    def test_questions_are_laid_out_by_category(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+
+        self.assertEqual(matrix.categories, (self.category1, self.category2))
+        self.assertEqual(matrix.question_ids, [self.question1.pk, self.question3.pk, self.question2.pk])
+        self.assertEqual(matrix.question_categories, (0, 0, 1))
+
+    def test_candidate_answer_matrix(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+
+        self.assertEqual(matrix.candidates, (self.candidate1, self.candidate2, self.candidate3))
+        self.assertEqual(matrix.answers[0], (self.answer1_1.pk, self.answer1_3.pk, self.answer1_2.pk))
+        self.assertEqual(matrix.answers[1], (self.answer2_1.pk, self.answer2_3.pk, self.answer1_2.pk))
+        self.assertEqual(matrix.answers[2], (None, None, None))
+
+    def test_for_election(self):
+        matrix = ScoreMatrix.for_election(self.election)
+
+        self.assertEqual(matrix.snapshot.election_id, self.election.pk)
+        self.assertEqual(len(matrix.answers), 3)
+
+    def test_scores_match_candidate_get_score(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+        answers = [[self.answer1_1], [self.answer2_3], [self.answer1_2]]
+        answer_ids = [self.answer1_1.pk, self.answer2_3.pk, self.answer1_2.pk]
+        importances = [5, 1, 3]
+
+        scores = matrix.scores(answer_ids, importances)
+
+        self.assertEqual(scores[0], self.candidate1.get_score(answers, importances))
+        self.assertEqual(scores[1], self.candidate2.get_score(answers, importances))
+        self.assertEqual(scores[2], self.candidate3.get_score(answers, importances))
+
+    def test_scores_without_answers(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+
+        scores = matrix.scores([None, None, None], [3, 3, 3])
+
+        self.assertEqual(scores, [(0, [0, 0])] * 3)
+
+    def test_scores_with_zero_importances(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+
+        scores = matrix.scores([self.answer1_1.pk, self.answer1_3.pk, self.answer1_2.pk], [0, 0, 0])
+
+        self.assertEqual(scores[0], (0, [0, 0]))
+
+    def test_rank(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+
+        ranking = matrix.rank([self.answer2_1.pk, self.answer2_3.pk, None], [5, 3, 3])
+
+        self.assertEqual(ranking[0], [100.0 * 8 / 11, [100.0, 0], self.candidate2])
+        self.assertEqual(ranking[1][0], 0)
+        self.assertEqual(ranking[2][0], 0)
+
+    def test_rank_breaks_ties_by_category_scores_and_candidate_order(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+
+        # Both score 50, with 100 and 0 in one category or the other.
+        ranking = matrix.rank_scores([(50.0, [0, 100.0]), (50.0, [100.0, 0]), (50.0, [0, 100.0])])
+        self.assertEqual([candidate for score, category_scores, candidate in ranking],
+                         [self.candidate2, self.candidate1, self.candidate3])
+
+        ranking = matrix.rank_scores([(0, [0, 0])] * 3)
+        self.assertEqual([candidate for score, category_scores, candidate in ranking],
+                         [self.candidate1, self.candidate2, self.candidate3])
+
+    def test_election_without_categories(self):
+        for category in self.election.category_set.all():
+            category.delete()
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+
+        self.assertEqual(matrix.scores([], []), [(0, [])] * 3)
+
+    def test_rank_candidates_matches_rank(self):
+        snapshot = get_quiz_snapshot(self.election)
+        answers = [self.answer1_1.pk, self.answer2_3.pk, None]
+        importances = [5, 1, 3]
+
+        self.assertEqual(rank_candidates(snapshot, answers, importances),
+                         ScoreMatrix(snapshot).rank(answers, importances))
+
+    def test_rank_candidates_is_cached(self):
+        snapshot = get_quiz_snapshot(self.election)
+        answers = [self.answer1_1.pk, self.answer2_3.pk, None]
+        importances = [5, 1, 3]
+        ranking = rank_candidates(snapshot, answers, importances)
+
+        self.assertTrue(result_cache.get(ranking_cache_key(snapshot, answers, importances)) is not None)
+        original_rank = ScoreMatrix.rank
+        def fail(*args, **kwargs):
+            raise AssertionError('ranking was not served from the cache')
+        ScoreMatrix.rank = fail
+        try:
+            self.assertEqual(rank_candidates(snapshot, answers, importances), ranking)
+        finally:
+            ScoreMatrix.rank = original_rank
+
+    def test_ranking_cache_key(self):
+        snapshot = get_quiz_snapshot(self.election)
+
+        self.assertEqual(ranking_cache_key(snapshot, [self.answer1_1.pk, None], [5, 3]),
+                         ranking_cache_key(snapshot, [self.answer1_1.pk, None], [5, 3]))
+        self.assertNotEqual(ranking_cache_key(snapshot, [self.answer1_1.pk, None], [5, 3]),
+                            ranking_cache_key(snapshot, [self.answer1_1.pk, None], [5, 2]))
+        self.assertNotEqual(ranking_cache_key(snapshot, [self.answer1_1.pk, None], [5, 3]),
+                            ranking_cache_key(snapshot, [None, None], [5, 3]))
+
+    def test_rank_candidates_follows_candidate_answers(self):
+        answers = [self.answer2_1.pk, self.answer1_3.pk, None]
+        importances = [3, 3, 3]
+        ranking = rank_candidates(get_quiz_snapshot(self.election), answers, importances)
+        self.assertNotEqual(ranking[0][2], self.candidate3)
+
+        self.candidate3.associate_answer(self.answer2_1)
+        self.candidate3.associate_answer(self.answer1_3)
+        ranking = rank_candidates(get_quiz_snapshot(self.election), answers, importances)
+        self.assertEqual(ranking[0][2], self.candidate3)
+
+    def test_category_sums(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+        answers = [self.answer1_1.pk, self.answer2_3.pk, self.answer1_2.pk]
+        importances = [5, 1, 3]
+
+        self.assertEqual(matrix.category_sums(0, answers, importances), [5, 1, 0])
+        self.assertEqual(matrix.category_sums(1, answers, importances), [3, 3, 0])
+
+    def test_score_accumulator_matches_scores(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+        answers = [self.answer1_1.pk, self.answer2_3.pk, self.answer1_2.pk]
+        importances = [5, 1, 3]
+        accumulator = ScoreAccumulator(matrix.snapshot)
+        self.assertEqual(accumulator.steps(), 2)
+        self.assertEqual(accumulator.next_step(), 1)
+
+        accumulator.add(matrix, 2, answers, importances)
+        self.assertEqual(accumulator.next_step(), 1)
+        accumulator.add(matrix, 1, answers, importances)
+        self.assertEqual(accumulator.next_step(), None)
+
+        self.assertEqual(accumulator.sums, [[5, 3], [1, 3], [0, 0]])
+        self.assertEqual(accumulator.importances_by_category, [6, 3])
+        self.assertEqual(matrix.scores_from_sums(accumulator.sums, accumulator.importances_by_category),
+                         matrix.scores(answers, importances))
+        self.assertEqual(accumulator.rank(matrix), matrix.rank(answers, importances))
+
+    def test_score_accumulator_replaces_answered_steps(self):
+        matrix = ScoreMatrix(QuizSnapshot.build(self.election))
+        accumulator = ScoreAccumulator(matrix.snapshot)
+
+        accumulator.add(matrix, 1, [self.answer1_1.pk, self.answer1_3.pk, None], [5, 1, 0])
+        accumulator.add(matrix, 1, [self.answer2_1.pk, self.answer1_3.pk, None], [2, 1, 0])
+
+        self.assertEqual(accumulator.sums, [[1, 0], [2, 0], [0, 0]])
+        self.assertEqual(accumulator.importances_by_category, [3, 0])
@@ -0,0 +1,164 @@
+import pickle
+
+from django.test import TestCase
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.utils import simplejson as json
+
+# Imported models
+from elections.models import Election, Candidate, Category, Question, Answer
+from elections.snapshot import QuizSnapshot, get_quiz_snapshot, quiz_bundle, get_quiz_bundle
+
+
+class QuizSnapshotTest(TestCase):
+
+    def setUp(self):
+        user, created = User.objects.get_or_create(username='joe')
+        election, created = Election.objects.get_or_create(name='election',
+                                                            owner=user,
+                                                            slug='barbaz')
+        #deleting default categories
+        for category in election.category_set.all():
+            category.delete()
+        #end of deleting default categories
+        candidate = Candidate.objects.create(name='BarBaz', election=election)
+        category1 = Category.objects.create(name='FooCat', election=election, order=1)
+        category2 = Category.objects.create(name='FooCat2', election=election, order=2)
+        question1 = Question.objects.create(question='FooQuestion', category=category1)
+        question2 = Question.objects.create(question='BarQuestion', category=category2)
+        answer1_1 = Answer.objects.create(question=question1, caption='BarAnswer1Question1')
+        answer1_2 = Answer.objects.create(question=question2, caption='BarAnswer1Question2')
+        answer2_1 = Answer.objects.create(question=question1, caption='BarAnswer2Question1')
+        candidate.associate_answer(answer1_1)
+
+        self.election = election
+        self.candidate = candidate
+        self.category1 = category1
+        self.category2 = category2
+        self.question1 = question1
+        self.question2 = question2
+        self.answer1_1 = answer1_1
+        self.answer1_2 = answer1_2
+        self.answer2_1 = answer2_1
+
+    def test_build(self):
+        snapshot = QuizSnapshot.build(self.election, 'v1')
+
+        self.assertEqual(snapshot.election_id, self.election.pk)
+        self.assertEqual(snapshot.version, 'v1')
+        self.assertEqual(snapshot.categories, (self.category1, self.category2))
+        self.assertEqual(snapshot.questions, (self.question1, self.question2))
+        self.assertEqual(snapshot.question_categories, (0, 1))
+        self.assertEqual(snapshot.answers, ((self.answer1_1, self.answer2_1), (self.answer1_2,)))
+        self.assertEqual(snapshot.candidates, (self.candidate,))
+        self.assertEqual(snapshot.candidate_answers, ((self.answer1_1.pk, None),))
+
+    def test_build_with_a_constant_number_of_queries(self):
+        for i in range(3):
+            Candidate.objects.create(name='Candidate %d' % i, election=self.election)
+            question = Question.objects.create(question='Question %d' % i, category=self.category2)
+            Answer.objects.create(question=question, caption='Answer %d' % i)
+
+        self.assertNumQueries(5, QuizSnapshot.build, self.election)
+
+    def test_related_objects_need_no_queries(self):
+        snapshot = QuizSnapshot.build(self.election)
+
+        def follow_relations():
+            return [answer.question.category.name for answers in snapshot.answers for answer in answers]
+        self.assertNumQueries(0, follow_relations)
+
+    def test_can_be_pickled(self):
+        snapshot = QuizSnapshot.build(self.election, 'v1')
+
+        unpickled = pickle.loads(pickle.dumps(snapshot))
+
+        self.assertEqual(unpickled.questions, snapshot.questions)
+        self.assertEqual(unpickled.answers[0][0].question.category, self.category1)
+        self.assertEqual(unpickled.candidate_answers, snapshot.candidate_answers)
+
+    def test_get_quiz_snapshot_is_cached(self):
+        snapshot = get_quiz_snapshot(self.election)
+
+        # Only the version is read.
+        self.assertNumQueries(1, get_quiz_snapshot, self.election)
+        self.assertEqual(get_quiz_snapshot(self.election).version, snapshot.version)
+
+    def test_version_is_shared_through_the_database(self):
+        version = get_quiz_snapshot(self.election).version
+        cache.clear()
+        self.assertEqual(get_quiz_snapshot(self.election).version, version)
+
+        # As another process invalidating the snapshot would.
+        Election.objects.filter(pk=self.election.pk).update(quiz_version='other')
+        self.assertEqual(get_quiz_snapshot(self.election).version, 'other')
+
+    def assertInvalidates(self, change):
+        version = get_quiz_snapshot(self.election).version
+        change()
+        self.assertNotEqual(get_quiz_snapshot(self.election).version, version)
+
+    def test_invalidated_by_election_changes(self):
+        self.election.use_default_media_naranja_option = False
+        self.assertInvalidates(self.election.save)
+
+    def test_invalidated_by_category_changes(self):
+        self.category1.name = 'Renamed'
+        self.assertInvalidates(self.category1.save)
+        self.assertInvalidates(self.category2.delete)
+
+    def test_invalidated_by_question_changes(self):
+        self.assertInvalidates(lambda: Question.objects.create(question='New', category=self.category1))
+        self.assertInvalidates(self.question2.delete)
+
+    def test_invalidated_by_answer_changes(self):
+        self.assertInvalidates(lambda: Answer.objects.create(question=self.question2, caption='New'))
+        self.assertInvalidates(self.answer2_1.delete)
+
+    def test_invalidated_by_candidate_changes(self):
+        self.assertInvalidates(lambda: Candidate.objects.create(name='New', election=self.election))
+        self.assertInvalidates(self.candidate.delete)
+
+    def test_invalidated_by_candidate_answers(self):
+        self.assertInvalidates(lambda: self.candidate.associate_answer(self.answer2_1))
+        self.assertInvalidates(lambda: self.answer1_2.candidate_set.add(self.candidate))
+        self.assertEqual(get_quiz_snapshot(self.election).candidate_answers,
+                         ((self.answer2_1.pk, self.answer1_2.pk),))
+
+    def test_other_elections_are_not_invalidated(self):
+        other = Election.objects.create(name='other', owner=self.election.owner)
+        version = get_quiz_snapshot(other).version
+
+        Question.objects.create(question='New', category=self.category1)
+
+        self.assertEqual(get_quiz_snapshot(other).version, version)
+
+    def test_quiz_bundle(self):
+        snapshot = QuizSnapshot.build(self.election, 'v1')
+
+        bundle = quiz_bundle(self.election, snapshot)
+
+        self.assertEqual(bundle['version'], 'v1')
+        self.assertEqual(bundle['election']['owner'], 'joe')
+        self.assertEqual(bundle['categories'], ['FooCat', 'FooCat2'])
+        self.assertEqual(bundle['questions'][0], {
+            'id': self.question1.pk,
+            'question': 'FooQuestion',
+            'category': 0,
+            'answers': [[self.answer1_1.pk, 'BarAnswer1Question1'], [self.answer2_1.pk, 'BarAnswer2Question1']],
+        })
+        self.assertEqual(bundle['questions'][1]['category'], 1)
+        self.assertEqual(bundle['candidates'], [{'id': self.candidate.pk, 'name': 'BarBaz',
+                                                 'url': '/joe/barbaz/barbaz/embeded', 'photo': None}])
+        self.assertEqual(bundle['matrix'], [[self.answer1_1.pk, None]])
+
+    def test_get_quiz_bundle_follows_the_snapshot(self):
+        bundle = json.loads(get_quiz_bundle(self.election))
+        self.assertEqual(bundle['version'], get_quiz_snapshot(self.election).version)
+        self.assertNumQueries(1, get_quiz_bundle, self.election)
+
+        self.candidate.associate_answer(self.answer2_1)
+
+        bundle = json.loads(get_quiz_bundle(self.election))
+        self.assertEqual(bundle['version'], get_quiz_snapshot(self.election).version)
+        self.assertEqual(bundle['matrix'], [[self.answer2_1.pk, None]])
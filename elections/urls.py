@@ -18,7 +18,7 @@ from views import associate_answer_to_candidate, ElectionCreateView,\
                   PrePersonalDataView, AnswerDeleteAjaxView, ElectionLogoUpdateView, \
                   ElectionShareView, ElectionRedirectView, HomeTemplateView, CompareView, \
                   ElectionAboutView, ElectionStyleUpdateView, EmbededTemplateView, \
-                  UserElectionsView
+                  UserElectionsView, ElectionAnalyticsView
 
 
 urlpatterns = patterns('',
@@ -33,6 +33,9 @@ urlpatterns = patterns('',
     url(r'^(?P<username>[-\w]+)/(?P<slug>[-\w]+)/profiles/embeded/?$', ElectionDetailView.as_view(template_name='elections/embeded/election_detail_profiles.html'), name='election_detail_profiles_embeded'),
     # Media Naranja
     url(r'^(?P<username>[a-zA-Z0-9-]+)/(?P<election_slug>[a-zA-Z0-9-]+)/medianaranja/embeded/?$', 'candidator.elections.views.medianaranja1_embed',name='medianaranja1_embeded'),
+    # Quiz bundle scored in the browser by the embedded media naranja, and the beacon recording its answers
+    url(r'^(?P<username>[a-zA-Z0-9-]+)/(?P<election_slug>[a-zA-Z0-9-]+)/medianaranja/bundle\.json$', 'candidator.elections.views.medianaranja_bundle',name='medianaranja_bundle'),
+    url(r'^(?P<username>[a-zA-Z0-9-]+)/(?P<election_slug>[a-zA-Z0-9-]+)/medianaranja/beacon/?$', 'candidator.elections.views.medianaranja_beacon',name='medianaranja_beacon'),
 
     # Election compare view
     url(r'^(?P<username>[-\w]+)/(?P<slug>[-\w]+)/compare/embeded/?$', CompareView.as_view(template_name='elections/embeded/election_compare.html'), name='election_compare_embeded'),
@@ -131,6 +134,10 @@ urlpatterns = patterns('',
     # Election share view
     url(r'^election/(?P<slug>[-\w]+)/share/?$', ElectionShareView.as_view(template_name='elections/updating/share.html'), name='share_my_election'),
 
+    # Media naranja statistics of an election, for its owner
+    url(r'^election/(?P<slug>[-\w]+)/analytics/?$', login_required(ElectionAnalyticsView.as_view()), name='election_analytics'),
+    url(r'^election/(?P<slug>[-\w]+)/analytics/export\.(?P<format>csv|jsonl)$', 'candidator.elections.views.election_analytics_export', name='election_analytics_export'),
+
     # Election detail view admin
     url(r'^(?P<username>[-\w]+)/(?P<slug>[-\w]+)/gracias$', ElectionDetailView.as_view(template_name='elections/wizard/thanks_for_using_us.html'), name='election_detail_admin'),
 
@@ -139,6 +146,9 @@ urlpatterns = patterns('',
     url(r'^election/(?P<pk>\d+)/update_election_photo', ElectionLogoUpdateView.as_view(), name="update_election_photo"),
     # Media Naranja
     url(r'^(?P<username>[a-zA-Z0-9-]+)/(?P<election_slug>[a-zA-Z0-9-]+)/medianaranja$', 'candidator.elections.views.medianaranja1',name='medianaranja1'),
+    # Media Naranja answered one category per step
+    url(r'^(?P<username>[a-zA-Z0-9-]+)/(?P<election_slug>[a-zA-Z0-9-]+)/medianaranja/(?P<step>\d+)$', 'candidator.elections.views.medianaranja_step',name='medianaranja_step'),
+    url(r'^(?P<username>[a-zA-Z0-9-]+)/(?P<election_slug>[a-zA-Z0-9-]+)/medianaranja/result$', 'candidator.elections.views.medianaranja_result',name='medianaranja_result'),
     
 
 
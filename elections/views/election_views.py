@@ -24,7 +24,10 @@ from elections.forms import ElectionForm, ElectionUpdateForm, PersonalDataForm,\
 # Import models
 from elections.forms.candidate_form import CandidateForm
 from elections.forms.election_form import AnswerForm, ElectionLogoUpdateForm
+from elections.export import EXPORT_CONTENT_TYPES, streamed_visitor_export
 from elections.models import Election, Candidate, Category
+from elections.rollups import election_rollups
+from elections.snapshot import get_quiz_snapshot
 
 from django.conf import settings
 
@@ -120,6 +123,28 @@ class ElectionShareView(DetailView):
 
 
 
+class ElectionAnalyticsView(DetailView):
+    model = Election
+    template_name = 'elections/updating/analytics.html'
+
+    def get_queryset(self):
+        return super(ElectionAnalyticsView, self).get_queryset().filter(owner=self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super(ElectionAnalyticsView, self).get_context_data(**kwargs)
+        context['rollups'] = election_rollups(self.object, get_quiz_snapshot(self.object))
+        return context
+
+
+@login_required
+def election_analytics_export(request, slug, format):
+    election = get_object_or_404(Election, slug=slug, owner=request.user)
+    # The export is written to the client as it is read, a chunk of visitors at a time.
+    response = HttpResponse(streamed_visitor_export(election, format), content_type=EXPORT_CONTENT_TYPES[format])
+    response['Content-Disposition'] = 'attachment; filename=%s-visitors.%s' % (election.slug, format)
+    return response
+
+
 class ElectionCreateView(CreateView):
     model = Election
     form_class = ElectionForm
@@ -175,8 +200,6 @@ class CompareView(DetailView):
                 if 'category_slug' in self.kwargs:
                     category_slug = self.kwargs['category_slug']
                     selected_category = get_object_or_404(Category, election=election, slug=category_slug)
-                    first_candidate_answers = first_candidate.get_all_answers_by_category(selected_category)
-                    second_candidate_answers = second_candidate.get_all_answers_by_category(selected_category)
                     answers = first_candidate.get_answers_two_candidates(second_candidate,selected_category)
                     context['selected_category'] = selected_category
                     context['answers'] = answers
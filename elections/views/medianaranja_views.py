@@ -1,20 +1,24 @@
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.forms import formsets
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, HttpResponseNotModified, Http404
 from django.shortcuts import render_to_response, redirect, get_object_or_404
 from django.template import RequestContext
 from django.template.context import RequestContext
 from django.utils import simplejson as json
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, require_POST
 from django.views.generic import CreateView, DetailView, UpdateView
 from django.views.decorators.csrf import csrf_exempt
 
-from elections.models import Election, Candidate, Answer, Category, Question, Visitor, VisitorAnswer, VisitorScore, CategoryScore
+from elections.models import Election, Candidate, Answer, QUIZ_SNAPSHOT_TIMEOUT
+from elections.analytics import visit_record, record_visit, sample_visit
+from elections.rollups import crowd_comparison
+from elections.scoring import ScoreMatrix, ScoreAccumulator, rank_candidates
+from elections.snapshot import get_quiz_snapshot, get_quiz_bundle
 
 # MediaNaranja Views
 @login_required
@@ -32,56 +36,115 @@ def associate_answer_to_candidate(request, candidate_slug, election_slug):
             'elections/associate_answer.html', {'candidate': candidate, 'categories': election.category_set},
             context_instance=RequestContext(request))
 
-def post_medianaranja1(request, username, election_slug):
-    user_list = User.objects.filter(username=username)
-    if user_list.count() == 0:
-        raise Http404
-
-    election = Election.objects.get(slug=election_slug, owner=User.objects.get(username=user_list[0]))
-
-    candidates = election.candidate_set.all()
-    categories = election.category_set.all()
-
-    number_of_questions = 0
-    for c in categories:
-        number_of_questions += len(c.question_set.all())
-
-    importances = []
-    answers = []
-    questions = []
-
-    for i in range(number_of_questions):
-        if 'question-'+str(i) in request.POST:
-            ans_id = int(request.POST['question-'+str(i)])
-        else:
-            ans_id = -1
-        question_id = int(request.POST['question-id-'+str(i)])
-        answers.append(Answer.objects.filter(id=ans_id))
-        importances.append(int(request.POST['importance-'+str(i)]))
-        questions.append(Question.objects.get(id=question_id))
+def read_answers(data, snapshot, numbers):
+    """
+    Reads the answers posted for the form fields numbered ``numbers`` and
+    returns them, with their importances, indexed by snapshot position.
+    """
+    # Submitted answers and questions are resolved against the snapshot, so
+    # they must belong to this election and to each other.
+    answer_ids = [None] * len(snapshot.questions)
+    importances = [0] * len(snapshot.questions)
+    for i in numbers:
+        question_id = int(data['question-id-'+str(i)])
+        if question_id not in snapshot.question_positions:
+            raise Http404
+        position = snapshot.question_positions[question_id]
+        importances[position] = int(data['importance-'+str(i)])
+
+        ans_id = int(data.get('question-'+str(i), -1))
+        if ans_id == -1:
+            continue
+        if ans_id not in snapshot.answer_index or snapshot.answer_index[ans_id][0] != position:
+            raise Http404
+        answer_ids[position] = ans_id
+    return answer_ids, importances
+
+def read_medianaranja_answers(request, username, election_slug):
+    election = get_object_or_404(Election.objects.select_related('owner'), owner__username=username, slug=election_slug)
+    snapshot = get_quiz_snapshot(election)
+    answer_ids, importances = read_answers(request.POST, snapshot, range(len(snapshot.questions)))
+    return election, snapshot, answer_ids, importances
 
-    return medianaranja2(request, answers, importances, questions, candidates, categories, election)
+def post_medianaranja1(request, username, election_slug):
+    election, snapshot, answer_ids, importances = read_medianaranja_answers(request, username, election_slug)
+    return medianaranja2(request, answer_ids, importances, snapshot, election)
 
 def get_medianaranja1(request, username, election_slug):
-    election = get_object_or_404(Election, owner__username=username, slug=election_slug)
+    election = get_object_or_404(Election.objects.select_related('owner'), owner__username=username, slug=election_slug)
+    snapshot = get_quiz_snapshot(election)
 
     send_to_template = []
-    counter = 0
-    check = False
-    for x in election.category_set.all():
-        empty_questions = []
-        list_questions = x.question_set.all()
-        for i in range(len(list_questions)):
-            y = list_questions[i]
-            empty_questions.append((counter,y,y.answer_set.all()))
-            counter += 1
-        send_to_template.append((x,empty_questions))
-        for tupla in send_to_template:
-            if len(tupla[1]) > 0:
-                check = True
-                break
-
-    return {'stt':send_to_template, 'check': check, 'election': election}
+    for category in snapshot.categories:
+        send_to_template.append((category, []))
+    for counter, question in enumerate(snapshot.questions):
+        category_questions = send_to_template[snapshot.question_categories[counter]][1]
+        category_questions.append((counter, question, snapshot.answers[counter]))
+    check = len(snapshot.questions) > 0
+
+    # The rendered questionnaire is cached by the templates under the
+    # snapshot version, so it is rebuilt only when the questionnaire changes.
+    return {'stt':send_to_template, 'check': check, 'election': election,
+            'questionnaire_version': snapshot.version, 'questionnaire_cache_timeout': QUIZ_SNAPSHOT_TIMEOUT}
+
+def medianaranja_bundle(request, username, election_slug):
+    """
+    Serves the quiz bundle the embedded media naranja scores in the browser.
+    Pages ask for it with the snapshot version in ``v``; that URL never
+    changes content, so it may be cached by browsers and proxies for as long
+    as the snapshot itself.
+    """
+    election = get_object_or_404(Election.objects.select_related('owner'), owner__username=username, slug=election_slug)
+    snapshot = get_quiz_snapshot(election)
+    etag = '"%s"' % snapshot.version
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(get_quiz_bundle(election, snapshot), content_type='application/json')
+    response['ETag'] = etag
+    if request.GET.get('v') == snapshot.version:
+        patch_cache_control(response, public=True, max_age=QUIZ_SNAPSHOT_TIMEOUT)
+    else:
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+def read_ranking(data, snapshot, scores):
+    """
+    Returns the ranking the browser showed, posted as ``ranking``, the ids of
+    the candidates from the best to the worst match, with their ``scores``.
+    It must list every candidate once, in an order their scores agree with.
+    """
+    positions = dict((candidate.pk, position) for position, candidate in enumerate(snapshot.candidates))
+    try:
+        ranking = [positions[int(candidate_id)] for candidate_id in data['ranking'].split(',')]
+    except (KeyError, ValueError):
+        raise Http404
+    if sorted(ranking) != list(range(len(positions))):
+        raise Http404
+    for better, worse in zip(ranking, ranking[1:]):
+        if scores[better][0] < scores[worse][0]:
+            raise Http404
+    return [[scores[position][0], scores[position][1], snapshot.candidates[position]] for position in ranking]
+
+@csrf_exempt
+@require_POST
+def medianaranja_beacon(request, username, election_slug):
+    """
+    Records the answers of a visitor whose ranking was computed in the
+    browser. Takes the same fields as the media naranja form, plus the
+    ``ranking`` shown. The scores recorded are computed here, not taken from
+    the browser, but the order of the candidates is the one the visitor saw.
+    """
+    election, snapshot, answer_ids, importances = read_medianaranja_answers(request, username, election_slug)
+    matrix = ScoreMatrix(snapshot)
+    scores = matrix.scores(answer_ids, importances)
+    if 'ranking' in request.POST:
+        scores_and_candidates = read_ranking(request.POST, snapshot, scores)
+    else:
+        # Pages still running an older medianaranja.js.
+        scores_and_candidates = matrix.rank_scores(scores)
+    save_medianaranja_visit(election, snapshot, answer_ids, importances, scores_and_candidates)
+    return HttpResponse(status=204)
 
 def medianaranja1(request, username, election_slug):
 
@@ -102,38 +165,86 @@ def medianaranja1_embed(request, username, election_slug):
         context = get_medianaranja1(request, username, election_slug)
         return render_to_response('elections/embeded/medianaranja1.html', context, context_instance = RequestContext(request))
 
-def medianaranja2(request, my_answers, importances, questions, candidates, categories, election):
-    election_url=reverse("election_detail",kwargs={'username': election.owner.username, 'slug':election.slug})
-    visitor = Visitor(election=election, election_url=election_url)
-    visitor.save()
-    #save answers for latter analysis:
-    for i, importance in enumerate(importances):
-        if my_answers[i]:
-            visitoranswer = VisitorAnswer(visitor=visitor,answer=my_answers[i][0], answer_importance=importance)
-        else:
-            visitoranswer = VisitorAnswer(visitor=visitor,answer_text="",question_text=questions[i].question,\
-                question_category_text=questions[i].category.name, answer_importance=importance)
-        visitoranswer.save()
-
-    scores_and_candidates = []
-    for candidate in candidates:
-        score = candidate.get_score(my_answers, importances)
-        global_score = score[0]
-        category_scores = score[1]
-        visitor_score = VisitorScore.objects.create(visitor=visitor, candidate_name=candidate.name,score=global_score)
-        for i,category_score in enumerate(category_scores):
-            categoryscore = CategoryScore.objects.create(visitor_score=visitor_score,category_score=category_score, category_name=categories[i])
-
-        scores_and_candidates.append([global_score,category_scores,candidate])
-    scores_and_candidates.sort()
-    scores_and_candidates.reverse()
+def medianaranja_session_key(election):
+    return 'medianaranja-%d' % election.pk
+
+def get_score_accumulator(request, election, snapshot):
+    """
+    Returns the accumulator of the visitor's paginated media naranja, or a new
+    one if they haven't started it or the questionnaire changed meanwhile.
+    """
+    accumulator = request.session.get(medianaranja_session_key(election))
+    if accumulator is None or accumulator.version != snapshot.version:
+        accumulator = ScoreAccumulator(snapshot)
+    return accumulator
+
+def medianaranja_step(request, username, election_slug, step):
+    election = get_object_or_404(Election.objects.select_related('owner'), owner__username=username, slug=election_slug)
+    snapshot = get_quiz_snapshot(election)
+    accumulator = get_score_accumulator(request, election, snapshot)
+    step = int(step)
+    if step < 1 or step > accumulator.steps():
+        raise Http404
+    category = accumulator.category(step)
+    numbers = [position for position, question_category in enumerate(snapshot.question_categories)
+               if question_category == category]
+
+    if request.method == "POST":
+        answer_ids, importances = read_answers(request.POST, snapshot, numbers)
+        accumulator.add(ScoreMatrix(snapshot), step, answer_ids, importances)
+        request.session[medianaranja_session_key(election)] = accumulator
+        next_step = accumulator.next_step()
+        if next_step is None:
+            return redirect('medianaranja_result', username=username, election_slug=election_slug)
+        return redirect('medianaranja_step', username=username, election_slug=election_slug, step=next_step)
+
+    questions = [(number, snapshot.questions[number], snapshot.answers[number]) for number in numbers]
+    context = {'election': election, 'category': snapshot.categories[category], 'questions': questions,
+               'step': step, 'steps': accumulator.steps(), 'is_last_step': step == accumulator.steps()}
+    return render_to_response('medianaranja_step.html', context, context_instance = RequestContext(request))
+
+def medianaranja_result(request, username, election_slug):
+    """
+    Ranks the candidates from the sums accumulated by ``medianaranja_step``.
+    The visit is recorded once, the page can then be reloaded.
+    """
+    election = get_object_or_404(Election.objects.select_related('owner'), owner__username=username, slug=election_slug)
+    snapshot = get_quiz_snapshot(election)
+    accumulator = get_score_accumulator(request, election, snapshot)
+    next_step = accumulator.next_step()
+    if next_step is not None:
+        return redirect('medianaranja_step', username=username, election_slug=election_slug, step=next_step)
+    if not snapshot.candidates or not accumulator.steps():
+        return redirect('medianaranja1', username=username, election_slug=election_slug)
+
+    scores_and_candidates = accumulator.rank(ScoreMatrix(snapshot))
+    if not accumulator.recorded:
+        save_medianaranja_visit(election, snapshot, accumulator.answers, accumulator.importances, scores_and_candidates)
+        accumulator.recorded = True
+        request.session[medianaranja_session_key(election)] = accumulator
+
+    context = {'election':election, 'categories':snapshot.categories,
+               'winner':scores_and_candidates[0], 'others':scores_and_candidates[1:],
+               'crowd':crowd_comparison(snapshot, scores_and_candidates[0])}
+    return render_to_response('medianaranja2.html', context, context_instance = RequestContext(request))
+
+def medianaranja2(request, answer_ids, importances, snapshot, election):
+    scores_and_candidates = rank_candidates(snapshot, answer_ids, importances)
+    save_medianaranja_visit(election, snapshot, answer_ids, importances, scores_and_candidates)
 
     winner = scores_and_candidates[0]
     other_candidates = scores_and_candidates[1:]
-    
-
-
-    
 
-    context = {'election':election, 'categories':categories,'winner':winner,'others':other_candidates}
+    context = {'election':election, 'categories':snapshot.categories,'winner':winner,'others':other_candidates,
+               'crowd':crowd_comparison(snapshot, winner)}
     return context
+
+def save_medianaranja_visit(election, snapshot, answer_ids, importances, scores_and_candidates):
+    sample = sample_visit(election.pk, version=snapshot.version)
+    if sample is None:
+        return
+    election_url=reverse("election_detail",kwargs={'username': election.owner.username, 'slug':election.slug})
+    #save answers for latter analysis:
+    record = visit_record(election, election_url, snapshot, answer_ids, importances, scores_and_candidates)
+    record.update(sample)
+    record_visit(record)
@@ -8,16 +8,120 @@ And call dumpdata as follows::
 
     ./manage.py dumpdata --format=json-pretty <app_name>
 
+The serializer writes every object to the stream as soon as it is
+serialized, and the deserializer reads the stream a chunk at a time and
+yields every object as soon as it is read, so neither holds the whole
+fixture in memory. dumpdata still collects every object and the output
+before writing it: ``./manage.py dump_fixture <app_name>`` takes the same
+arguments and streams from the database to the output.
 """
 
 import codecs
+import re
+from StringIO import StringIO
+
 from django.utils import simplejson
+from django.core.serializers.base import DeserializationError
 from django.core.serializers.json import Serializer as JSONSerializer
-from django.core.serializers.json import Deserializer
 from django.core.serializers.json import DjangoJSONEncoder
+from django.core.serializers.python import Deserializer as PythonDeserializer
+
+READ_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r'\s*')
+
 
 class Serializer(JSONSerializer):
+    def start_serialization(self):
+        super(Serializer, self).start_serialization()
+        self.writer = codecs.getwriter('utf8')(self.stream)
+        self.written = 0
+        self.writer.write(u'[')
+
+    def end_object(self, obj):
+        super(Serializer, self).end_object(obj)
+        text = simplejson.dumps(self.objects.pop(), cls=DjangoJSONEncoder,
+                                ensure_ascii=False, **self.options)
+        indent = self.options.get('indent')
+        if indent is None:
+            separator = self.written and u', ' or u''
+        else:
+            # Objects are items of the list, one level deeper.
+            separator = (self.written and u',' or u'') + u'\n' + u' ' * indent
+            text = text.replace(u'\n', u'\n' + u' ' * indent)
+        self.writer.write(separator)
+        self.writer.write(text)
+        self.written += 1
+
     def end_serialization(self):
-        stream = codecs.getwriter('utf8')(self.stream)
-        simplejson.dump(self.objects, stream, cls=DjangoJSONEncoder,
-                        ensure_ascii=False, **self.options)
+        if self.written and self.options.get('indent') is not None:
+            self.writer.write(u'\n')
+        self.writer.write(u']')
+
+
+def json_list_items(stream, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yields the items of the JSON list in ``stream``, one at a time.
+    """
+    decoder = simplejson.JSONDecoder()
+    state = {'buffer': u'', 'position': 0}
+
+    def read():
+        chunk = stream.read(chunk_size)
+        state['buffer'] = state['buffer'][state['position']:] + chunk
+        state['position'] = 0
+        return bool(chunk)
+
+    def next_character(expected=None):
+        # Skips whitespace and returns the next character, reading as needed.
+        while True:
+            state['position'] = WHITESPACE.match(state['buffer'], state['position']).end()
+            if state['position'] < len(state['buffer']):
+                return state['buffer'][state['position']]
+            if not read():
+                if expected is None:
+                    return None
+                raise DeserializationError('Expected %r at the end of the fixture' % expected)
+
+    if next_character('[') != u'[':
+        raise DeserializationError('A fixture must be a JSON list')
+    state['position'] += 1
+    first = True
+    while True:
+        character = next_character(']')
+        if character == u']':
+            state['position'] += 1
+            break
+        if not first:
+            if character != u',':
+                raise DeserializationError('Expected , or ] in the fixture, found %r' % character)
+            state['position'] += 1
+            next_character('an object')
+        while True:
+            try:
+                item, state['position'] = decoder.raw_decode(state['buffer'], state['position'])
+                break
+            except ValueError as error:
+                # The item may be cut at the end of the buffer.
+                if not read():
+                    raise DeserializationError(str(error))
+        first = False
+        yield item
+    if next_character() is not None:
+        raise DeserializationError('Unexpected data after the end of the fixture')
+
+
+def Deserializer(stream_or_string, **options):
+    """
+    Deserialize a stream or string of JSON data, an object at a time.
+    """
+    chunk_size = options.pop('chunk_size', READ_CHUNK_SIZE)
+    if isinstance(stream_or_string, unicode):
+        stream = StringIO(stream_or_string)
+    else:
+        if isinstance(stream_or_string, str):
+            stream_or_string = StringIO(stream_or_string)
+        stream = codecs.getreader('utf8')(stream_or_string)
+    for item in json_list_items(stream, chunk_size):
+        for obj in PythonDeserializer([item], **options):
+            yield obj
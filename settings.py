@@ -234,6 +234,45 @@ GOOGLE_ANALYTICS_ACCOUNT_ID = "GOOGLE ANALYTICS ACCOUNT ID"
 
 EMBEDED_TEST_WEB = 'http://localhost:8000/admin/cei-2012/embeded'
 
+#MEDIA NARANJA
+
+# Seconds a compiled election quiz stays in the cache. Snapshots are also
+# dropped as soon as the election's questions or candidates change.
+MEDIANARANJA_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Cache alias and seconds for media naranja rankings, keyed by the submitted
+# answers. Point it to a dedicated alias in CACHES to bound its size.
+MEDIANARANJA_RESULT_CACHE = 'default'
+MEDIANARANJA_RESULT_CACHE_TIMEOUT = 60 * 60
+
+# Visitor analytics are written in batches by a background thread when
+# buffered; otherwise each result page writes its own visit. Keep it off with
+# in-memory test databases, which other threads can't see.
+MEDIANARANJA_ANALYTICS_BUFFERED = False
+MEDIANARANJA_ANALYTICS_QUEUE_SIZE = 10000
+MEDIANARANJA_ANALYTICS_BATCH_SIZE = 500
+MEDIANARANJA_ANALYTICS_FLUSH_INTERVAL = 1.0
+
+# 'rows' stores every answer and score of a visitor as its own row, 'packed'
+# stores the visitor as one PackedVisitor row (see compact_visitor_analytics).
+MEDIANARANJA_ANALYTICS_STORAGE = 'rows'
+
+# Share of the media naranja visitors stored in full and share of them
+# counted in the rollups, for every election. None leaves it to each
+# election's AnalyticsSampling, which stores everyone by default.
+MEDIANARANJA_ANALYTICS_SAMPLE_RATE = None
+MEDIANARANJA_ANALYTICS_ROLLUP_RATE = None
+
+# Days media naranja visitors are kept before archive_visitor_analytics moves
+# them to MEDIANARANJA_ANALYTICS_ARCHIVE_ROOT, unless their election has its
+# own AnalyticsRetention. None keeps them forever.
+MEDIANARANJA_ANALYTICS_RETENTION_DAYS = None
+MEDIANARANJA_ANALYTICS_ARCHIVE_ROOT = os.path.join(PROJECT_ROOT, 'analytics_archive')
+
+# DATABASES alias of the visitor analytics when
+# 'elections.routers.AnalyticsRouter' is in DATABASE_ROUTERS.
+MEDIANARANJA_ANALYTICS_DATABASE = 'analytics'
+
 try:
     from local_settings import *
 except ImportError: